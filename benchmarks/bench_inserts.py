@@ -0,0 +1,344 @@
+# Copyright 2018 3YOURMIND GmbH
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Insert throughput with defaults from Python versus defaults from the database.
+
+Rows are inserted into ``dadv.TestHappyPath`` of a test database created and
+migrated like the test runner does, so its columns have the defaults of the
+``AddDefaultValue`` operations. Every method, ``save()``, ``bulk_create``, a
+multi-row ``INSERT`` and ``COPY`` (PostgreSQL only), runs once sending the
+defaults computed in Python and once leaving those columns out for the
+database to fill in. Only the ``name`` of the rows is given. Every run
+reports the rows per second, the bytes of SQL and ``COPY`` data sent and the
+CPU time of the Python process, the best of ``--repeat`` runs::
+
+    cd test_project
+    DJANGO_SETTINGS_MODULE=test_project.settings_pgsql \\
+        python ../benchmarks/bench_inserts.py [--rows 10000]
+
+The ORM sends every field, so without the defaults ``save()`` and
+``bulk_create`` are measured through the ``QuerySet._insert`` they are built
+on, with the columns left out. The multi-row ``INSERT`` and ``COPY`` use a
+:class:`~django_add_default_value.bulk.BulkLoader`.
+"""
+
+from __future__ import print_function, unicode_literals
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "test_project"))
+# The settings of the test project only install the dadv app with it
+os.environ.setdefault("ADD_TEST_APP", "1")
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "test_project.settings_pgsql")
+
+import django  # noqa: E402
+from django.apps import apps  # noqa: E402
+from django.db import DEFAULT_DB_ALIAS, connections  # noqa: E402
+from django.db.models import DEFERRED, AutoField  # noqa: E402
+
+from django_add_default_value import bulk  # noqa: E402
+from django_add_default_value.dialects import get_dialect  # noqa: E402
+from django_add_default_value.utils import batches  # noqa: E402
+
+APP_LABEL = "dadv"
+MODEL_NAME = "TestHappyPath"
+DEFAULT_ROWS = 10000
+
+
+class ByteCounter(object):
+    """
+    Counts the bytes of the statements and the ``COPY`` data sent through a
+    connection. Install it with ``connection.execute_wrapper()`` and
+    :meth:`counting_copy`.
+    """
+
+    def __init__(self):
+        self.sent = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        result = execute(sql, params, many, context)
+        self.sent += statement_size(context["cursor"], sql, params)
+        return result
+
+    @contextmanager
+    def counting_copy(self):
+        counter = self
+
+        class CountingCopyStream(bulk.CopyStream):
+            def read(self, size=-1):
+                data = super(CountingCopyStream, self).read(size)
+                counter.sent += len(data.encode("utf-8"))
+                return data
+
+        with mock.patch.object(bulk, "CopyStream", CountingCopyStream):
+            yield
+
+
+def statement_size(cursor, sql, params):
+    """
+    :return: The bytes of the last statement ``cursor`` executed
+    """
+    while hasattr(cursor, "cursor"):
+        cursor = cursor.cursor
+    # psycopg2 and mysqlclient fill in the parameters on the client and keep
+    # the statement they sent
+    sent = getattr(cursor, "query", None) or getattr(cursor, "_executed", None)
+    if sent:
+        return len(sent)
+    # Others send the parameters apart, count them as text
+    return len(sql.encode("utf-8")) + sum(
+        len("{}".format(param).encode("utf-8")) for param in params or ()
+    )
+
+
+class Workload(object):
+    """
+    The rows to insert and the fields to send them with, once with every
+    default and once without those the database has.
+    """
+
+    def __init__(self, model, rows, using, batch_size):
+        self.model = model
+        self.names = ["Row {number}".format(number=number) for number in range(rows)]
+        self.using = using
+        self.batch_size = batch_size
+        self.connection = connections[using]
+
+        database_defaults = bulk.database_default_fields(
+            model, get_dialect(self.connection)
+        )
+        fields = [
+            field
+            for field in model._meta.local_concrete_fields
+            if not isinstance(field, AutoField)
+        ]
+        self.fields = {
+            "python": fields,
+            "database": [
+                field
+                for field in fields
+                if field.name == "name" or field not in database_defaults
+            ],
+        }
+        self.deferred = {
+            field.attname: DEFERRED
+            for field in fields
+            if field not in self.fields["database"]
+        }
+
+    def instances(self, defaults):
+        """
+        :return: A new instance per row, with the Python defaults only when
+                 they are sent
+        """
+        extra = self.deferred if defaults == "database" else {}
+        return (self.model(name=name, **extra) for name in self.names)
+
+    def loader(self, defaults):
+        return bulk.BulkLoader(
+            self.model,
+            using=self.using,
+            fields=[field.name for field in self.fields[defaults]],
+            batch_size=self.batch_size,
+        )
+
+    def values(self, loader):
+        return (loader.row_values({"name": name}) for name in self.names)
+
+
+def save(workload, defaults):
+    if defaults == "python":
+        for instance in workload.instances(defaults):
+            instance.save(using=workload.using)
+        return
+    manager = workload.model._base_manager
+    for instance in workload.instances(defaults):
+        manager._insert(
+            [instance], fields=workload.fields[defaults], using=workload.using
+        )
+
+
+def bulk_create(workload, defaults):
+    manager = workload.model._base_manager
+    if defaults == "python":
+        manager.using(workload.using).bulk_create(
+            workload.instances(defaults), batch_size=workload.batch_size
+        )
+        return
+    fields = workload.fields[defaults]
+    batch_size = max(
+        min(
+            workload.batch_size,
+            workload.connection.ops.bulk_batch_size(fields, workload.names),
+        ),
+        1,
+    )
+    for batch in batches(workload.instances(defaults), batch_size):
+        manager._insert(batch, fields=fields, using=workload.using)
+
+
+def insert(workload, defaults):
+    loader = workload.loader(defaults)
+    loader.insert(workload.values(loader))
+
+
+def copy(workload, defaults):
+    loader = workload.loader(defaults)
+    loader.copy(workload.values(loader))
+
+
+def methods(connection):
+    selected = [("save", save), ("bulk_create", bulk_create), ("insert", insert)]
+    dialect = get_dialect(connection)
+    if dialect is not None and dialect.supports_copy:
+        selected.append(("copy", copy))
+    return selected
+
+
+def empty_table(workload):
+    connection = workload.connection
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "DELETE FROM {table}".format(
+                table=connection.ops.quote_name(workload.model._meta.db_table)
+            )
+        )
+
+
+def measure_once(method, workload, defaults):
+    """
+    :return: The seconds, the CPU seconds of this process and the bytes sent
+             to insert the rows of ``workload`` once with ``method``
+    """
+    empty_table(workload)
+    counter = ByteCounter()
+    gc.collect()
+    with workload.connection.execute_wrapper(counter), counter.counting_copy():
+        cpu_start = time.process_time()
+        start = time.perf_counter()
+        method(workload, defaults)
+        seconds = time.perf_counter() - start
+        cpu_seconds = time.process_time() - cpu_start
+
+    inserted = workload.model._base_manager.using(workload.using).count()
+    if inserted != len(workload.names):
+        raise AssertionError(
+            "Inserted {inserted} rows instead of {rows}".format(
+                inserted=inserted, rows=len(workload.names)
+            )
+        )
+    return seconds, cpu_seconds, counter.sent
+
+
+def measure(method, workload, defaults, repeat):
+    """
+    :return: The best time and CPU time of ``repeat`` runs, and the bytes
+             sent by one
+    """
+    runs = [measure_once(method, workload, defaults) for __ in range(repeat)]
+    return (
+        min(seconds for seconds, __, __ in runs),
+        min(cpu_seconds for __, cpu_seconds, __ in runs),
+        runs[0][2],
+    )
+
+
+def run(workload, repeat, report=print):
+    results = OrderedDict()
+    for name, method in methods(workload.connection):
+        results[name] = method_results = OrderedDict()
+        for defaults in ("python", "database"):
+            seconds, cpu_seconds, sent = measure(method, workload, defaults, repeat)
+            method_results[defaults] = {
+                "rows_per_second": len(workload.names) / seconds,
+                "bytes_sent": sent,
+                "cpu_seconds": cpu_seconds,
+            }
+            report(name, defaults, method_results[defaults])
+    return results
+
+
+def print_result(method, defaults, result):
+    print(
+        "{method:<12} {defaults:<9} {rate:>12.0f} rows/s {mib:>10.2f} MiB sent "
+        "{cpu:>10.2f} ms CPU".format(
+            method=method,
+            defaults=defaults,
+            rate=result["rows_per_second"],
+            mib=result["bytes_sent"] / 1024.0 / 1024.0,
+            cpu=result["cpu_seconds"] * 1000,
+        )
+    )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--rows", type=int, default=DEFAULT_ROWS, help="Rows to insert per run."
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Runs to take the best time of."
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1000,
+        help="Rows per statement of bulk_create and the multi-row INSERT.",
+    )
+    parser.add_argument(
+        "--database",
+        default=DEFAULT_DB_ALIAS,
+        help="The alias of the database to create the test database for.",
+    )
+    parser.add_argument(
+        "--keepdb",
+        action="store_true",
+        help="Keep the test database between runs of the script.",
+    )
+    parser.add_argument("--json", help="Also write the results to this file.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    django.setup()
+    model = apps.get_model(APP_LABEL, MODEL_NAME)
+
+    creation = connections[options.database].creation
+    old_name = creation.create_test_db(
+        verbosity=0, autoclobber=True, keepdb=options.keepdb
+    )
+    try:
+        workload = Workload(model, options.rows, options.database, options.batch_size)
+        results = run(workload, options.repeat, report=print_result)
+    finally:
+        creation.destroy_test_db(old_name, verbosity=0, keepdb=options.keepdb)
+
+    if options.json:
+        with open(options.json, "w") as output:
+            json.dump(results, output, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,515 @@
+# Copyright 2018 3YOURMIND GmbH
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Micro-benchmarks for the overhead of the default value operations.
+
+Synthetic migration graphs with 1k to 50k ``AddDefaultValue`` operations are
+built in memory, and the operations are rendered and applied with stand-in
+dialects and connections for every vendor, so no database is needed. Every
+phase reports the best time of ``--repeat`` runs and the peak memory
+allocated by one more run, and is compared with the stored baseline::
+
+    python benchmarks/bench_operations.py [--sizes 1000,10000,50000]
+    python benchmarks/bench_operations.py --save-baseline
+
+Timings depend on the machine, so they are compared relative to a fixed
+calibration loop that is timed along with every run: a machine twice as slow
+as the one that saved the baseline is allowed twice the time. The script
+exits with status 1 when a phase got slower or needs more memory than the
+baseline allows. Save a baseline of your own before changing the code when
+the comparison is still too noisy on your machine.
+"""
+
+from __future__ import print_function, unicode_literals
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+import warnings
+from collections import OrderedDict
+from datetime import date
+
+import django
+from django.conf import settings
+from django.db import models
+from django.db.migrations import CreateModel, Migration
+from django.db.migrations.graph import MigrationGraph
+from django.db.migrations.state import ProjectState
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from django_add_default_value import AddDefaultValue  # noqa: E402
+from django_add_default_value.dialects import (  # noqa: E402
+    NOW,
+    TODAY,
+    CockroachDBDialect,
+    MSSQLDialect,
+    MySQLDialect,
+    PostgreSQLDialect,
+    SQLiteDialect,
+    reset_dialects,
+)
+
+APP_LABEL = "bench"
+TABLES = 100
+OPERATIONS_PER_MIGRATION = 100
+DEFAULT_SIZES = (1000, 10000, 50000)
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+# Differences below this are noise, whatever the tolerance
+NOISE_SECONDS = 0.005
+NOISE_BYTES = 64 * 1024
+CALIBRATION_LOOPS = 200000
+
+FIELDS = [
+    ("name", models.CharField(max_length=50), "n/a"),
+    ("description", models.TextField(), "No description provided"),
+    ("count", models.IntegerField(), 0),
+    ("active", models.BooleanField(), True),
+    ("born", models.DateField(), date(1970, 1, 1)),
+    ("created", models.DateTimeField(), NOW),
+    ("day", models.DateField(), TODAY),
+    ("ratio", models.FloatField(), 0.5),
+]
+
+# Stand-ins for the connections, resolved the way get_dialect() would
+DIALECTS = OrderedDict(
+    [
+        ("postgresql", PostgreSQLDialect((13, 0))),
+        ("cockroachdb", CockroachDBDialect()),
+        ("mysql", MySQLDialect((8, 0, 34))),
+        ("mariadb", MySQLDialect((10, 6, 12), is_mariadb=True)),
+        ("mssql", MSSQLDialect()),
+        ("sqlite", SQLiteDialect((3, 40, 0))),
+    ]
+)
+
+# The attributes get_dialect() probes to resolve the same dialects
+CONNECTIONS = OrderedDict(
+    [
+        ("postgresql", {"vendor": "postgresql", "pg_version": 130000}),
+        ("cockroachdb", {"vendor": "cockroachdb"}),
+        (
+            "mysql",
+            {"vendor": "mysql", "mysql_version": (8, 0, 34), "mysql_is_mariadb": False},
+        ),
+        (
+            "mariadb",
+            {"vendor": "mysql", "mysql_version": (10, 6, 12), "mysql_is_mariadb": True},
+        ),
+        ("mssql", {"vendor": "microsoft"}),
+        ("sqlite", {"vendor": "sqlite"}),
+    ]
+)
+
+
+class StandInConnection(object):
+    """
+    Just enough of a connection for the operations to apply their defaults.
+    Its alias is configured, so the routers can be asked about it, but it
+    never connects.
+    """
+
+    in_atomic_block = False
+
+    def __init__(self, alias, vendor, **attributes):
+        self.alias = alias
+        self.vendor = vendor
+        self.__dict__.update(attributes)
+
+
+class StandInSchemaEditor(object):
+    """
+    Counts the statements instead of executing them. Like the schema editors
+    of the backends of this package, it takes the table rebuilds of SQLite to
+    do them once per migration.
+    """
+
+    collect_sql = False
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.statements = 0
+
+    def execute(self, sql, params=()):
+        self.statements += 1
+
+    def set_column_defaults(self, model, column_defaults):
+        self.statements += 1
+
+
+def model_name(table):
+    return "Table{table}".format(table=table)
+
+
+def synthetic_operations(size):
+    """
+    :return: ``size`` operations, setting the defaults of all fields of all
+             tables over and over
+    """
+    operations = []
+    for index in range(size):
+        table, field = divmod(index, len(FIELDS))
+        name, __, value = FIELDS[field]
+        operations.append(
+            AddDefaultValue(
+                model_name=model_name(table % TABLES), name=name, value=value
+            )
+        )
+    return operations
+
+
+def create_models():
+    return [
+        CreateModel(
+            name=model_name(table),
+            fields=[("id", models.AutoField(primary_key=True))]
+            + [(name, field.clone()) for name, field, __ in FIELDS],
+        )
+        for table in range(TABLES)
+    ]
+
+
+def synthetic_graph(operations):
+    """
+    :return: A graph of one migration creating the tables, followed by a
+             chain of migrations holding ``operations``, and its leaf node
+    """
+    initial = Migration("0001_initial", APP_LABEL)
+    initial.operations = create_models()
+    migrations = [initial]
+    for start in range(0, len(operations), OPERATIONS_PER_MIGRATION):
+        migration = Migration(
+            "{number:04d}_defaults".format(number=len(migrations) + 1), APP_LABEL
+        )
+        end = start + OPERATIONS_PER_MIGRATION
+        migration.operations = operations[start:end]
+        migrations.append(migration)
+
+    graph = MigrationGraph()
+    previous = None
+    for migration in migrations:
+        key = (APP_LABEL, migration.name)
+        graph.add_node(key, migration)
+        if previous is not None:
+            graph.add_dependency(migration, key, previous)
+        previous = key
+    return graph, previous
+
+
+def render_state():
+    """
+    :return: The state with the tables, with its models rendered
+    """
+    state = ProjectState()
+    for operation in create_models():
+        operation.state_forwards(APP_LABEL, state)
+    state.apps
+    return state
+
+
+class Workload(object):
+    """
+    The operations of one size and the models they apply to, built before
+    the phases that only use them are timed.
+    """
+
+    def __init__(self, size, state):
+        self.size = size
+        self.operations = synthetic_operations(size)
+        self.state = state
+        self.models = {
+            model_name(table).lower(): state.apps.get_model(
+                APP_LABEL, model_name(table)
+            )
+            for table in range(TABLES)
+        }
+
+
+def construct(workload):
+    synthetic_operations(workload.size)
+
+
+def deconstruct(workload):
+    for operation in workload.operations:
+        operation.deconstruct()
+
+
+def fresh_operations(workload):
+    # Like a new loader, which imports the migrations again, the state is
+    # built from operations that never built one before
+    return synthetic_operations(workload.size)
+
+
+def load_graph(operations):
+    graph, leaf = synthetic_graph(operations)
+    graph.make_state(leaf, real_apps=[])
+
+
+def describe(workload):
+    for operation in workload.operations:
+        operation.describe()
+
+
+def clean_value(dialect):
+    def clean_values(workload):
+        for operation in workload.operations:
+            for __, value in operation.get_defaults():
+                dialect.clean_value(value)
+
+    return clean_values
+
+
+def render_sql(dialect):
+    def render(workload):
+        for operation in workload.operations:
+            model = workload.models[operation.model_name.lower()]
+            defaults = operation.applicable_defaults(model, dialect)
+            if defaults:
+                operation.forwards_sql(dialect, model, defaults)
+
+    return render
+
+
+def apply(alias):
+    def apply_defaults(workload):
+        schema_editor = StandInSchemaEditor(
+            StandInConnection(alias, **CONNECTIONS[alias])
+        )
+        with warnings.catch_warnings():
+            # The defaults some vendors can't have are warned about each time
+            warnings.simplefilter("ignore")
+            for operation in workload.operations:
+                operation.database_forwards(
+                    APP_LABEL, schema_editor, workload.state, workload.state
+                )
+
+    return apply_defaults
+
+
+def phases():
+    """
+    :return: ``(name, phase, prepare)`` 3-tuples. ``prepare`` builds what a
+             run of ``phase`` gets instead of the workload, outside of the
+             timing, or is None.
+    """
+    selected = [
+        ("construct", construct, None),
+        ("deconstruct", deconstruct, None),
+        ("load_graph", load_graph, fresh_operations),
+        ("describe", describe, None),
+    ]
+    for vendor, dialect in DIALECTS.items():
+        selected.append(
+            ("clean_value[{vendor}]".format(vendor=vendor), clean_value(dialect), None)
+        )
+    for vendor, dialect in DIALECTS.items():
+        selected.append(
+            ("render_sql[{vendor}]".format(vendor=vendor), render_sql(dialect), None)
+        )
+    for vendor in CONNECTIONS:
+        selected.append(("apply[{vendor}]".format(vendor=vendor), apply(vendor), None))
+    return selected
+
+
+def measure(phase, workload, repeat, prepare=None):
+    """
+    :return: The best time of ``repeat`` runs in seconds and the peak memory
+             allocated by one more, traced run in bytes
+    """
+    timings = []
+    for __ in range(repeat):
+        subject = workload if prepare is None else prepare(workload)
+        gc.collect()
+        start = time.perf_counter()
+        phase(subject)
+        timings.append(time.perf_counter() - start)
+
+    subject = workload if prepare is None else prepare(workload)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        phase(subject)
+        __, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(timings), peak
+
+
+def calibrate(repeat):
+    """
+    Time a fixed loop of the dict lookups, attribute access and formatting
+    the phases are made of, to tell how fast this machine is right now.
+
+    :return: The best time of ``repeat`` runs in seconds
+    """
+    timings = []
+    for __ in range(repeat):
+        names = {}
+        start = time.perf_counter()
+        for index in range(CALIBRATION_LOOPS):
+            key = index % TABLES
+            names[key] = "{name}_{index}".format(name=names.get(key, ""), index=key)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(sizes, repeat, report=print):
+    """
+    :return: The time of the calibration loop and the results of every phase
+             per size
+    """
+    state = render_state()
+    calibration = calibrate(repeat)
+    results = OrderedDict()
+    for size in sizes:
+        workload = Workload(size, state)
+        results[str(size)] = size_results = OrderedDict()
+        for name, phase, prepare in phases():
+            seconds, peak = measure(phase, workload, repeat, prepare)
+            size_results[name] = {"seconds": seconds, "peak_bytes": peak}
+            report(size, name, seconds, peak)
+    # Later phases can be slowed down by something else running, too
+    calibration = min(calibration, calibrate(repeat))
+    return OrderedDict([("calibration_seconds", calibration), ("sizes", results)])
+
+
+def regressions(results, baseline, tolerance):
+    """
+    :return: A description of every phase that is slower or allocates more
+             than ``tolerance`` (a fraction) over its baseline. The times of
+             the baseline are scaled by how much slower this machine runs
+             the calibration loop.
+    """
+    speed = results["calibration_seconds"] / baseline["calibration_seconds"]
+    found = []
+    for size, size_results in results["sizes"].items():
+        for name, result in size_results.items():
+            expected = baseline["sizes"].get(size, {}).get(name)
+            if expected is not None:
+                expected = dict(expected, seconds=expected["seconds"] * speed)
+                found.extend(
+                    "{name} ({size} operations): {regression}".format(
+                        name=name, size=size, regression=regression
+                    )
+                    for regression in exceeded(result, expected, tolerance)
+                )
+    return found
+
+
+def exceeded(result, expected, tolerance):
+    for metric, noise in (("seconds", NOISE_SECONDS), ("peak_bytes", NOISE_BYTES)):
+        limit = max(expected[metric] * (1 + tolerance), expected[metric] + noise)
+        if result[metric] > limit:
+            yield "{metric} {actual:.4g} > {expected:.4g}".format(
+                metric=metric, actual=result[metric], expected=expected[metric]
+            )
+
+
+def print_result(size, name, seconds, peak):
+    print(
+        "{size:>7} {name:<24} {ms:>10.2f} ms {us:>8.2f} us/op {mib:>8.2f} MiB".format(
+            size=size,
+            name=name,
+            ms=seconds * 1000,
+            us=seconds * 1e6 / size,
+            mib=peak / 1024.0 / 1024.0,
+        )
+    )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        type=lambda sizes: [int(size) for size in sizes.split(",")],
+        default=list(DEFAULT_SIZES),
+        help="Comma separated numbers of operations per graph.",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Runs to take the best time of."
+    )
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Store the results as the new baseline instead of comparing.",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.5,
+        help="How much slower or bigger than the baseline a phase may get, "
+        "as a fraction.",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    if not settings.configured:
+        # The stand-in connections use these aliases, nothing connects to them
+        databases = {
+            alias: {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"}
+            for alias in ["default"] + list(CONNECTIONS)
+        }
+        settings.configure(INSTALLED_APPS=[], USE_TZ=True, DATABASES=databases)
+    django.setup()
+    reset_dialects()
+
+    results = run(options.sizes, options.repeat, report=print_result)
+    if options.save_baseline:
+        with open(options.baseline, "w") as baseline:
+            json.dump(results, baseline, indent=2)
+        print("Baseline saved to {path}".format(path=options.baseline))
+        return 0
+
+    return compare(results, options.baseline, options.tolerance)
+
+
+def compare(results, path, tolerance):
+    """
+    :return: The exit status, 1 if a phase regressed against the baseline at
+             ``path``
+    """
+    if not os.path.exists(path):
+        print("No baseline at {path}, nothing to compare".format(path=path))
+        return 0
+
+    with open(path) as baseline_file:
+        baseline = json.load(baseline_file)
+    if "calibration_seconds" not in baseline:
+        print(
+            "The baseline at {path} has no calibration, save a new one with "
+            "--save-baseline".format(path=path)
+        )
+        return 0
+
+    print(
+        "Calibration {seconds:.2f} ms, {speed:.2f}x the time of the "
+        "baseline".format(
+            seconds=results["calibration_seconds"] * 1000,
+            speed=results["calibration_seconds"] / baseline["calibration_seconds"],
+        )
+    )
+    found = regressions(results, baseline, tolerance)
+    for regression in found:
+        print("REGRESSION: {regression}".format(regression=regression))
+    return 1 if found else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -12,4 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import django
+
 from .add_default_value import *  # noqa
+
+# Django 3.2 finds the only AppConfig of apps.py by itself
+if django.VERSION < (3, 2):
+    default_app_config = "django_add_default_value.apps.AddDefaultValueConfig"
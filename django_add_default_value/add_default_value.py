@@ -11,18 +11,64 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 from __future__ import unicode_literals
+import logging
+import random
+import time
 import warnings
+from collections import OrderedDict
 
-import django
+from django.conf import settings
 from django.db.migrations.operations.base import Operation
-from django.db import models
-from datetime import date, datetime
-from django.utils import timezone
-
-NOW = "__NOW__"
-TODAY = "__TODAY__"
-START = 0
-END = 1
+from django.db.migrations.operations.fields import AddField, RemoveField
+from django.db.migrations.operations.models import DeleteModel
+from django.db import models, transaction
+from django.db.utils import OperationalError
+
+from .catalog import child_tables, get_loaded_snapshot, get_snapshot, recording
+from .compat import DeprecatedVendorHelpers, as_dialect
+from .dialects import NO_QUOTES, NOW, REWRITE, TODAY, get_dialect  # noqa: F401
+from .functions import (  # noqa: F401
+    check_value,
+    format_value,
+    get_function,
+    register_function,
+)
+from .instrumentation import DEFERRED, SKIPPED, UNSUPPORTED, report, reporting
+from .plan import CostEstimate, ExpensiveOperationError, count_rows
+from .sqlite import set_column_defaults
+from .state import set_state_defaults, set_state_null
+from .utils import batches
+
+MYSQL_ALGORITHMS = ("INSTANT", "INPLACE")
+MYSQL_LOCKS = ("NONE", "SHARED", "EXCLUSIVE")
+
+# Options every operation takes, with the setting providing their default
+OPTION_SETTINGS = {
+    "algorithm": "DADV_MYSQL_ALGORITHM",
+    "lock": "DADV_MYSQL_LOCK",
+    "lock_timeout": "DADV_LOCK_TIMEOUT",
+    "lock_retries": "DADV_LOCK_RETRIES",
+    "lock_retry_delay": "DADV_LOCK_RETRY_DELAY",
+    "max_rows": "DADV_MAX_ROWS",
+    "force": "DADV_FORCE",
+    "partition_batch_size": "DADV_PARTITION_BATCH_SIZE",
+}
+# SQLSTATE lock_not_available, raised when lock_timeout expires
+LOCK_NOT_AVAILABLE = "55P03"
+MAX_LOCK_RETRY_DELAY = 30.0
+
+logger = logging.getLogger(__name__)
+
+# SQL functions that produce a different value for every row. Adding a column
+# with one of these as default has to rewrite the whole table.
+VOLATILE_FUNCTIONS = {
+    "random()",
+    "clock_timestamp()",
+    "gen_random_uuid()",
+    "uuid_generate_v4()",
+    "uuid()",
+    "newid()",
+}
 
 
 def is_text_field(model, field_name):
@@ -37,357 +83,1188 @@ def is_date_field(model, field_name):
     return isinstance(field, models.DateField)
 
 
-class AddDefaultValue(Operation):
+class AddDefaultValue(DeprecatedVendorHelpers, Operation):
     reversible = True
-    quotes = {
-        "value": ("'", "'"),
-        "constant": ("", ""),
-        "function": ("", ""),
-        "name": ('"', '"'),
-    }
-
-    def __init__(self, model_name, name, value):
+
+    def __init__(
+        self,
+        model_name,
+        name,
+        value,
+        algorithm=None,
+        lock=None,
+        lock_timeout=None,
+        lock_retries=None,
+        lock_retry_delay=None,
+        max_rows=None,
+        force=None,
+        partition_batch_size=None,
+    ):
         self.model_name = model_name
         self.name = name
+        check_value(value)
         self.value = value
+        self.set_options(
+            algorithm=algorithm,
+            lock=lock,
+            lock_timeout=lock_timeout,
+            lock_retries=lock_retries,
+            lock_retry_delay=lock_retry_delay,
+            max_rows=max_rows,
+            force=force,
+            partition_batch_size=partition_batch_size,
+        )
 
     def describe(self):
         """
         Output a brief summary of what the action does.
         """
         return "Add to field {model}.{field} the default value {value}".format(
-            model=self.model_name, field=self.name, value=self.value
+            model=self.model_name, field=self.name, value=format_value(self.value)
         )
 
     def state_forwards(self, app_label, state):
         """
         Take the state from the previous migration, and mutate it
         so that it matches what this migration would perform.
+
+        The fields keep their Python default, the database defaults are
+        recorded next to them, see :mod:`.state`.
         """
-        # Nothing to do
-        # because the field should have the default set anyway
-        pass
+        set_state_defaults(state, app_label, self.model_name, self.get_defaults())
+
+    def get_defaults(self):
+        """
+        Return the ``(field name, value)`` pairs this operation transfers to
+        the database.
+        """
+        return [(self.name, self.value)]
 
     def database_forwards(self, app_label, schema_editor, from_state, to_state):
         """
         Perform the mutation on the database schema in the normal
         (forwards) direction.
         """
-        if not self.is_supported_vendor(schema_editor.connection.vendor):
+        self.apply_defaults(app_label, schema_editor, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        """
+        Perform the mutation on the database schema in the reverse
+        direction - e.g. if this were CreateModel, it would in fact
+        drop the model's table.
+        """
+        self.apply_defaults(app_label, schema_editor, to_state, forwards=False)
+
+    def apply_defaults(self, app_label, schema_editor, state, forwards=True):
+        """
+        Set, or drop when going backwards, the defaults on the model of
+        ``state``, and report the columns that are left alone.
+        """
+        model = state.apps.get_model(app_label, self.model_name)
+        dialect = get_dialect(schema_editor.connection)
+        if dialect is None:
             warnings.warn(
                 "AddDefaultValue cannot be applied on a non-supported vendor."
             )
+            self.report_unapplied(schema_editor, model, [])
             return
 
-        self.initialize_vendor_state(schema_editor)
-
-        to_model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
 
-        if not self.allow_migrate_model(schema_editor.connection.alias, to_model):
+        applicable = self.applicable_defaults(model, dialect, warn=forwards)
+        defaults = self.changed_defaults(schema_editor, model, applicable, forwards)
+        self.report_unapplied(schema_editor, model, applicable, defaults)
+        if not defaults:
             return
 
-        if not self.can_apply_default(to_model, self.name, schema_editor.connection):
-            warnings.warn(
-                "You requested a default for a field / database combination "
-                "that does not allow one. The default will not be set on: "
-                "{model}.{field}.".format(model=to_model.__name__, field=self.name)
-            )
+        self.check_cost(schema_editor, dialect, model)
+        with recording(schema_editor.connection):
+            self.alter_defaults(schema_editor, dialect, model, defaults, forwards)
+        self.record_defaults(schema_editor, model, defaults, forwards)
+
+    def report_unapplied(self, schema_editor, model, applicable, changed=()):
+        """
+        Report the defaults the database cannot have, and those among the
+        ``applicable`` ones that are left out as they didn't change.
+        """
+        applicable_names = set(field.name for field, __ in applicable)
+        changed_names = set(field.name for field, __ in changed)
+        unsupported = [
+            name for name, __ in self.get_defaults() if name not in applicable_names
+        ]
+        report(
+            self,
+            schema_editor,
+            model._meta.db_table,
+            [model._meta.get_field(name).column for name in unsupported],
+            UNSUPPORTED,
+        )
+        report(
+            self,
+            schema_editor,
+            model._meta.db_table,
+            [
+                field.column
+                for field, __ in applicable
+                if field.name not in changed_names
+            ],
+            SKIPPED,
+        )
+
+    def applicable_defaults(self, model, dialect, warn=False):
+        """
+        Resolve the fields of ``model`` this operation can set a default on.
+
+        :param model: The model as found in the migration state
+        :param dialect: The :class:`~.dialects.Dialect` of the database
+        :param warn: Emit a warning for every field that gets skipped
+        :return: A list of ``(field, value)`` 2-tuples
+        """
+        dialect = as_dialect(dialect, "applicable_defaults")
+        defaults = []
+        for name, value in self.get_defaults():
+            if not self.can_apply_default(model, name, dialect):
+                if warn:
+                    warnings.warn(
+                        "You requested a default for a field / database combination "
+                        "that does not allow one. The default will not be set on: "
+                        "{model}.{field}.".format(model=model.__name__, field=name)
+                    )
+                continue
+
+            # Fetch the actual field so we get the column name properly
+            options = model._meta  # type: models.base.Options
+            defaults.append((options.get_field(name), value))
+
+        return defaults
+
+    def alter_defaults(self, schema_editor, dialect, model, defaults, forwards=True):
+        """
+        Set, or drop when going backwards, all ``defaults`` on the table of
+        ``model`` at once. On SQLite this rebuilds the table. Schema editors
+        that collect default changes, like the ones of the backends of this
+        package, get them instead.
+        """
+        table = model._meta.db_table
+        columns = [field.column for field, __ in defaults]
+        if dialect.remakes_table:
+            with reporting(self, schema_editor, table, columns) as event:
+                if hasattr(schema_editor, "set_column_defaults"):
+                    event.status = DEFERRED
+                set_column_defaults(
+                    schema_editor,
+                    model,
+                    {
+                        field.column: (
+                            dialect.render_default(value) if forwards else None
+                        )
+                        for field, value in defaults
+                    },
+                )
             return
 
-        # Fetch the actual field so we get the column name properly
-        options = to_model._meta  # type: models.base.Options
-        field = options.get_field(self.name)
-
-        sql_value, value_quote = self.clean_value(
-            schema_editor.connection.vendor, self.value
-        )
-        format_kwargs = dict(
-            table=to_model._meta.db_table,
-            field=field.get_attname_column()[1],
-            value=sql_value,
-            value_quote_start=value_quote[START],
-            value_quote_end=value_quote[END],
-            name_quote_start=self.quotes["name"][START],
-            name_quote_end=self.quotes["name"][END],
-        )
-        if not self.is_mssql(schema_editor.connection.vendor):
-            sql_query = (
-                "ALTER TABLE {name_quote_start}{table}{name_quote_end} "
-                "ALTER COLUMN {name_quote_start}{field}{name_quote_end} "
-                "SET DEFAULT {value_quote_start}{value}{value_quote_end};".format(
-                    **format_kwargs
+        if hasattr(schema_editor, "set_default_clauses"):
+            with reporting(self, schema_editor, table, columns) as event:
+                event.status = DEFERRED
+                schema_editor.set_default_clauses(
+                    table, self.default_clauses(dialect, defaults, forwards), self
                 )
+            return
+
+        for sql in self.partitioned_sql(
+            schema_editor, dialect, model, defaults, forwards
+        ):
+            with reporting(self, schema_editor, table, columns, sql) as event:
+                event.retry_wait = self.execute(schema_editor, sql)
+
+    def default_clauses(self, dialect, defaults, forwards=True):
+        """
+        :return: The ``ALTER TABLE`` clause setting, or dropping when going
+                 backwards, the default per column of ``defaults``
+        """
+        if forwards:
+            clauses = dialect.set_default_clauses(
+                [(field.column, None, value) for field, value in defaults]
             )
         else:
-            constraint_name = self.mssql_constraint_name()
-            format_kwargs.update(constraint_name=constraint_name)
-            sql_query = (
-                "ALTER TABLE {name_quote_start}{table}{name_quote_end} "
-                "ADD CONSTRAINT {name_quote_start}{constraint_name}{name_quote_end} "
-                "DEFAULT {value_quote_start}{value}{value_quote_end} "
-                "FOR {name_quote_start}{field}{name_quote_end};".format(**format_kwargs)
+            clauses = dialect.drop_default_clauses(
+                [(field.column, None) for field, __ in defaults]
             )
+        return OrderedDict(
+            (field.column, clause) for (field, __), clause in zip(defaults, clauses)
+        )
 
-        schema_editor.execute(sql_query)
-
-    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+    def partitioned_sql(self, schema_editor, dialect, model, defaults, forwards=True):
         """
-        Perform the mutation on the database schema in the reverse
-        direction - e.g. if this were CreateModel, it would in fact
-        drop the model's table.
+        Build the statements changing ``defaults``, to be run one after the
+        other.
+
+        With ``partition_batch_size``, or the ``DADV_PARTITION_BATCH_SIZE``
+        setting, the child tables of a partitioned or inherited table are
+        looked up in the catalog. The parent table is altered alone, then its
+        children in batches of that many tables. Each batch is one transaction
+        and is bounded by ``lock_timeout``, so no transaction locks the whole
+        hierarchy, given the migration isn't atomic.
+
+        :return: A list of SQL strings
         """
-        if not self.is_supported_vendor(schema_editor.connection.vendor):
+        sql = self.defaults_sql(dialect, model._meta.db_table, defaults, forwards)
+        batch_size = self.get_option("partition_batch_size")
+        if batch_size is None:
+            return [sql]
+
+        children = child_tables(schema_editor.connection, dialect, model._meta.db_table)
+        if not children:
+            return [sql]
+
+        if schema_editor.connection.in_atomic_block and not schema_editor.collect_sql:
             warnings.warn(
-                "AddDefaultValue cannot be applied on a non-supported vendor."
+                "{operation} runs in the transaction of its migration, which locks "
+                "all {count} child tables of {table} until it commits. Set "
+                "atomic = False on the migration.".format(
+                    operation=self.describe(),
+                    count=len(children),
+                    table=model._meta.db_table,
+                )
             )
-            return
+        statements = [
+            self.defaults_sql(
+                dialect, model._meta.db_table, defaults, forwards, only=True
+            )
+        ]
+        for batch in batches(children, batch_size):
+            statements.append(
+                "\n".join(
+                    self.defaults_sql(
+                        dialect, table, defaults, forwards, schema=schema, only=True
+                    )
+                    for schema, table in batch
+                )
+            )
+        return statements
 
-        self.initialize_vendor_state(schema_editor)
+    def forwards_sql(self, dialect, model, defaults, schema=None):
+        """
+        Build a single statement setting all ``defaults`` on the table of
+        ``model``, so the table is only locked once.
 
-        to_model = to_state.apps.get_model(app_label, self.model_name)
+        :param schema: The schema of the table, if not the current one
+        """
+        return self.defaults_sql(dialect, model._meta.db_table, defaults, schema=schema)
 
-        if not self.allow_migrate_model(schema_editor.connection.alias, to_model):
-            return
+    def backwards_sql(self, dialect, model, defaults, schema=None):
+        """
+        Build a single statement dropping all ``defaults`` from the table of
+        ``model``.
 
-        if not self.can_apply_default(to_model, self.name, schema_editor.connection):
-            return
+        :param schema: The schema of the table, if not the current one
+        """
+        return self.defaults_sql(
+            dialect, model._meta.db_table, defaults, forwards=False, schema=schema
+        )
 
-        # Fetch the actual field so we get the column name properly
-        options = to_model._meta  # type: models.base.Options
-        field = options.get_field(self.name)
-
-        format_kwargs = dict(
-            table=to_model._meta.db_table,
-            field=field.get_attname_column()[1],
-            name_quote_start=self.quotes["name"][START],
-            name_quote_end=self.quotes["name"][END],
-        )
-        if not self.is_mssql(schema_editor.connection.vendor):
-            sql_query = (
-                "ALTER TABLE {name_quote_start}{table}{name_quote_end} "
-                "ALTER COLUMN {name_quote_start}{field}{name_quote_end} "
-                "DROP DEFAULT;".format(**format_kwargs)
+    def defaults_sql(
+        self, dialect, table, defaults, forwards=True, schema=None, only=False
+    ):
+        """
+        Build a single statement setting, or dropping when going backwards,
+        all ``defaults`` on ``table``.
+
+        :param only: Leave the child tables of ``table`` alone
+        """
+        if not forwards:
+            return dialect.drop_defaults_sql(
+                table,
+                [
+                    (field.column, self.mssql_constraint_name(field.name))
+                    for field, __ in defaults
+                ],
+                self.alter_table_options(dialect),
+                schema=schema,
+                only=only,
             )
-        else:
-            constraint_name = self.mssql_constraint_name()
-            format_kwargs.update(constraint_name=constraint_name)
-            sql_query = (
-                "ALTER TABLE {name_quote_start}{table}{name_quote_end} "
-                "DROP CONSTRAINT {name_quote_start}{constraint_name}{name_quote_end}".format(
-                    **format_kwargs
+
+        return dialect.set_defaults_sql(
+            table,
+            [
+                (field.column, self.mssql_constraint_name(field.name), value)
+                for field, value in defaults
+            ],
+            self.alter_table_options(dialect),
+            schema=schema,
+            only=only,
+        )
+
+    def set_options(self, **options):
+        self.set_mysql_alter_options(options["algorithm"], options["lock"])
+        self.set_lock_timeout_options(
+            options["lock_timeout"],
+            options["lock_retries"],
+            options["lock_retry_delay"],
+        )
+        self.set_cost_options(options["max_rows"], options["force"])
+        self.set_partition_options(options["partition_batch_size"])
+
+    def get_option(self, name, default=None):
+        """
+        Return the option given to the operation, falling back to its setting.
+        """
+        value = getattr(self, name)
+        if value is None:
+            value = getattr(settings, OPTION_SETTINGS[name], default)
+        return value
+
+    def option_kwargs(self):
+        """
+        :return: The options given to the operation, for ``deconstruct()``
+        """
+        return {
+            name: getattr(self, name)
+            for name in sorted(OPTION_SETTINGS)
+            if getattr(self, name) is not None
+        }
+
+    def set_mysql_alter_options(self, algorithm, lock):
+        if algorithm is not None and algorithm.upper() not in MYSQL_ALGORITHMS:
+            raise ValueError(
+                "algorithm must be one of {choices}, not {algorithm!r}.".format(
+                    choices=", ".join(MYSQL_ALGORITHMS), algorithm=algorithm
+                )
+            )
+        if lock is not None and lock.upper() not in MYSQL_LOCKS:
+            raise ValueError(
+                "lock must be one of {choices}, not {lock!r}.".format(
+                    choices=", ".join(MYSQL_LOCKS), lock=lock
                 )
             )
 
-        schema_editor.execute(sql_query)
+        self.algorithm = algorithm
+        self.lock = lock
 
-    def deconstruct(self):
-        return (
-            self.__class__.__name__,
-            [],
-            {"model_name": self.model_name, "name": self.name, "value": self.value},
+    def alter_table_options(self, dialect):
+        """
+        Build the ``ALGORITHM`` and ``LOCK`` clauses for MySQL, taken from the
+        operation or the ``DADV_MYSQL_ALGORITHM`` and ``DADV_MYSQL_LOCK``
+        settings.
+
+        :return: A list of clauses, empty when nothing was requested
+        """
+        return dialect.alter_table_options(
+            self.get_option("algorithm"), self.get_option("lock")
         )
 
-    def initialize_vendor_state(self, schema_editor):
-        self.set_quotes(schema_editor.connection.vendor)
-        major, minor, patch, __, ___ = django.VERSION
-        if (
-            self.is_mysql(schema_editor.connection.vendor)
-            and version_with_broken_quote_value(major, minor, patch)
-            and not hasattr(schema_editor.__class__, "_patched_quote_value")
+    def set_lock_timeout_options(self, lock_timeout, lock_retries, lock_retry_delay):
+        for name, value in (
+            ("lock_timeout", lock_timeout),
+            ("lock_retries", lock_retries),
+            ("lock_retry_delay", lock_retry_delay),
         ):
-            schema_editor.__class__.quote_value = quote_value
-            schema_editor.__class__._patched_quote_value = True
+            if value is not None and value < 0:
+                raise ValueError(
+                    "{name} must not be negative, not {value!r}.".format(
+                        name=name, value=value
+                    )
+                )
+
+        self.lock_timeout = lock_timeout
+        self.lock_retries = lock_retries
+        self.lock_retry_delay = lock_retry_delay
+
+    def set_cost_options(self, max_rows, force):
+        if max_rows is not None and max_rows < 0:
+            raise ValueError(
+                "max_rows must not be negative, not {value!r}.".format(value=max_rows)
+            )
+
+        self.max_rows = max_rows
+        self.force = force
+
+    def set_partition_options(self, partition_batch_size):
+        if partition_batch_size is not None and partition_batch_size < 1:
+            raise ValueError(
+                "partition_batch_size must be positive, not {value!r}.".format(
+                    value=partition_batch_size
+                )
+            )
+
+        self.partition_batch_size = partition_batch_size
+
+    def estimate(self, dialect, model):
+        """
+        Tell how setting the defaults touches the table of ``model``, without
+        counting its rows.
 
-    def set_quotes(self, vendor):
+        :return: A :class:`~.plan.CostEstimate`
         """
-        Set the various quotes according to vendor. The default quotes are set to the
-        default vendor.
+        kind, lock, reason = dialect.set_default_cost(
+            self.get_option("algorithm"), self.get_option("lock")
+        )
+        return CostEstimate(self, model._meta.db_table, kind, lock, reason)
 
-        :param vendor: Connection vendor string as provided by the db backend
+    def check_cost(self, schema_editor, dialect, model):
         """
-        if self.is_default_vendor(vendor):
-            self.quotes["name"] = ('"', '"')
+        Refuse to rewrite more than ``max_rows`` rows, taken from the
+        operation or the ``DADV_MAX_ROWS`` setting, unless ``force`` or the
+        ``DADV_FORCE`` setting is set. The rows are estimated from the
+        statistics of the catalog.
 
-        if self.is_mysql(vendor):
-            self.quotes["name"] = ("`", "`")
+        :raises ExpensiveOperationError: if the operation costs too much
+        """
+        max_rows = self.get_option("max_rows")
+        if max_rows is None or schema_editor.collect_sql or self.get_option("force"):
+            return
 
-        if self.is_mssql(vendor):
-            self.quotes["name"] = ("[", "]")
+        estimate = self.estimate(dialect, model)
+        if estimate.kind != REWRITE:
+            return
 
-    @classmethod
-    def is_supported_vendor(cls, vendor):
-        return (
-            cls.is_postgresql(vendor)
-            or cls.is_mysql(vendor)
-            or cls.is_mssql(vendor)
-            or cls.is_cockroachdb(vendor)
-        )
-
-    @classmethod
-    def is_default_vendor(cls, vendor):
-        return cls.is_postgresql(vendor)
-
-    @classmethod
-    def is_mysql(cls, vendor):
-        return vendor.startswith("mysql")
-
-    @classmethod
-    def is_postgresql(cls, vendor):
-        return vendor.startswith("postgre")
-
-    @classmethod
-    def is_mssql(cls, vendor):
-        return vendor.startswith("microsoft")
-
-    @classmethod
-    def is_cockroachdb(cls, vendor):
-        return vendor.startswith("cockroachdb")
-
-    @classmethod
-    def is_postgresql_syntax_compatible(cls, vendor):
-        return cls.is_postgresql(vendor) or cls.is_cockroachdb(vendor)
-
-    @classmethod
-    def is_mariadb(cls, connection):
-        if hasattr(connection, "mysql_is_mariadb"):
-            if callable(connection.mysql_is_mariadb):
-                return connection.mysql_is_mariadb()
-            else:
-                return connection.mysql_is_mariadb
-        return False
-
-    def can_apply_default(self, model, name, connection):
-        if is_text_field(model, name) and not self.can_have_default_for_text(
-            connection
-        ):
-            return False
+        estimate.rows = count_rows(schema_editor.connection, dialect, estimate.table)
+        if estimate.exceeds(max_rows):
+            raise ExpensiveOperationError(
+                "{operation} would rewrite about {rows} rows, more than the "
+                "{max_rows} allowed ({estimate}). Pass force=True or set "
+                "DADV_FORCE to apply it anyway.".format(
+                    operation=self.describe(),
+                    rows=estimate.rows,
+                    max_rows=max_rows,
+                    estimate=estimate,
+                )
+            )
 
-        if self.value == TODAY and self.is_mysql(connection.vendor):
+    def execute(self, schema_editor, sql, params=()):
+        """
+        Execute ``sql`` on PostgreSQL and CockroachDB with a bounded
+        ``lock_timeout`` when one is configured, so a statement waiting for its
+        lock doesn't queue all other queries on the table behind it. When the
+        timeout expires, the statement is retried with a jittered exponential
+        backoff up to ``lock_retries`` times.
+
+        :return: The seconds spent in attempts that timed out waiting for the
+                 lock, including the backoff between them
+        """
+        lock_timeout = self.get_option("lock_timeout")
+        dialect = get_dialect(schema_editor.connection)
+        if lock_timeout is None or not dialect.supports_lock_timeout:
+            schema_editor.execute(sql, params)
+            return 0.0
+
+        if schema_editor.collect_sql:
+            self.execute_with_lock_timeout(schema_editor, lock_timeout, sql, params)
+            return 0.0
+
+        retries = self.get_option("lock_retries", 0)
+        # Only the attempts that time out are known to have waited for the
+        # lock, the databases don't report the wait of the one that succeeds
+        retry_wait = 0.0
+        for attempt in range(1, retries + 2):
+            started = time.time()
+            if self.attempt_with_lock_timeout(
+                schema_editor, lock_timeout, sql, params, attempt, retries + 1
+            ):
+                return retry_wait
+            retry_wait += time.time() - started
+
+    def attempt_with_lock_timeout(
+        self, schema_editor, lock_timeout, sql, params, attempt, attempts
+    ):
+        """
+        :return: True if the statement got executed, False if it has to be
+                 retried
+        :raises OperationalError: if no lock could be acquired on the last
+                                  attempt, or anything else went wrong
+        """
+        started = time.time()
+        try:
+            with transaction.atomic(using=schema_editor.connection.alias):
+                self.execute_with_lock_timeout(schema_editor, lock_timeout, sql, params)
+        except OperationalError as exc:
+            if not is_lock_timeout(exc) or attempt == attempts:
+                logger.warning(
+                    "Attempt %d/%d of %s failed after %.3fs: %s",
+                    attempt,
+                    attempts,
+                    self.describe(),
+                    time.time() - started,
+                    exc,
+                )
+                raise
+
+            delay = self.lock_retry_backoff(attempt)
+            logger.warning(
+                "Attempt %d/%d of %s timed out after %.3fs waiting for its "
+                "lock, retrying in %.3fs",
+                attempt,
+                attempts,
+                self.describe(),
+                time.time() - started,
+                delay,
+            )
+            time.sleep(delay)
             return False
 
+        logger.info(
+            "Attempt %d/%d of %s succeeded after %.3fs",
+            attempt,
+            attempts,
+            self.describe(),
+            time.time() - started,
+        )
         return True
 
-    @classmethod
-    def can_have_default_for_text(cls, connection):
+    def execute_with_lock_timeout(self, schema_editor, lock_timeout, sql, params):
+        # SET LOCAL lasts until the end of the transaction, so the timeout is
+        # reset for the operations that follow in the same migration.
+        dialect = get_dialect(schema_editor.connection)
+        schema_editor.execute(dialect.lock_timeout_sql(lock_timeout))
+        schema_editor.execute(sql, params)
+        schema_editor.execute(dialect.reset_lock_timeout_sql)
+
+    def lock_retry_backoff(self, attempt):
         """
-        MySQL has not allowed DEFAULT for BLOB and TEXT fields since the
-        beginning of time, but it is changing:
+        :return: A random delay in seconds of up to ``lock_retry_delay``
+                 doubled for every failed attempt ("full jitter")
+        """
+        delay = self.get_option("lock_retry_delay", 1.0) * 2 ** (attempt - 1)
+        return random.uniform(0, min(delay, MAX_LOCK_RETRY_DELAY))
+
+    def changed_defaults(self, schema_editor, model, defaults, forwards=True):
+        """
+        Leave out the defaults the database already has, when the
+        ``DADV_SKIP_UNCHANGED_DEFAULTS`` setting asks for it. This saves the
+        ``ALTER TABLE`` after fake-applied migrations or on a database restored
+        from a dump.
+
+        The current defaults are read from a snapshot of the catalog, which is
+        loaded with one query per ``migrate`` run and forgets the tables other
+        statements change. Collected SQL, as printed by ``sqlmigrate``, always
+        contains every statement.
+        """
+        if schema_editor.collect_sql or not getattr(
+            settings, "DADV_SKIP_UNCHANGED_DEFAULTS", False
+        ):
+            return defaults
+
+        snapshot = get_snapshot(schema_editor.connection)
+        dialect = get_dialect(schema_editor.connection)
+        return [
+            (field, value)
+            for field, value in defaults
+            if not snapshot.has_default(
+                model._meta.db_table,
+                field.column,
+                dialect.render_default(value) if forwards else None,
+            )
+        ]
+
+    def record_defaults(self, schema_editor, model, defaults, forwards=True):
+        """
+        Keep the catalog snapshot, if any, in line with what we executed.
+        """
+        snapshot = get_loaded_snapshot(schema_editor.connection)
+        if snapshot is None or schema_editor.collect_sql:
+            return
+
+        dialect = get_dialect(schema_editor.connection)
+        for field, value in defaults:
+            snapshot.record(
+                model._meta.db_table,
+                field.column,
+                dialect.render_default(value) if forwards else None,
+            )
 
-            Before MariaDB 10.2.1, BLOB and TEXT columns could not be assigned
-            a DEFAULT value. This restriction was lifted in MariaDB 10.2.1.
+    def deconstruct(self):
+        kwargs = {"model_name": self.model_name, "name": self.name, "value": self.value}
+        kwargs.update(self.option_kwargs())
+        return (self.__class__.__name__, [], kwargs)
+
+    def references_model(self, name, app_label=None):
+        return name.lower() == self.model_name.lower()
 
-        Oracle does not yet have a version available that supports it,
-        quoting the `documentation
-        <https://dev.mysql.com/doc/refman/8.0/en/blob.html>`_:
+    def references_field(self, model_name, name, app_label=None):
+        return self.references_model(model_name, app_label) and name.lower() in [
+            field_name.lower() for field_name, __ in self.get_defaults()
+        ]
 
-            BLOB and TEXT columns cannot have DEFAULT values.
+    def reduce(self, operation, *args):
+        """
+        Let the migration optimizer drop defaults that a later operation makes
+        pointless, and optimize across this operation whenever the other
+        operation does not touch any of our fields.
 
-        :param connection: The DB connection, aka `schema_editor.connection`
-        :type connection: django.db.backends.base.base.BaseDatabaseWrapper
-        :return: A boolean indicating we support default values for text
-                 fields.
-        :rtype: bool
+        Django < 2.0 passes the operations in between before the app label,
+        hence the variable arguments.
         """
-        if cls.is_postgresql_syntax_compatible(connection.vendor) or cls.is_mssql(
-            connection.vendor
+        app_label = args[-1] if args else None
+        if isinstance(operation, DeleteModel) and self.references_model(
+            operation.name, app_label
         ):
-            return True
+            return [operation]
 
-        if not hasattr(connection, "mysql_version"):
+        if isinstance(operation, RemoveField) and self.references_field(
+            operation.model_name, operation.name, app_label
+        ):
+            return self.without_defaults([operation.name]) + [operation]
+
+        if sets_defaults_only(operation) and self.references_model(
+            operation.model_name, app_label
+        ):
+            return self.merge_defaults(operation)
+
+        return super(AddDefaultValue, self).reduce(operation, *args) or (
+            not self.is_referenced_by(operation, app_label)
+        )
+
+    def is_referenced_by(self, operation, app_label):
+        return any(
+            operation.references_field(self.model_name, name, app_label)
+            for name, __ in self.get_defaults()
+        )
+
+    def without_defaults(self, names):
+        """
+        Return the operations needed to set our defaults, minus those for the
+        fields in ``names``.
+        """
+        names = [name.lower() for name in names]
+        defaults = [
+            (name, value)
+            for name, value in self.get_defaults()
+            if name.lower() not in names
+        ]
+        if not defaults:
+            return []
+        if defaults == self.get_defaults():
+            return [self]
+        return [
+            AddDefaultValues(
+                model_name=self.model_name, defaults=defaults, **self.option_kwargs()
+            )
+        ]
+
+    def merge_defaults(self, operation):
+        """
+        Fold a later default operation on the same model into one operation,
+        letting the later values win.
+        """
+        names = [name for name, __ in operation.get_defaults()]
+        defaults = self.without_defaults(names)
+        if not defaults:
+            return [operation]
+        kwargs = self.option_kwargs()
+        kwargs.update(operation.option_kwargs())
+        return [
+            AddDefaultValues(
+                model_name=self.model_name,
+                defaults=defaults[0].get_defaults() + operation.get_defaults(),
+                **kwargs
+            )
+        ]
+
+    def can_apply_default(self, model, name, dialect):
+        """
+        :param dialect: The :class:`~.dialects.Dialect` of the database. A
+                        connection still works but is deprecated.
+        """
+        dialect = as_dialect(dialect, "can_apply_default")
+        if is_text_field(model, name) and not dialect.supports_default_for_text:
             return False
 
-        if not cls.is_mariadb(connection):
+        value = dict(self.get_defaults())[name]
+        if value == TODAY and not dialect.supports_today:
             return False
 
-        # noinspection PyUnresolvedReferences
-        try: # see if we need to calculate the version
-            mysql_version = connection.mysql_version()
-        except TypeError: # if it is already calulcated, then it can't be called
-            mysql_version = connection.mysql_version
-        major, minor, patch = mysql_version
-        return major > 9 and minor > 1 and patch > 0
+        return not callable(value) or dialect.function_sql(value) is not None
 
-    def clean_value(self, vendor, value):
+    def mssql_constraint_name(self, name=None):
+        return "DADV_{model}_{field}_DEFAULT".format(
+            model=self.model_name, field=name or self.name
+        )
+
+
+class AddDefaultValues(AddDefaultValue):
+    """
+    Transfer the defaults of several fields of one model to the database.
+
+    All defaults are set with a single ``ALTER TABLE`` statement, so the table
+    is only locked once instead of once per field.
+    """
+
+    def __init__(
+        self,
+        model_name,
+        defaults,
+        algorithm=None,
+        lock=None,
+        lock_timeout=None,
+        lock_retries=None,
+        lock_retry_delay=None,
+        max_rows=None,
+        force=None,
+        partition_batch_size=None,
+    ):
+        self.model_name = model_name
+        self.defaults = [tuple(pair) for pair in defaults]
+        for __, value in self.defaults:
+            check_value(value)
+        self.set_options(
+            algorithm=algorithm,
+            lock=lock,
+            lock_timeout=lock_timeout,
+            lock_retries=lock_retries,
+            lock_retry_delay=lock_retry_delay,
+            max_rows=max_rows,
+            force=force,
+            partition_batch_size=partition_batch_size,
+        )
+
+        names = [name for name, __ in self.defaults]
+        if not names:
+            raise ValueError("AddDefaultValues requires at least one default.")
+        if len(set(names)) != len(names):
+            raise ValueError(
+                "AddDefaultValues received more than one default for the same "
+                "field of {model}.".format(model=model_name)
+            )
+
+    def describe(self):
+        """
+        Output a brief summary of what the action does.
         """
-        Lie, cheat and apply plastic surgery where needed
+        return "Add to fields {fields} of {model} their default values".format(
+            model=self.model_name,
+            fields=", ".join(name for name, __ in self.defaults),
+        )
+
+    def get_defaults(self):
+        return list(self.defaults)
+
+    def deconstruct(self):
+        kwargs = {"model_name": self.model_name, "defaults": list(self.defaults)}
+        kwargs.update(self.option_kwargs())
+        return (self.__class__.__name__, [], kwargs)
+
+
+class AddFieldWithDefault(AddDefaultValue):
+    """
+    Add a field and its database default with a single
+    ``ADD COLUMN ... DEFAULT`` statement.
+
+    This replaces the pair ``AddField`` and ``AddDefaultValue``, which makes
+    Django add the column with a default, drop that default and then have us
+    set it again. On PostgreSQL 11+ adding a column with a non-volatile default
+    only touches the catalog, and MySQL 8 can do it with ``ALGORITHM=INSTANT``.
+
+    Relational fields and field / database combinations that cannot have a
+    default fall back to ``AddField`` followed by ``AddDefaultValue``.
+    """
+
+    def __init__(
+        self,
+        model_name,
+        name,
+        field,
+        value,
+        preserve_default=True,
+        lock_timeout=None,
+        lock_retries=None,
+        lock_retry_delay=None,
+        max_rows=None,
+        force=None,
+    ):
+        super(AddFieldWithDefault, self).__init__(
+            model_name,
+            name,
+            value,
+            lock_timeout=lock_timeout,
+            lock_retries=lock_retries,
+            lock_retry_delay=lock_retry_delay,
+            max_rows=max_rows,
+            force=force,
+        )
+        self.field = field
+        self.preserve_default = preserve_default
 
-        :param vendor: database vendor we need to perform operations for
-        :param value: the value as provided in the migration
-        :return: a 2-tuple containing the new value and the quotation to use
+    def describe(self):
         """
-        if isinstance(value, bool) and not self.is_postgresql_syntax_compatible(vendor):
-            if value:
-                return 1, self.quotes["value"]
+        Output a brief summary of what the action does.
+        """
+        return "Add field {field} to {model} with the default value {value}".format(
+            model=self.model_name, field=self.name, value=format_value(self.value)
+        )
 
-            return 0, self.quotes["value"]
+    def add_field_operation(self):
+        return AddField(
+            model_name=self.model_name,
+            name=self.name,
+            field=self.field,
+            preserve_default=self.preserve_default,
+        )
 
-        value, quote, handled = self._clean_temporal(vendor, value)
-        if handled:
-            return value, quote
+    def state_forwards(self, app_label, state):
+        self.add_field_operation().state_forwards(app_label, state)
+        super(AddFieldWithDefault, self).state_forwards(app_label, state)
 
-        value, quote, handled = self._clean_temporal_constants(vendor, value)
-        if handled:
-            return value, quote
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        to_model = to_state.apps.get_model(app_label, self.model_name)
+        dialect = get_dialect(schema_editor.connection)
+        if not self.can_add_column_with_default(to_model, dialect):
+            self.fallback_forwards(app_label, schema_editor, from_state, to_state)
+            return
 
-        return value, self.quotes["value"]
+        if not self.allow_migrate_model(schema_editor.connection.alias, to_model):
+            return
 
-    def mssql_constraint_name(self):
-        return "DADV_{model}_{field}_DEFAULT".format(
-            model=self.model_name, field=self.name
+        if self.rewrites_table(dialect):
+            warnings.warn(
+                "Adding {model}.{field} with its default will rewrite the whole "
+                "table on this database.".format(
+                    model=to_model.__name__, field=self.name
+                )
+            )
+
+        self.check_cost(schema_editor, dialect, to_model)
+        field = to_model._meta.get_field(self.name)
+        sql, params = self.add_column_sql(schema_editor, dialect, to_model, field)
+        with reporting(
+            self, schema_editor, to_model._meta.db_table, [field.column], sql
+        ) as event:
+            event.retry_wait = self.execute(schema_editor, sql, params)
+        self.record_defaults(schema_editor, to_model, [(field, self.value)])
+        # Add an index, if required. Django defers these as well.
+        if hasattr(schema_editor, "_field_indexes_sql"):
+            schema_editor.deferred_sql.extend(
+                schema_editor._field_indexes_sql(to_model, field)
+            )
+
+    def fallback_forwards(self, app_label, schema_editor, from_state, to_state):
+        """
+        Run ``AddField`` followed by ``AddDefaultValue``. Schema editors that
+        collect default changes get the default first, so it is part of the
+        table rebuild adding the column.
+        """
+        steps = [
+            self.add_field_operation().database_forwards,
+            super(AddFieldWithDefault, self).database_forwards,
+        ]
+        if hasattr(schema_editor, "set_column_defaults"):
+            steps.reverse()
+        for step in steps:
+            step(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        dialect = get_dialect(schema_editor.connection)
+        if dialect is not None and dialect.has_default_constraints:
+            # The column cannot be dropped while our constraint references it.
+            # The states are swapped, as only the later one has the field.
+            super(AddFieldWithDefault, self).database_backwards(
+                app_label, schema_editor, to_state, from_state
+            )
+
+        self.add_field_operation().database_backwards(
+            app_label, schema_editor, from_state, to_state
         )
 
-    def _clean_temporal(self, vendor, value):
-        if isinstance(value, date):
-            return value.isoformat(), self.quotes["value"], True
+    def estimate(self, dialect, model):
+        field = model._meta.get_field(self.name)
+        kind, lock, reason = dialect.add_column_cost(
+            volatile=self.is_volatile_default(dialect),
+            indexed=field.unique or field.db_index,
+            lock=self.get_option("lock"),
+        )
+        return CostEstimate(self, model._meta.db_table, kind, lock, reason)
 
-        if isinstance(value, datetime):
-            if self.is_postgresql_syntax_compatible(vendor):
-                return (
-                    value.isoformat(" ", timespec="seconds"),
-                    self.quotes["value"],
-                    True,
-                )
-            else:
-                naive = timezone.make_naive(value)
-                return (
-                    naive.isoformat(" ", timespec="seconds"),
-                    self.quotes["value"],
-                    True,
+    def can_add_column_with_default(self, model, dialect):
+        field = model._meta.get_field(self.name)
+        return (
+            dialect is not None
+            and dialect.supports_add_column_default
+            and field.concrete
+            and not field.is_relation
+            and self.can_apply_default(model, self.name, dialect)
+        )
+
+    def add_column_sql(self, schema_editor, dialect, model, field):
+        """
+        :return: The statement adding the column including its default and
+                 the parameters for it
+        """
+        definition, params = schema_editor.column_sql(model, field)
+        sql = schema_editor.sql_create_column % {
+            "table": dialect.quote_name(model._meta.db_table),
+            "column": dialect.quote_name(field.column),
+            "definition": "{definition} {default}".format(
+                definition=definition,
+                default=dialect.add_column_default_sql(
+                    self.mssql_constraint_name(), self.value
+                ),
+            ),
+        }
+        if self.can_add_column_instantly(dialect, field):
+            sql += ", ALGORITHM=INSTANT"
+
+        return sql, params
+
+    def can_add_column_instantly(self, dialect, field):
+        """
+        MySQL 8.0.12 and MariaDB 10.3.2 can add a column by only changing the
+        table metadata, as long as no index has to be built along with it.
+        """
+        if field.unique or field.db_index:
+            return False
+
+        return dialect.supports_instant_add_column()
+
+    def rewrites_table(self, dialect):
+        """
+        Tell whether adding the column with our default would rewrite every
+        row instead of only changing the table metadata.
+        """
+        return (
+            self.is_volatile_default(dialect) or dialect.rewrites_table_on_add_column()
+        )
+
+    def is_volatile_default(self, dialect):
+        if callable(self.value):
+            return get_function(self.value).volatile
+
+        sql_value, value_quote = dialect.clean_value(self.value)
+        return (
+            value_quote == NO_QUOTES
+            and "{}".format(sql_value).lower() in VOLATILE_FUNCTIONS
+        )
+
+    def deconstruct(self):
+        kwargs = {
+            "model_name": self.model_name,
+            "name": self.name,
+            "field": self.field,
+            "value": self.value,
+        }
+        if self.preserve_default is not True:
+            kwargs["preserve_default"] = self.preserve_default
+        kwargs.update(self.option_kwargs())
+        return (self.__class__.__name__, [], kwargs)
+
+    def reduce(self, operation, *args):
+        app_label = args[-1] if args else None
+        if isinstance(operation, RemoveField) and self.references_field(
+            operation.model_name, operation.name, app_label
+        ):
+            return []
+
+        if sets_defaults_only(operation) and operation.references_field(
+            self.model_name, self.name, app_label
+        ):
+            return [
+                AddFieldWithDefault(
+                    model_name=self.model_name,
+                    name=self.name,
+                    field=self.field,
+                    value=dict(operation.get_defaults())[self.name],
+                    preserve_default=self.preserve_default,
+                    **self.option_kwargs()
                 )
+            ] + operation.without_defaults([self.name])
+
+        return super(AddFieldWithDefault, self).reduce(operation, *args)
+
+
+class AddDefaultAndSetNotNull(AddDefaultValue):
+    """
+    Transfer the default of a field to the database and make its column NOT
+    NULL, locking the table as briefly as the server allows. Backfill the
+    NULLs first, the statements fail on any NULL left.
+
+    ``AlterField`` to ``null=False`` checks every row while holding the
+    strongest lock on the table. PostgreSQL 12+ instead gets a ``NOT VALID``
+    check constraint, which is validated without blocking writes and lets
+    ``SET NOT NULL`` skip its scan. Run it in a migration with
+    ``atomic = False``, or the first statement's lock is held throughout.
+    CockroachDB runs ``SET NOT NULL`` as an online job, MySQL rebuilds the
+    column with ``ALGORITHM=INPLACE, LOCK=NONE``, and SQL Server alters it
+    with ``ONLINE = ON`` if the ``DADV_MSSQL_ONLINE`` setting says the
+    edition can. SQLite rebuilds the table.
+    """
+
+    def __init__(
+        self,
+        model_name,
+        name,
+        value,
+        algorithm=None,
+        lock=None,
+        lock_timeout=None,
+        lock_retries=None,
+        lock_retry_delay=None,
+        max_rows=None,
+        force=None,
+    ):
+        super(AddDefaultAndSetNotNull, self).__init__(
+            model_name,
+            name,
+            value,
+            algorithm=algorithm,
+            lock=lock,
+            lock_timeout=lock_timeout,
+            lock_retries=lock_retries,
+            lock_retry_delay=lock_retry_delay,
+            max_rows=max_rows,
+            force=force,
+        )
 
-        return value, self.quotes["value"], False
+    def describe(self):
+        """
+        Output a brief summary of what the action does.
+        """
+        return (
+            "Add to field {model}.{field} the default value {value} and make it "
+            "NOT NULL".format(
+                model=self.model_name, field=self.name, value=format_value(self.value)
+            )
+        )
 
-    def _clean_temporal_constants(self, vendor, value):
-        if value == NOW or value == TODAY:
-            if self.is_postgresql_syntax_compatible(vendor):
-                return "now()", self.quotes["function"], True
-            elif self.is_mssql(vendor):
-                return "GETDATE()", self.quotes["function"], True
+    def state_forwards(self, app_label, state):
+        super(AddDefaultAndSetNotNull, self).state_forwards(app_label, state)
+        set_state_null(state, app_label, self.model_name, self.name, False)
 
-        # https://stackoverflow.com/a/20461045/10000573
-        if value == NOW and self.is_mysql(vendor):
-            return "CURRENT_TIMESTAMP", self.quotes["constant"], True
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        """
+        Set the default first, so rows inserted in the meantime get it. The
+        table rebuilds of Django drop defaults, so on SQLite the column is
+        altered first.
+        """
+        steps = [
+            super(AddDefaultAndSetNotNull, self).database_forwards,
+            self.alter_null,
+        ]
+        dialect = get_dialect(schema_editor.connection)
+        if dialect is not None and dialect.remakes_table:
+            steps.reverse()
+        for step in steps:
+            step(app_label, schema_editor, from_state, to_state)
 
-        return value, self.quotes["value"], False
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        self.alter_null(app_label, schema_editor, from_state, to_state)
+        super(AddDefaultAndSetNotNull, self).database_backwards(
+            app_label, schema_editor, from_state, to_state
+        )
 
+    def alter_null(self, app_label, schema_editor, from_state, to_state):
+        """
+        Make the column NOT NULL, or nullable again, as the field of
+        ``to_state`` is. Columns that already are are left alone.
+        """
+        dialect = get_dialect(schema_editor.connection)
+        from_model = from_state.apps.get_model(app_label, self.model_name)
+        to_model = to_state.apps.get_model(app_label, self.model_name)
+        if dialect is None or not self.allow_migrate_model(
+            schema_editor.connection.alias, to_model
+        ):
+            return
+
+        from_field = from_model._meta.get_field(self.name)
+        to_field = to_model._meta.get_field(self.name)
+        if from_field.null == to_field.null:
+            return
+
+        statements = self.not_null_sql(
+            dialect, to_model, to_field, to_field.db_type(schema_editor.connection)
+        )
+        if statements is None:
+            schema_editor.alter_field(from_model, from_field, to_field)
+            return
+        self.execute_not_null_sql(schema_editor, to_model, to_field, statements)
+
+    def not_null_sql(self, dialect, model, field, definition):
+        """
+        :param definition: The type of the column
+        :return: The statements making the column of ``field`` as nullable as
+                 ``field`` is, or None if the schema editor of Django has to
+                 alter it
+        """
+        default = None
+        if self.can_apply_default(model, self.name, dialect):
+            default = dialect.render_default(self.value)
+        options = dialect.not_null_options(
+            self.get_option("algorithm"),
+            self.get_option("lock"),
+            getattr(settings, "DADV_MSSQL_ONLINE", False),
+        )
+        if field.null:
+            return dialect.drop_not_null_sql(
+                model._meta.db_table, field.column, definition, default, options
+            )
+        return dialect.set_not_null_sql(
+            model._meta.db_table,
+            field.column,
+            self.not_null_check_name(),
+            definition,
+            default,
+            options,
+        )
+
+    def execute_not_null_sql(self, schema_editor, model, field, statements):
+        table = model._meta.db_table
+        if (
+            len(statements) > 1
+            and schema_editor.connection.in_atomic_block
+            and not schema_editor.collect_sql
+        ):
+            warnings.warn(
+                "{operation} runs in the transaction of its migration, which keeps "
+                "{table} locked until it commits. Set atomic = False on the "
+                "migration.".format(operation=self.describe(), table=table)
+            )
+        for sql in statements:
+            with reporting(self, schema_editor, table, [field.column], sql) as event:
+                event.retry_wait = self.execute(schema_editor, sql)
+
+    def not_null_check_name(self):
+        return "DADV_{model}_{field}_NOT_NULL".format(
+            model=self.model_name, field=self.name
+        )
+
+    def estimate(self, dialect, model):
+        kind, lock, reason = dialect.set_not_null_cost(
+            self.get_option("lock"), getattr(settings, "DADV_MSSQL_ONLINE", False)
+        )
+        return CostEstimate(self, model._meta.db_table, kind, lock, reason)
 
-def version_with_broken_quote_value(major, minor, patch):
-    if major == 2:
-        if minor == 1 and patch < 9:
-            return True
-        elif minor == 2 and patch < 2:
-            return True
+    def reduce(self, operation, *args):
+        """
+        Never fold into other default operations, which would drop the NOT
+        NULL.
+        """
+        app_label = args[-1] if args else None
+        if isinstance(operation, DeleteModel) and self.references_model(
+            operation.name, app_label
+        ):
+            return [operation]
 
-    return False
+        if isinstance(operation, RemoveField) and self.references_field(
+            operation.model_name, operation.name, app_label
+        ):
+            return [operation]
 
+        return Operation.reduce(self, operation, *args) or (
+            not self.is_referenced_by(operation, app_label)
+        )
 
-def quote_value(self, value):
-    self.connection.ensure_connection()
 
-    # MySQLdb escapes to string, PyMySQL to bytes.
-    quoted = self.connection.connection.escape(
-        value, self.connection.connection.encoders
+def sets_defaults_only(operation):
+    """
+    Tell whether ``operation`` does nothing but set defaults, so it can be
+    merged with other default operations.
+    """
+    return isinstance(operation, AddDefaultValue) and not isinstance(
+        operation, (AddFieldWithDefault, AddDefaultAndSetNotNull)
     )
-    if isinstance(value, str) and isinstance(quoted, bytes):
-        quoted = quoted.decode()
-    return quoted
+
+
+def is_lock_timeout(exc):
+    """
+    Tell whether a database error was raised because ``lock_timeout`` expired.
+    """
+    cause = getattr(exc, "__cause__", None)
+    return getattr(cause, "pgcode", None) == LOCK_NOT_AVAILABLE
@@ -0,0 +1,91 @@
+# Copyright 2018 3YOURMIND GmbH
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import unicode_literals
+
+from django.db.backends.sqlite3 import schema
+
+from django_add_default_value.pending import PendingDefaultsMixin
+from django_add_default_value.sqlite import rendering_defaults
+
+
+class DatabaseSchemaEditor(PendingDefaultsMixin, schema.DatabaseSchemaEditor):
+    """
+    Collect the default changes of a migration and apply all changes to one
+    table with a single rebuild: when the migration ends, right before the
+    next statement touching the table, or together with a rebuild Django
+    does anyway. The defaults of a table also survive the rebuilds of
+    Django, which would otherwise drop them.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(DatabaseSchemaEditor, self).__init__(*args, **kwargs)
+        self.remaking = 0
+
+    def set_column_defaults(self, model, column_defaults):
+        """
+        :param column_defaults: The new default SQL per column name, None to
+                                drop a default
+        """
+        self.queue_defaults(model._meta.db_table, column_defaults, model)
+
+    def apply_defaults(self, table, model, column_defaults):
+        self.remake_table_with_defaults(model, column_defaults)
+
+    def flushes_pending_defaults(self):
+        # The statements of a rebuild only touch the rebuilt table
+        return (
+            not self.remaking
+            and super(DatabaseSchemaEditor, self).flushes_pending_defaults()
+        )
+
+    def _remake_table(
+        self, model, create_field=None, delete_field=None, alter_field=None
+    ):
+        __, column_defaults = self.pending_defaults.pop(
+            model._meta.db_table, (None, {})
+        )
+        return self.remake_table_with_defaults(
+            model,
+            column_defaults,
+            create_field=create_field,
+            delete_field=delete_field,
+            alter_field=alter_field,
+        )
+
+    def remake_table_with_defaults(
+        self,
+        model,
+        column_defaults,
+        create_field=None,
+        delete_field=None,
+        alter_field=None,
+    ):
+        renamed_columns = {}
+        if alter_field:
+            old_field, new_field = alter_field
+            renamed_columns[old_field.column] = new_field.column
+
+        self.remaking += 1
+        try:
+            with rendering_defaults(
+                self, model._meta.db_table, column_defaults, renamed_columns
+            ):
+                return super(DatabaseSchemaEditor, self)._remake_table(
+                    model,
+                    create_field=create_field,
+                    delete_field=delete_field,
+                    alter_field=alter_field,
+                )
+        finally:
+            self.remaking -= 1
@@ -0,0 +1,220 @@
+# Copyright 2018 3YOURMIND GmbH
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Fill in the defaults of rows that existed before the default was set.
+
+A database default only applies to future ``INSERT`` statements. The rows
+that are NULL are updated in small batches, walking the primary key, so no
+transaction holds its locks for long and the work can be interrupted and
+resumed at any point.
+"""
+
+from __future__ import unicode_literals
+import json
+import os
+
+from django.apps import apps
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, models, transaction
+from django.db.migrations.loader import MigrationLoader
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast, Now
+
+from .add_default_value import AddDefaultValue
+from .dialects import NOW, TODAY, get_dialect
+
+
+def collect_defaults(app_labels=None):
+    """
+    Find the defaults the migrations on disk transfer to the database.
+
+    :param app_labels: Only look at the migrations of these apps
+    :return: ``(app label, model name, field name, value)`` 4-tuples. A
+             default set more than once is listed once, with its latest value.
+    """
+    loader = MigrationLoader(None, ignore_no_migrations=True)
+    defaults = {}
+    for app_label, migration_name in migration_plan(loader.graph):
+        if app_labels and app_label not in app_labels:
+            continue
+
+        migration = loader.graph.nodes[app_label, migration_name]
+        for model_name, name, value in migration_defaults(migration):
+            defaults[app_label, model_name, name] = value
+
+    return [key + (value,) for key, value in defaults.items()]
+
+
+def migration_defaults(migration):
+    """
+    :return: ``(model name, field name, value)`` 3-tuples for the defaults
+             ``migration`` sets
+    """
+    for operation in migration.operations:
+        if isinstance(operation, AddDefaultValue):
+            for name, value in operation.get_defaults():
+                yield operation.model_name.lower(), name, value
+
+
+def migration_plan(graph):
+    """
+    :return: All migrations of ``graph`` in an order they can be applied in
+    """
+    plan = []
+    seen = set()
+    for leaf in sorted(graph.leaf_nodes()):
+        for node in graph.forwards_plan(leaf):
+            if node not in seen:
+                seen.add(node)
+                plan.append(node)
+    return plan
+
+
+def update_value(value, field, dialect):
+    """
+    :return: What to assign in the ``UPDATE``: the ``NOW`` and ``TODAY``
+             sentinels and callables are evaluated by the database, like the
+             column default, so every row gets its own value
+    """
+    if value == NOW:
+        return Now()
+    if value == TODAY:
+        return Cast(Now(), output_field=models.DateField())
+    if callable(value):
+        sql, __ = dialect.clean_function(value)
+        return RawSQL(sql, [], output_field=field)
+    return value
+
+
+class Backfill(object):
+    """
+    Set ``value`` on the rows of ``model`` whose ``field_name`` is NULL.
+
+    :param using: The database alias to update
+    :param batch_size: How many rows to update per transaction
+    """
+
+    def __init__(self, model, field_name, value, using="default", batch_size=1000):
+        self.model = model
+        self.field = model._meta.get_field(field_name)
+        self.value = value
+        self.using = using
+        self.batch_size = batch_size
+
+    def __str__(self):
+        return "{label}.{field}".format(
+            label=self.model._meta.label, field=self.field.name
+        )
+
+    @classmethod
+    def from_defaults(cls, defaults, **kwargs):
+        """
+        Create a backfill for every default of :func:`collect_defaults` whose
+        field still exists and can hold NULL. Other fields have no rows to
+        fill in.
+        """
+        backfills = []
+        for app_label, model_name, field_name, value in defaults:
+            try:
+                model = apps.get_model(app_label, model_name)
+                field = model._meta.get_field(field_name)
+            except (LookupError, FieldDoesNotExist):
+                continue
+            if field.null and field.concrete and not field.primary_key:
+                backfills.append(cls(model, field_name, value, **kwargs))
+        return backfills
+
+    def update_value(self):
+        return update_value(
+            self.value, self.field, get_dialect(connections[self.using])
+        )
+
+    def get_queryset(self):
+        return self.model._base_manager.using(self.using).filter(
+            **{"{field}__isnull".format(field=self.field.name): True}
+        )
+
+    def next_batch(self, after=None):
+        """
+        :param after: The primary key the previous batch ended at
+        :return: The primary keys of the next rows to update
+        """
+        queryset = self.get_queryset().order_by("pk")
+        if after is not None:
+            queryset = queryset.filter(pk__gt=after)
+        return list(queryset.values_list("pk", flat=True)[: self.batch_size])
+
+    def run_batch(self, after=None):
+        """
+        Update the next batch in its own transaction.
+
+        :return: The primary key the batch ended at and the number of rows
+                 updated, or ``(None, 0)`` once there is nothing left to do
+        """
+        with transaction.atomic(using=self.using):
+            pks = self.next_batch(after)
+            if not pks:
+                return None, 0
+            updated = (
+                self.get_queryset()
+                .filter(pk__in=pks)
+                .update(**{self.field.name: self.update_value()})
+            )
+        return pks[-1], updated
+
+
+class Checkpoint(object):
+    """
+    Where every backfill got to, kept in a JSON file so an interrupted run
+    can be resumed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.positions = {}
+        if path and os.path.exists(path):
+            with open(path) as checkpoint:
+                self.positions = json.load(checkpoint)
+
+    @staticmethod
+    def key(backfill):
+        return "{using}:{backfill}".format(using=backfill.using, backfill=backfill)
+
+    def get(self, backfill):
+        return self.positions.get(self.key(backfill))
+
+    def is_done(self, backfill):
+        return self.get(backfill) == {"done": True}
+
+    def position(self, backfill):
+        """
+        :return: The primary key to continue after, or None to start over
+        """
+        position = self.get(backfill)
+        return position and position.get("after")
+
+    def save(self, backfill, after=None, done=False):
+        if done:
+            self.positions[self.key(backfill)] = {"done": True}
+        else:
+            self.positions[self.key(backfill)] = {"after": after}
+
+        if not self.path:
+            return
+        # Replace the file in one go, so a crash never leaves half of it
+        temporary_path = "{path}.tmp".format(path=self.path)
+        with open(temporary_path, "w") as checkpoint:
+            json.dump(self.positions, checkpoint, cls=DjangoJSONEncoder, indent=2)
+        os.replace(temporary_path, self.path)
@@ -0,0 +1,371 @@
+# Copyright 2018 3YOURMIND GmbH
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Insert many rows while the database fills in the defaults.
+
+``bulk_create`` evaluates the Python default of every field for every row and
+sends it to the database. The columns whose default the migrations transfer
+to the database can be left out of the ``INSERT`` altogether instead. Rows
+are streamed through ``COPY FROM STDIN`` on PostgreSQL and sent as multi-row
+``INSERT`` statements elsewhere.
+"""
+
+from __future__ import unicode_literals
+import threading
+from datetime import date, time, timedelta
+from decimal import Decimal
+from itertools import groupby
+from operator import itemgetter
+from uuid import UUID
+
+from django.db import DEFAULT_DB_ALIAS, connections, models
+
+from .add_default_value import AddDefaultValue
+from .backfill import collect_defaults
+from .dialects import get_dialect
+from .utils import batches
+
+_defaults = {}
+_defaults_lock = threading.Lock()
+
+
+def migrated_defaults(app_label):
+    """
+    :return: The values of the defaults the migrations of ``app_label``
+             transfer to the database by ``(model name, field name)``, read
+             from the migrations once per process
+    """
+    defaults = _defaults.get(app_label)
+    if defaults is not None:
+        return defaults
+
+    with _defaults_lock:
+        if app_label not in _defaults:
+            _defaults[app_label] = {
+                (model_name, name.lower()): value
+                for __, model_name, name, value in collect_defaults([app_label])
+            }
+        return _defaults[app_label]
+
+
+def database_default_fields(model, dialect):
+    """
+    :return: The fields of ``model`` that get their default from the
+             database, as far as it can hold them
+    """
+    options = model._meta
+    defaults = migrated_defaults(options.app_label)
+    fields = []
+    for field in options.local_concrete_fields:
+        key = (options.model_name, field.name.lower())
+        if key in defaults and AddDefaultValue(
+            model.__name__, field.name, defaults[key]
+        ).can_apply_default(model, field.name, dialect):
+            fields.append(field)
+    return fields
+
+
+# The database values whose text is what COPY reads for their column
+TEXT_TYPES = (str, int, float, Decimal, date, time, UUID)
+
+
+def copy_text(value):
+    """
+    :return: ``value`` as a field of the text format of ``COPY``
+    :raises TypeError: if ``value`` has no text ``COPY`` reads, like the
+                       lists of an ``ArrayField``, the dicts of an
+                       ``HStoreField`` or the adapted values of a
+                       ``JSONField`` in newer Django versions
+    """
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (bytes, memoryview)):
+        return "\\\\x" + bytes(value).hex()
+    return (
+        text(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def text(value):
+    if isinstance(value, timedelta):
+        # As psycopg2 adapts it
+        return "{days} days {seconds}.{microseconds:06d} seconds".format(
+            days=value.days, seconds=value.seconds, microseconds=value.microseconds
+        )
+    if not isinstance(value, TEXT_TYPES):
+        raise TypeError(
+            "COPY can't encode {type} values".format(type=type(value).__name__)
+        )
+    return "{}".format(value)
+
+
+class CopyStream(object):
+    """
+    A file to ``COPY FROM`` that encodes ``rows``, lists of database values,
+    only as the server reads them.
+
+    :param fields: The fields of the values, to name in errors
+    :raises ValueError: from :meth:`read`, if a value has no text ``COPY``
+                        reads, see :func:`copy_text`
+    """
+
+    def __init__(self, rows, fields=()):
+        self.rows = iter(rows)
+        self.fields = list(fields)
+        self.buffer = ""
+        self.count = 0
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self.buffer += "\t".join(self.encode(row)) + "\n"
+            self.count += 1
+
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def encode(self, row):
+        for index, value in enumerate(row):
+            try:
+                yield copy_text(value)
+            except TypeError as exc:
+                field = self.fields[index] if index < len(self.fields) else index
+                raise ValueError(
+                    "{error} ({field}), load these rows with BulkLoader.insert() "
+                    "instead.".format(error=exc, field=field)
+                )
+
+
+class BulkLoader(object):
+    """
+    Insert rows into the table of ``model``, leaving out the columns the
+    database fills in with its defaults.
+
+    :param fields: The names of the fields to insert. Defaults to all local
+                   fields except an auto-incremented primary key and the
+                   fields with a database default. Those are still sent for
+                   the rows that give a value for them.
+    :param batch_size: How many rows to send per ``INSERT``, lowered to what
+                       the database accepts
+    """
+
+    def __init__(self, model, using=DEFAULT_DB_ALIAS, fields=None, batch_size=1000):
+        if model._meta.parents:
+            raise ValueError("Can't bulk load a multi-table inherited model.")
+
+        self.model = model
+        self.connection = connections[using]
+        self.dialect = get_dialect(self.connection)
+        if fields is None:
+            self.fields = self.default_fields()
+            # Left out unless a row gives a value for them
+            self.optional_fields = [
+                field
+                for field in model._meta.local_concrete_fields
+                if field not in self.fields
+            ]
+        else:
+            self.fields = [model._meta.get_field(name) for name in fields]
+            self.optional_fields = []
+        self.instance_fields = tuple(
+            self.fields
+            + [
+                field
+                for field in self.optional_fields
+                if not isinstance(field, models.AutoField)
+            ]
+        )
+        self.field_names = set()
+        for field in model._meta.local_concrete_fields:
+            self.field_names.update((field.name, field.attname))
+        if not self.fields and not self.optional_fields:
+            raise ValueError(
+                "All fields of {model} get their default from the database, "
+                "pass the fields to insert.".format(model=model._meta.label)
+            )
+        self.requested_batch_size = batch_size
+        self.batch_size = self.get_batch_size(self.fields)
+
+    def get_batch_size(self, fields):
+        batch_size = self.requested_batch_size
+        return max(
+            min(
+                batch_size,
+                self.connection.ops.bulk_batch_size(fields, range(batch_size)),
+            ),
+            1,
+        )
+
+    def default_fields(self):
+        omitted = set(database_default_fields(self.model, self.dialect))
+        return [
+            field
+            for field in self.model._meta.local_concrete_fields
+            if field not in omitted and not isinstance(field, models.AutoField)
+        ]
+
+    def load(self, rows):
+        """
+        :param rows: Mappings of field names, or attribute names for foreign
+                     keys, to values, or model instances. Fields missing from
+                     a mapping get their Python default, or their database
+                     default when the database has one. Instances send the
+                     values of all their fields.
+        :return: The number of rows inserted
+        """
+        count = 0
+        # Consecutive rows giving values for the same columns share statements
+        for fields, group in groupby(
+            ((self.row_fields(row), row) for row in rows), key=itemgetter(0)
+        ):
+            values = (self.row_values(row, fields) for __, row in group)
+            count += self.send(values, list(fields))
+        return count
+
+    def row_fields(self, row):
+        """
+        :return: The fields to insert ``row`` with
+        :raises ValueError: if ``row`` gives a value for a field that isn't
+                            inserted
+        """
+        if isinstance(row, models.Model):
+            return self.instance_fields
+        fields = self.fields + [
+            field for field in self.optional_fields if has_value(row, field)
+        ]
+        lost = [name for name in row if self.is_left_out(name, fields)]
+        if lost:
+            raise ValueError(
+                "{model} rows are loaded without the field(s) {fields}, the "
+                "values given for them would be lost.".format(
+                    model=self.model._meta.label, fields=", ".join(sorted(lost))
+                )
+            )
+        return tuple(fields)
+
+    def is_left_out(self, name, fields):
+        return name in self.field_names and not any(
+            name in (field.name, field.attname) for field in fields
+        )
+
+    def row_values(self, row, fields=None):
+        if fields is None:
+            fields = self.fields
+        if isinstance(row, models.Model):
+            values = [field.pre_save(row, True) for field in fields]
+        else:
+            values = [mapping_value(row, field) for field in fields]
+        return [
+            field.get_db_prep_save(value, connection=self.connection)
+            for field, value in zip(fields, values)
+        ]
+
+    def send(self, values, fields):
+        if not fields:
+            raise ValueError(
+                "All fields of {model} get their default from the database, "
+                "pass the fields to insert.".format(model=self.model._meta.label)
+            )
+        if self.dialect is not None and self.dialect.supports_copy:
+            return self.copy(values, fields)
+        return self.insert(values, fields)
+
+    def columns(self, fields=None):
+        quote_name = self.connection.ops.quote_name
+        return ", ".join(quote_name(field.column) for field in fields or self.fields)
+
+    def copy(self, values, fields=None):
+        """
+        :param values: Lists of database values of ``fields``, which default
+                       to the fields of the loader
+        :raises ValueError: if a value can't be sent with ``COPY``, like
+                            those of an ``ArrayField``, use :meth:`insert`
+                            for them
+        """
+        stream = CopyStream(values, fields or self.fields)
+        with self.connection.cursor() as cursor:
+            cursor.copy_expert(
+                "COPY {table} ({columns}) FROM STDIN".format(
+                    table=self.connection.ops.quote_name(self.model._meta.db_table),
+                    columns=self.columns(fields),
+                ),
+                stream,
+            )
+        return stream.count
+
+    def insert(self, values, fields=None):
+        """
+        :param values: Lists of database values of ``fields``, which default
+                       to the fields of the loader
+        """
+        fields = fields or self.fields
+        count = 0
+        with self.connection.cursor() as cursor:
+            for batch in batches(values, self.get_batch_size(fields)):
+                cursor.execute(
+                    self.insert_sql(len(batch), fields),
+                    [value for row in batch for value in row],
+                )
+                count += len(batch)
+        return count
+
+    def insert_sql(self, rows, fields=None):
+        fields = fields or self.fields
+        placeholders = [["%s"] * len(fields)] * rows
+        return "INSERT INTO {table} ({columns}) {values}".format(
+            table=self.connection.ops.quote_name(self.model._meta.db_table),
+            columns=self.columns(fields),
+            values=self.connection.ops.bulk_insert_sql(fields, placeholders),
+        )
+
+
+def mapping_value(row, field):
+    if field.attname in row:
+        return row[field.attname]
+    if field.name in row:
+        value = row[field.name]
+        return value.pk if isinstance(value, models.Model) else value
+    return field.get_default()
+
+
+def has_value(row, field):
+    return field.attname in row or field.name in row
+
+
+class BulkLoadQuerySet(models.QuerySet):
+    """
+    Adds :meth:`bulk_load`, use it as ``objects = BulkLoadQuerySet.as_manager()``.
+    """
+
+    def bulk_load(self, rows, fields=None, batch_size=1000):
+        """
+        Insert ``rows`` with a :class:`BulkLoader` on the database the
+        queryset writes to.
+
+        :return: The number of rows inserted
+        """
+        self._for_write = True
+        return BulkLoader(
+            self.model, using=self.db, fields=fields, batch_size=batch_size
+        ).load(rows)
@@ -0,0 +1,243 @@
+# Copyright 2018 3YOURMIND GmbH
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import unicode_literals
+import re
+import threading
+from contextlib import contextmanager
+
+from django.db.models.signals import post_migrate, pre_migrate
+
+from .dialects import get_dialect
+from .pending import statement_table
+
+# A type cast PostgreSQL appends to literals, e.g. 'a'::character varying
+POSTGRESQL_CAST = re.compile(r"::[a-z ]+(\([\d, ]+\))?(\[\])?$")
+# Defaults the catalogs show without quotes: numbers and booleans
+BARE_LITERAL = re.compile(r"^(-?\d+(\.\d+)?|true|false)$", re.IGNORECASE)
+
+# Statements that can't change a column default
+NO_SCHEMA_CHANGE = re.compile(
+    r"^\s*(SELECT|INSERT|UPDATE|DELETE|SET|SHOW|PRAGMA|EXPLAIN|SAVEPOINT"
+    r"|RELEASE|BEGIN|COMMIT|ROLLBACK)\b",
+    re.IGNORECASE,
+)
+
+# The default of a column the snapshot doesn't know about
+NOT_PRESENT = object()
+
+_snapshots = {}
+# The execute wrapper keeping each snapshot current, by alias
+_watchers = {}
+_snapshots_lock = threading.Lock()
+
+
+class CatalogSnapshot(object):
+    """
+    The column defaults of every table in the current schema, loaded with a
+    single query.
+
+    The snapshot reflects the schema at the time it was loaded, plus the
+    changes recorded through :meth:`record`, minus the tables other
+    statements changed since, see :meth:`forget_changes`. Columns the
+    snapshot does not know about never compare equal.
+    """
+
+    def __init__(self, dialect, rows):
+        self.dialect = dialect
+        self.defaults = {(table, column): default for table, column, default in rows}
+        # While above 0, the statements executed are recorded instead
+        self.recording = 0
+
+    @classmethod
+    def load(cls, connection):
+        dialect = get_dialect(connection)
+        with connection.cursor() as cursor:
+            cursor.execute(dialect.catalog_columns_sql)
+            return cls(dialect, cursor.fetchall())
+
+    def get_default(self, table, column):
+        """
+        :return: The default as shown by the catalog, None if the column has
+                 none, or ``NOT_PRESENT`` if the snapshot doesn't know the
+                 column
+        """
+        return self.defaults.get((table, column), NOT_PRESENT)
+
+    def has_default(self, table, column, default):
+        """
+        Tell whether ``column`` of ``table`` is known to have ``default``.
+
+        :param default: The default as rendered in our ``ALTER TABLE``, or
+                        None for no default at all
+        """
+        current = self.get_default(table, column)
+        if current is NOT_PRESENT:
+            return False
+
+        current = normalize_default(self.dialect, current)
+        if default is None or current is None:
+            return default is current
+
+        return defaults_match(self.dialect, current, default)
+
+    def record(self, table, column, default):
+        """
+        Remember the default we just gave to ``column`` of ``table``.
+        """
+        self.defaults[table, column] = default
+
+    def forget_changes(self, sql):
+        """
+        Forget the defaults of the table ``sql`` may change, or of all tables
+        if it may change any, like a ``RunSQL`` could.
+        """
+        if self.recording or not changes_schema(sql):
+            return
+        table = statement_table(sql)
+        if table is None:
+            self.defaults.clear()
+            return
+        for key in [key for key in self.defaults if key[0].lower() == table]:
+            del self.defaults[key]
+
+
+def changes_schema(sql):
+    statement = sql.strip().rstrip(";")
+    return ";" in statement or not NO_SCHEMA_CHANGE.match(statement)
+
+
+def normalize_default(dialect, default):
+    """
+    Strip what the catalogs wrap around a default: MSSQL puts it in
+    parentheses and PostgreSQL casts literals to the column type.
+    """
+    if default is None:
+        return None
+
+    default = dialect.normalize_catalog_default(default)
+
+    previous = None
+    while previous != default:
+        previous = default
+        default = POSTGRESQL_CAST.sub("", default)
+
+    return default
+
+
+def defaults_match(dialect, current, default):
+    if current == default:
+        return True
+
+    unquoted = unquote(default)
+    if unquoted is None:
+        # A function or constant, which MariaDB reports in lower case and
+        # with parentheses.
+        return current.lower().rstrip("()") == default.lower().rstrip("()")
+
+    # MySQL before 8.0.13 and MariaDB before 10.2.7 don't quote literals
+    if not dialect.quotes_literal_defaults and current == unquoted:
+        return True
+
+    return bool(BARE_LITERAL.match(current)) and current.lower() == unquoted.lower()
+
+
+def unquote(default):
+    """
+    :return: The string inside a quoted SQL literal, or None if ``default``
+             isn't one
+    """
+    if len(default) < 2 or default[0] != "'" or default[-1] != "'":
+        return None
+    return default[1:-1].replace("''", "'")
+
+
+def child_tables(connection, dialect, table):
+    """
+    :return: The ``(schema, table)`` pairs of the partitions and inheriting
+             tables below ``table``, parents before their children
+    """
+    if not dialect.supports_partitions:
+        return []
+
+    with connection.cursor() as cursor:
+        cursor.execute(dialect.child_tables_sql, [table])
+        return [tuple(row) for row in cursor.fetchall()]
+
+
+def get_snapshot(connection):
+    """
+    Return the catalog snapshot of ``connection``, loading it on first use.
+    Snapshots are kept for the whole ``migrate`` run and forget the tables
+    any statement on the connection changes. Without the execute wrappers of
+    Django 2.0, the snapshot is loaded again every time.
+    """
+    if not hasattr(connection, "execute_wrappers"):
+        return CatalogSnapshot.load(connection)
+
+    with _snapshots_lock:
+        if connection.alias not in _snapshots:
+            snapshot = CatalogSnapshot.load(connection)
+            _snapshots[connection.alias] = snapshot
+            watch(connection, snapshot)
+        return _snapshots[connection.alias]
+
+
+def watch(connection, snapshot):
+    def forget_changes(execute, sql, params, many, context):
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            snapshot.forget_changes(str(sql))
+
+    connection.execute_wrappers.append(forget_changes)
+    _watchers[connection.alias] = (connection, forget_changes)
+
+
+def get_loaded_snapshot(connection):
+    """
+    Return the catalog snapshot of ``connection`` if it has been loaded.
+    """
+    with _snapshots_lock:
+        return _snapshots.get(connection.alias)
+
+
+@contextmanager
+def recording(connection):
+    """
+    Run the statements whose default changes get recorded in the snapshot of
+    ``connection``, if any, with :meth:`CatalogSnapshot.record`.
+    """
+    snapshot = get_loaded_snapshot(connection)
+    if snapshot is None:
+        yield
+        return
+    snapshot.recording += 1
+    try:
+        yield
+    finally:
+        snapshot.recording -= 1
+
+
+def clear_snapshots(using=None, **kwargs):
+    with _snapshots_lock:
+        aliases = list(_snapshots) if using is None else [using]
+        for alias in aliases:
+            _snapshots.pop(alias, None)
+            connection, wrapper = _watchers.pop(alias, (None, None))
+            if wrapper in getattr(connection, "execute_wrappers", ()):
+                connection.execute_wrappers.remove(wrapper)
+
+
+pre_migrate.connect(clear_snapshots, dispatch_uid="dadv_clear_catalog_snapshots")
+post_migrate.connect(clear_snapshots, dispatch_uid="dadv_clear_catalog_snapshots")
@@ -0,0 +1,221 @@
+# Copyright 2018 3YOURMIND GmbH
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Warn about columns whose database default drifted from the one the applied
+migrations declare, for instance after a manual hotfix or a restore, with
+``manage.py check --database default``.
+
+Comparing needs the migration state and the defaults of the whole catalog. To
+keep the check cheap enough for every start, a fingerprint of the database
+defaults and of the applied migrations is computed by the server with one
+query, and cached in a file whenever the defaults matched. As long as the
+fingerprint stays the same, that query is all the check costs.
+"""
+
+from __future__ import unicode_literals
+import json
+import os
+import threading
+
+from django.conf import settings
+from django.core import checks
+from django.db import DatabaseError, connections, router, transaction
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.state import ProjectState
+
+from .add_default_value import AddDefaultValue
+from .catalog import NOT_PRESENT, CatalogSnapshot
+from .dialects import get_dialect
+from .plan import migration_plan
+from .state import get_state_defaults
+
+DRIFT = "django_add_default_value.W001"
+
+
+class FingerprintCache(object):
+    """
+    The fingerprints of the databases whose defaults matched the migrations
+    last time, by alias, kept in a JSON file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.fingerprints = {}
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path) as cache:
+                try:
+                    self.fingerprints = json.load(cache)
+                except ValueError:
+                    # A broken file only costs a full check
+                    pass
+
+    def matches(self, alias, fingerprint):
+        return fingerprint is not None and self.fingerprints.get(alias) == fingerprint
+
+    def save(self, alias, fingerprint):
+        with self.lock:
+            self.fingerprints[alias] = fingerprint
+            if not self.path:
+                return
+            # Containers may start at the same time, replace the file in one go
+            temporary_path = "{path}.{pid}.tmp".format(path=self.path, pid=os.getpid())
+            with open(temporary_path, "w") as cache:
+                json.dump(self.fingerprints, cache, indent=2, sort_keys=True)
+            os.replace(temporary_path, self.path)
+
+
+def get_cache():
+    return FingerprintCache(getattr(settings, "DADV_DRIFT_CHECK_CACHE", None))
+
+
+def fingerprint(connection, dialect):
+    """
+    :return: A string that changes whenever a column default or the applied
+             migrations change, or None if the server can't tell cheaply or
+             nothing was migrated yet
+    """
+    if dialect.defaults_fingerprint_sql is None:
+        return None
+
+    migrations_table = dialect.quote_name("django_migrations")
+    sql = (
+        "SELECT ({defaults}), "
+        "(SELECT COUNT(*) FROM {migrations}), (SELECT MAX(id) FROM {migrations})"
+    ).format(defaults=dialect.defaults_fingerprint_sql, migrations=migrations_table)
+    try:
+        if connection.in_atomic_block:
+            # A failing query would abort the transaction on PostgreSQL
+            with transaction.atomic(using=connection.alias):
+                row = fetch_row(connection, sql)
+        else:
+            row = fetch_row(connection, sql)
+    except DatabaseError:
+        # The migrations table doesn't exist before the first migrate
+        return None
+    return "|".join("{}".format(value) for value in row)
+
+
+def fetch_row(connection, sql):
+    with connection.cursor() as cursor:
+        cursor.execute(sql)
+        return cursor.fetchone()
+
+
+def applied_state(loader):
+    """
+    :return: The project state after the applied migrations of ``loader``
+    """
+    state = ProjectState(real_apps=list(loader.unmigrated_apps))
+    for migration in migration_plan(loader):
+        if (migration.app_label, migration.name) in loader.applied_migrations:
+            migration.mutate_state(state, preserve=False)
+    return state
+
+
+def declared_defaults(state, using):
+    """
+    :return: ``(model, field, value)`` 3-tuples of the database defaults
+             recorded in ``state`` for the models routed to ``using``
+    """
+    defaults = []
+    for app_label, model_name in sorted(state.models):
+        model_defaults = get_state_defaults(state, app_label, model_name)
+        if not model_defaults:
+            continue
+        model = state.apps.get_model(app_label, model_name)
+        if router.allow_migrate_model(using, model):
+            defaults += [
+                (model, model._meta.get_field(name), value)
+                for name, value in model_defaults.items()
+            ]
+    return defaults
+
+
+def drifted_defaults(defaults, snapshot):
+    """
+    :param defaults: ``(model, field, value)`` 3-tuples
+    :param snapshot: The :class:`~.catalog.CatalogSnapshot` to compare with
+    :return: ``(model, field, declared default, current default)`` 4-tuples
+             of the ``defaults`` the database has another default for, the
+             defaults as SQL. Columns that don't exist and defaults the
+             database can't have are left out.
+    """
+    dialect = snapshot.dialect
+    drifted = []
+    for model, field, value in defaults:
+        table = model._meta.db_table
+        current = snapshot.get_default(table, field.column)
+        if current is NOT_PRESENT:
+            continue
+        if not AddDefaultValue(model.__name__, field.name, value).can_apply_default(
+            model, field.name, dialect
+        ):
+            continue
+        declared = dialect.render_default(value)
+        if not snapshot.has_default(table, field.column, declared):
+            drifted.append((model, field, declared, current))
+    return drifted
+
+
+def drift_warnings(drifted, alias):
+    return [
+        checks.Warning(
+            "{table}.{column} has the default {current} in the database '{alias}', "
+            "but the migrations declare {declared}.".format(
+                table=model._meta.db_table,
+                column=field.column,
+                current="NULL" if current is None else current,
+                alias=alias,
+                declared=declared,
+            ),
+            hint="Set the default again, or declare the new one in a migration.",
+            id=DRIFT,
+        )
+        for model, field, declared, current in drifted
+    ]
+
+
+def check_database(alias, cache):
+    """
+    :return: The warnings about the defaults of the database ``alias``
+    """
+    connection = connections[alias]
+    dialect = get_dialect(connection)
+    if dialect is None:
+        return []
+
+    current = fingerprint(connection, dialect)
+    if cache.matches(alias, current):
+        return []
+
+    loader = MigrationLoader(connection, ignore_no_migrations=True)
+    drifted = drifted_defaults(
+        declared_defaults(applied_state(loader), alias),
+        CatalogSnapshot.load(connection),
+    )
+    if not drifted and current is not None:
+        cache.save(alias, current)
+    return drift_warnings(drifted, alias)
+
+
+def check_default_drift(app_configs=None, databases=None, **kwargs):
+    """
+    Compare the declared defaults with the databases the check runs for.
+    """
+    cache = get_cache()
+    warnings = []
+    for alias in databases or ():
+        warnings += check_database(alias, cache)
+    return warnings
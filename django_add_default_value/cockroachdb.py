@@ -0,0 +1,181 @@
+# Copyright 2018 3YOURMIND GmbH
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+CockroachDB runs every ``ALTER TABLE`` as a schema change job of its own,
+which publishes a new version of the table descriptor and waits for every
+node to drop the old one. A migration setting defaults one operation at a
+time starts as many jobs on a table. Changing all defaults of a table in one
+statement makes it a single job per table, and the migration can wait for
+the jobs, which only start once it commits, to finish.
+"""
+
+from __future__ import unicode_literals
+import time
+
+from django.conf import settings
+from django.db import DatabaseError
+
+from .dialects import get_dialect
+from .pending import PendingDefaultsMixin
+
+DEFAULT_POLL_INTERVAL = 1.0
+
+# Statuses of jobs that are over without having succeeded
+FAILED_STATUSES = ("failed", "revert-failed", "canceled")
+
+
+class SchemaChangeJobError(DatabaseError):
+    """
+    A schema change job failed, or didn't finish in time.
+    """
+
+
+def get_job_timeout():
+    """
+    :return: The seconds to wait for the schema change jobs of a migration,
+             from the ``DADV_CRDB_JOB_TIMEOUT`` setting, or None to not wait
+    """
+    return getattr(settings, "DADV_CRDB_JOB_TIMEOUT", None)
+
+
+def unfinished_jobs(connection, dialect, table, since):
+    """
+    :return: ``(job id, status, error)`` 3-tuples of the schema change jobs on
+             ``table`` created since ``since`` that haven't succeeded yet
+    :raises SchemaChangeJobError: if one of them failed
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(dialect.schema_change_jobs_sql, [since, table])
+        jobs = cursor.fetchall()
+
+    for job_id, status, error in jobs:
+        if status in FAILED_STATUSES:
+            raise SchemaChangeJobError(
+                "The schema change job {job_id} on {table} {status}: {error}".format(
+                    job_id=job_id, table=table, status=status, error=error
+                )
+            )
+    return jobs
+
+
+def wait_for_jobs(connection, tables, since, timeout, interval=None):
+    """
+    Poll ``crdb_internal.jobs`` until the schema change jobs on ``tables``
+    created since ``since`` succeeded.
+
+    :param since: A timestamp of the server from before the jobs were created
+    :param timeout: The seconds to wait at most
+    :param interval: The seconds between polls. Defaults to the
+                     ``DADV_CRDB_JOB_POLL_INTERVAL`` setting or 1.
+    :raises SchemaChangeJobError: if a job failed, or the jobs still run after
+                                  ``timeout``
+    """
+    if interval is None:
+        interval = getattr(
+            settings, "DADV_CRDB_JOB_POLL_INTERVAL", DEFAULT_POLL_INTERVAL
+        )
+    dialect = get_dialect(connection)
+    deadline = time.time() + timeout
+    pending = list(tables)
+    while True:
+        pending = [
+            table
+            for table in pending
+            if unfinished_jobs(connection, dialect, table, since)
+        ]
+        if not pending:
+            return
+        if time.time() >= deadline:
+            raise SchemaChangeJobError(
+                "The schema change jobs on {tables} still run after {timeout}s.".format(
+                    tables=", ".join(pending), timeout=timeout
+                )
+            )
+        time.sleep(interval)
+
+
+class GroupedDefaultsMixin(PendingDefaultsMixin):
+    """
+    Collect the default changes of a migration and apply all changes to one
+    table with a single ``ALTER TABLE``: when the migration ends or right
+    before the next statement touching the table. The statement runs with the
+    ``lock_timeout`` and retries of the latest operation changing the table.
+    With the ``DADV_CRDB_JOB_TIMEOUT`` setting, wait for the jobs of these
+    statements after the migration commits.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(GroupedDefaultsMixin, self).__init__(*args, **kwargs)
+        # The latest operation per table, executing its statement
+        self.default_operations = {}
+        self.applying = 0
+        self.altered_tables = []
+        self.jobs_since = None
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        result = super(GroupedDefaultsMixin, self).__exit__(
+            exc_type, exc_value, traceback
+        )
+        if exc_type is None:
+            self.wait_for_jobs()
+        return result
+
+    def set_default_clauses(self, table, clauses, operation=None):
+        """
+        :param clauses: The ``ALTER TABLE`` clause per column, replacing the
+                        pending ones of the same columns
+        :param operation: The operation changing the defaults, whose
+                          ``execute()`` applies the lock timeout and retries
+        """
+        self.queue_defaults(table, clauses)
+        if operation is not None:
+            self.default_operations[table] = operation
+
+    def apply_defaults(self, table, model, clauses):
+        dialect = get_dialect(self.connection)
+        sql = dialect.alter_table_sql(table, list(clauses.values()))
+        operation = self.default_operations.pop(table, None)
+        self.remember_job(table)
+        self.applying += 1
+        try:
+            if operation is None:
+                self.execute(sql)
+            else:
+                operation.execute(self, sql)
+        finally:
+            self.applying -= 1
+
+    def flushes_pending_defaults(self):
+        # SET LOCAL lock_timeout around a grouped statement touches no table
+        return (
+            not self.applying
+            and super(GroupedDefaultsMixin, self).flushes_pending_defaults()
+        )
+
+    def remember_job(self, table):
+        if self.collect_sql:
+            return
+        if self.jobs_since is None:
+            with self.connection.cursor() as cursor:
+                cursor.execute("SELECT now()")
+                self.jobs_since = cursor.fetchone()[0]
+        if table not in self.altered_tables:
+            self.altered_tables.append(table)
+
+    def wait_for_jobs(self):
+        timeout = get_job_timeout()
+        if timeout is None or not self.altered_tables:
+            return
+        wait_for_jobs(self.connection, self.altered_tables, self.jobs_since, timeout)
+        self.altered_tables = []
@@ -0,0 +1,182 @@
+# Copyright 2018 3YOURMIND GmbH
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+The vendor helpers operations had before the vendor differences moved into
+:mod:`~django_add_default_value.dialects`, kept for code calling or
+overriding them. They delegate to the dialects and will be removed in a
+future release.
+"""
+
+from __future__ import unicode_literals
+import warnings
+
+from .dialects import (
+    NO_QUOTES,
+    VALUE_QUOTES,
+    CockroachDBDialect,
+    Dialect,
+    MSSQLDialect,
+    MySQLDialect,
+    PostgreSQLDialect,
+    get_dialect,
+    get_dialect_class,
+)
+
+
+def warn_deprecated(name, replacement):
+    warnings.warn(
+        "{name} is deprecated, use {replacement} instead.".format(
+            name=name, replacement=replacement
+        ),
+        DeprecationWarning,
+        stacklevel=3,
+    )
+
+
+def as_dialect(dialect, name):
+    """
+    :param dialect: A :class:`~.dialects.Dialect`, or a connection as passed
+                    before dialects existed
+    :return: The dialect, resolving the one of a connection
+    """
+    if dialect is None or isinstance(dialect, Dialect):
+        return dialect
+    warn_deprecated(
+        "Passing a connection to {name}()".format(name=name),
+        "get_dialect(connection)",
+    )
+    return get_dialect(dialect)
+
+
+def vendor_dialect(vendor):
+    """
+    :return: A dialect of ``vendor`` without a server version
+    """
+    dialect_class = get_dialect_class(vendor) or PostgreSQLDialect
+    return dialect_class()
+
+
+def is_vendor(vendor, dialect_class):
+    return get_dialect_class(vendor) is dialect_class
+
+
+class DeprecatedVendorHelpers(object):
+    """
+    The vendor helpers of :class:`~.AddDefaultValue`, now provided by
+    :func:`~.dialects.get_dialect`.
+    """
+
+    @property
+    def quotes(self):
+        warn_deprecated("AddDefaultValue.quotes", "get_dialect(connection)")
+        dialect = getattr(self, "_quotes_dialect", None) or PostgreSQLDialect()
+        return {
+            "value": VALUE_QUOTES,
+            "constant": NO_QUOTES,
+            "function": NO_QUOTES,
+            "name": dialect.name_quotes,
+        }
+
+    def set_quotes(self, vendor):
+        warn_deprecated("AddDefaultValue.set_quotes()", "get_dialect(connection)")
+        # Only this operation's quotes, they used to leak into all operations
+        self._quotes_dialect = vendor_dialect(vendor)
+
+    def initialize_vendor_state(self, schema_editor):
+        warn_deprecated(
+            "AddDefaultValue.initialize_vendor_state()", "get_dialect(connection)"
+        )
+        # Resolving a MySQL dialect patches quote_value
+        self._quotes_dialect = get_dialect(schema_editor.connection)
+
+    def quote_name(self, name):
+        warn_deprecated("AddDefaultValue.quote_name()", "Dialect.quote_name()")
+        dialect = getattr(self, "_quotes_dialect", None) or PostgreSQLDialect()
+        return dialect.quote_name(name)
+
+    def clean_value(self, vendor, value):
+        warn_deprecated("AddDefaultValue.clean_value()", "Dialect.clean_value()")
+        return vendor_dialect(vendor).clean_value(value)
+
+    def render_default(self, vendor, value):
+        warn_deprecated("AddDefaultValue.render_default()", "Dialect.render_default()")
+        return vendor_dialect(vendor).render_default(value)
+
+    @classmethod
+    def is_supported_vendor(cls, vendor):
+        warn_deprecated("AddDefaultValue.is_supported_vendor()", "get_dialect()")
+        return get_dialect_class(vendor) in (
+            PostgreSQLDialect,
+            CockroachDBDialect,
+            MySQLDialect,
+            MSSQLDialect,
+        )
+
+    @classmethod
+    def is_default_vendor(cls, vendor):
+        warn_deprecated("AddDefaultValue.is_default_vendor()", "get_dialect()")
+        return is_vendor(vendor, PostgreSQLDialect)
+
+    @classmethod
+    def is_mysql(cls, vendor):
+        warn_deprecated("AddDefaultValue.is_mysql()", "get_dialect()")
+        return is_vendor(vendor, MySQLDialect)
+
+    @classmethod
+    def is_postgresql(cls, vendor):
+        warn_deprecated("AddDefaultValue.is_postgresql()", "get_dialect()")
+        return is_vendor(vendor, PostgreSQLDialect)
+
+    @classmethod
+    def is_mssql(cls, vendor):
+        warn_deprecated("AddDefaultValue.is_mssql()", "get_dialect()")
+        return is_vendor(vendor, MSSQLDialect)
+
+    @classmethod
+    def is_cockroachdb(cls, vendor):
+        warn_deprecated("AddDefaultValue.is_cockroachdb()", "get_dialect()")
+        return is_vendor(vendor, CockroachDBDialect)
+
+    @classmethod
+    def is_postgresql_syntax_compatible(cls, vendor):
+        warn_deprecated(
+            "AddDefaultValue.is_postgresql_syntax_compatible()", "get_dialect()"
+        )
+        return is_vendor(vendor, PostgreSQLDialect) or is_vendor(
+            vendor, CockroachDBDialect
+        )
+
+    @classmethod
+    def is_mariadb(cls, connection):
+        warn_deprecated("AddDefaultValue.is_mariadb()", "MySQLDialect.is_mariadb")
+        return getattr(get_dialect(connection), "is_mariadb", False)
+
+    @classmethod
+    def mysql_version(cls, connection):
+        warn_deprecated(
+            "AddDefaultValue.mysql_version()", "MySQLDialect.server_version"
+        )
+        dialect = get_dialect(connection)
+        if not isinstance(dialect, MySQLDialect):
+            return None
+        return dialect.server_version
+
+    @classmethod
+    def can_have_default_for_text(cls, connection):
+        warn_deprecated(
+            "AddDefaultValue.can_have_default_for_text()",
+            "Dialect.supports_default_for_text",
+        )
+        dialect = get_dialect(connection)
+        return dialect is not None and dialect.supports_default_for_text
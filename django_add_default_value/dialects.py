@@ -0,0 +1,966 @@
+# Copyright 2018 3YOURMIND GmbH
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Everything that differs between the database vendors: quoting, value
+conversion, SQL templates and server capabilities.
+
+A dialect is resolved once per connection alias and probes the server version
+right then, so rendering many operations neither repeats the vendor checks nor
+touches the database again, and a dialect can be shared between threads that
+each have their own connection. Dialects can also be created without a
+connection for a declared server version.
+"""
+
+from __future__ import unicode_literals
+import threading
+from datetime import date
+
+import django
+from django.db.utils import NotSupportedError
+from django.utils.functional import cached_property
+
+from .functions import function_path, get_function
+
+NOW = "__NOW__"
+TODAY = "__TODAY__"
+
+VALUE_QUOTES = ("'", "'")
+NO_QUOTES = ("", "")
+
+_dialects = {}
+_dialects_lock = threading.Lock()
+
+# How a change touches the table: only its definition in the catalog, or
+# every row
+METADATA = "metadata"
+REWRITE = "rewrite"
+
+
+class Dialect(object):
+    """
+    The SQL flavour and capabilities of one database server.
+
+    :param server_version: The server version as a tuple, or None if unknown
+    """
+
+    vendor = None
+    name_quotes = ('"', '"')
+
+    alter_table_template = "ALTER TABLE {table} {clauses};"
+    set_default_template = "ALTER COLUMN {column} SET DEFAULT {default}"
+    drop_default_template = "ALTER COLUMN {column} DROP DEFAULT"
+    add_column_default_template = "DEFAULT {default}"
+    catalog_columns_sql = (
+        "SELECT table_name, column_name, column_default "
+        "FROM information_schema.columns "
+        "WHERE table_schema = current_schema()"
+    )
+    # One value that changes whenever a column default of the current schema
+    # changes, computed by the server, or None if there is no cheap way
+    defaults_fingerprint_sql = (
+        "SELECT md5(string_agg("
+        "table_name || '.' || column_name || '=' || column_default, ',' "
+        "ORDER BY table_name, column_name)) "
+        "FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND column_default IS NOT NULL"
+    )
+
+    supports_lock_timeout = False
+    supports_add_column_default = True
+    # Whether rows can be streamed with COPY FROM STDIN
+    supports_copy = False
+    # Whether tables can be qualified with a schema and one execute() can
+    # run several statements
+    supports_schemas = False
+    # Whether tables can have child tables, partitions or inheriting tables,
+    # that are altered along with them unless ONLY is given
+    supports_partitions = False
+    # Whether defaults are part of the table definition, which can only be
+    # changed by rebuilding the table
+    remakes_table = False
+    # Whether defaults are named constraints, which have to be dropped before
+    # their column
+    has_default_constraints = False
+    supports_default_for_text = True
+    supports_today = True
+    # Whether the catalog shows literal defaults in quotes
+    quotes_literal_defaults = True
+    # Whether defaults can be expressions besides literals and CURRENT_TIMESTAMP
+    supports_expression_defaults = True
+    # The lock changing the table definition takes
+    alter_table_lock = "ACCESS EXCLUSIVE"
+
+    def __init__(self, server_version=None):
+        self.server_version = server_version and tuple(server_version)
+
+    def __repr__(self):
+        return "<{name} {version}>".format(
+            name=self.__class__.__name__, version=self.server_version
+        )
+
+    @classmethod
+    def from_connection(cls, connection):
+        """
+        Create the dialect for the server behind ``connection``.
+        """
+        return cls(server_version=cls.probe_server_version(connection))
+
+    @classmethod
+    def probe_server_version(cls, connection):
+        return None
+
+    def quote_name(self, name):
+        return "{start}{name}{end}".format(
+            name=name, start=self.name_quotes[0], end=self.name_quotes[1]
+        )
+
+    def quote_table(self, table, schema=None, only=False):
+        """
+        :param only: Leave out the child tables of ``table``
+        :return: The quoted name of ``table``, qualified with ``schema`` if
+                 given
+        """
+        quoted = self.quote_name(table)
+        if schema is not None:
+            quoted = "{schema}.{table}".format(
+                schema=self.quote_name(schema), table=quoted
+            )
+        if only:
+            quoted = "ONLY {table}".format(table=quoted)
+        return quoted
+
+    def clean_value(self, value):
+        """
+        Lie, cheat and apply plastic surgery where needed
+
+        :param value: the value as provided in the migration
+        :return: a 2-tuple containing the new value and the quotation to use
+        """
+        if isinstance(value, bool):
+            return self.clean_bool(value), VALUE_QUOTES
+
+        if isinstance(value, date):
+            return value.isoformat(), VALUE_QUOTES
+
+        if value == NOW or value == TODAY:
+            return self.clean_temporal_constant(value)
+
+        if callable(value):
+            return self.clean_function(value)
+
+        return value, VALUE_QUOTES
+
+    def clean_bool(self, value):
+        return 1 if value else 0
+
+    def clean_temporal_constant(self, value):
+        return value, VALUE_QUOTES
+
+    def clean_function(self, function):
+        """
+        :raises NotSupportedError: if the server cannot generate the values
+                                   of ``function``
+        """
+        sql = self.function_sql(function)
+        if sql is None:
+            raise NotSupportedError(
+                "{vendor} has no SQL function for {function}.".format(
+                    vendor=self.vendor, function=function_path(function)
+                )
+            )
+        return sql, NO_QUOTES
+
+    def function_sql(self, function):
+        """
+        :return: The SQL expression generating the values of ``function``,
+                 or None if there is none for this server
+        """
+        sql_function = get_function(function)
+        return sql_function and sql_function.as_sql(self)
+
+    def render_default(self, value):
+        """
+        :return: ``value`` as it appears in a ``DEFAULT`` clause
+        """
+        sql_value, quotes = self.clean_value(value)
+        return "{start}{value}{end}".format(
+            value=sql_value, start=quotes[0], end=quotes[1]
+        )
+
+    def set_defaults_sql(self, table, defaults, options=(), schema=None, only=False):
+        """
+        :param defaults: ``(column, constraint name, value)`` 3-tuples
+        :param options: Additional clauses for the ``ALTER TABLE``
+        :param schema: The schema of ``table``, if not the current one
+        :param only: Leave the child tables of ``table`` alone
+        """
+        return self.alter_table_sql(
+            table, self.set_default_clauses(defaults) + list(options), schema, only
+        )
+
+    def drop_defaults_sql(self, table, defaults, options=(), schema=None, only=False):
+        """
+        :param defaults: ``(column, constraint name)`` 2-tuples
+        :param options: Additional clauses for the ``ALTER TABLE``
+        :param schema: The schema of ``table``, if not the current one
+        :param only: Leave the child tables of ``table`` alone
+        """
+        return self.alter_table_sql(
+            table, self.drop_default_clauses(defaults) + list(options), schema, only
+        )
+
+    def set_default_clauses(self, defaults):
+        """
+        :param defaults: ``(column, constraint name, value)`` 3-tuples
+        :return: The ``ALTER TABLE`` clauses setting ``defaults``
+        """
+        return [
+            self.set_default_template.format(
+                column=self.quote_name(column), default=self.render_default(value)
+            )
+            for column, __, value in defaults
+        ]
+
+    def drop_default_clauses(self, defaults):
+        """
+        :param defaults: ``(column, constraint name)`` 2-tuples
+        :return: The ``ALTER TABLE`` clauses dropping ``defaults``
+        """
+        return [
+            self.drop_default_template.format(column=self.quote_name(column))
+            for column, __ in defaults
+        ]
+
+    def alter_table_sql(self, table, clauses, schema=None, only=False):
+        return self.alter_table_template.format(
+            table=self.quote_table(table, schema, only), clauses=", ".join(clauses)
+        )
+
+    def add_column_default_sql(self, constraint_name, value):
+        """
+        :return: The clause giving a column its default in ``ADD COLUMN``
+        """
+        return self.add_column_default_template.format(
+            constraint_name=self.quote_name(constraint_name),
+            default=self.render_default(value),
+        )
+
+    def alter_table_options(self, algorithm=None, lock=None):
+        """
+        :return: The clauses selecting how the server alters the table
+        """
+        return []
+
+    # Whether making a column NOT NULL restates its type
+    not_null_needs_definition = False
+
+    def set_not_null_sql(
+        self, table, column, check_name, definition, default, options=()
+    ):
+        """
+        :param check_name: The name of a temporary ``CHECK`` constraint
+        :param definition: The type of ``column``
+        :param default: The default of ``column`` as it follows ``DEFAULT``,
+                        None if it has none
+        :param options: The clauses of :meth:`not_null_options`
+        :return: The statements making ``column`` NOT NULL, to be run one
+                 after the other, or None if the schema editor of Django has
+                 to alter the column
+        """
+        return None
+
+    def drop_not_null_sql(self, table, column, definition, default, options=()):
+        """
+        :return: The statements making ``column`` nullable again, or None if
+                 the schema editor of Django has to alter the column
+        """
+        return None
+
+    def not_null_options(self, algorithm=None, lock=None, online=False):
+        """
+        :param online: Whether the server can alter the column online, when
+                       it can't tell by itself
+        :return: The clauses selecting how the server makes a column NOT NULL
+        """
+        return []
+
+    def set_not_null_cost(self, lock=None, online=False):
+        """
+        :return: How making a column NOT NULL touches the table, the lock it
+                 takes and why, as a 3-tuple
+        """
+        return REWRITE, self.alter_table_lock, "every row is checked under the lock"
+
+    def supports_instant_add_column(self):
+        return False
+
+    def rewrites_table_on_add_column(self):
+        """
+        Tell whether adding a column with a constant default rewrites all
+        rows instead of only changing the table metadata.
+        """
+        return False
+
+    def set_default_cost(self, algorithm=None, lock=None):
+        """
+        :return: How setting or dropping a column default touches the table,
+                 the lock it takes and why, as a 3-tuple
+        """
+        return METADATA, self.alter_table_lock, "only the table definition changes"
+
+    def add_column_cost(self, volatile=False, indexed=False, lock=None):
+        """
+        :param volatile: Whether the default differs per row
+        :param indexed: Whether an index is built with the column
+        :return: How adding a column with a default touches the table, the
+                 lock it takes and why, as a 3-tuple
+        """
+        if volatile:
+            return REWRITE, self.alter_table_lock, "every row gets its own default"
+        if self.rewrites_table_on_add_column():
+            return (
+                REWRITE,
+                self.alter_table_lock,
+                "the server writes the default into every row",
+            )
+        return METADATA, self.alter_table_lock, "only the table definition changes"
+
+    def row_count_sql(self, table):
+        """
+        :return: The statement and parameters estimating the number of rows
+                 of ``table`` from the statistics of the catalog, or None if
+                 the catalog keeps none
+        """
+        return None
+
+    def normalize_catalog_default(self, default):
+        return default.strip()
+
+
+class PostgreSQLDialect(Dialect):
+    vendor = "postgresql"
+    supports_lock_timeout = True
+    supports_copy = True
+    supports_schemas = True
+    supports_partitions = True
+
+    lock_timeout_template = "SET LOCAL lock_timeout = '{lock_timeout}ms'"
+    # Only reads the defaults, not every column
+    defaults_fingerprint_sql = (
+        "SELECT md5(string_agg("
+        "c.relname || '.' || a.attname || '=' || pg_get_expr(d.adbin, d.adrelid), "
+        "',' ORDER BY c.relname, a.attname)) "
+        "FROM pg_attrdef d "
+        "JOIN pg_class c ON c.oid = d.adrelid "
+        "JOIN pg_attribute a ON a.attrelid = d.adrelid AND a.attnum = d.adnum "
+        "WHERE c.relnamespace = "
+        "(SELECT oid FROM pg_namespace WHERE nspname = current_schema())"
+    )
+    reset_lock_timeout_sql = "SET LOCAL lock_timeout TO DEFAULT"
+
+    @classmethod
+    def probe_server_version(cls, connection):
+        pg_version = getattr(connection, "pg_version", None)
+        if pg_version is None:
+            return None
+        return pg_version // 10000, pg_version // 100 % 100, pg_version % 100
+
+    def clean_bool(self, value):
+        return value
+
+    def clean_temporal_constant(self, value):
+        return "now()", NO_QUOTES
+
+    def rewrites_table_on_add_column(self):
+        return self.server_version is not None and self.server_version < (11,)
+
+    def lock_timeout_sql(self, lock_timeout):
+        return self.lock_timeout_template.format(lock_timeout=int(lock_timeout))
+
+    def uses_not_null_check(self):
+        """
+        PostgreSQL 12 skips the scan of ``SET NOT NULL`` when a validated
+        ``CHECK`` constraint already proves the column has no NULLs.
+        Validating the constraint only takes a SHARE UPDATE EXCLUSIVE lock,
+        which doesn't block reads and writes.
+        """
+        return self.server_version is None or self.server_version >= (12,)
+
+    def set_not_null_sql(
+        self, table, column, check_name, definition, default, options=()
+    ):
+        set_not_null = "ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL;"
+        if not self.uses_not_null_check():
+            statements = [set_not_null]
+        else:
+            statements = [
+                "ALTER TABLE {table} ADD CONSTRAINT {check} "
+                "CHECK ({column} IS NOT NULL) NOT VALID;",
+                "ALTER TABLE {table} VALIDATE CONSTRAINT {check};",
+                set_not_null,
+                "ALTER TABLE {table} DROP CONSTRAINT {check};",
+            ]
+        return [
+            statement.format(
+                table=self.quote_name(table),
+                column=self.quote_name(column),
+                check=self.quote_name(check_name),
+            )
+            for statement in statements
+        ]
+
+    def drop_not_null_sql(self, table, column, definition, default, options=()):
+        return [
+            "ALTER TABLE {table} ALTER COLUMN {column} DROP NOT NULL;".format(
+                table=self.quote_name(table), column=self.quote_name(column)
+            )
+        ]
+
+    def set_not_null_cost(self, lock=None, online=False):
+        if not self.uses_not_null_check():
+            return super(PostgreSQLDialect, self).set_not_null_cost(lock, online)
+        return (
+            REWRITE,
+            "SHARE UPDATE EXCLUSIVE",
+            "a NOT VALID check is validated without blocking writes",
+        )
+
+    # The partitions and inheriting tables below a table, parents first
+    child_tables_sql = (
+        "WITH RECURSIVE children (oid, depth) AS ("
+        "SELECT inhrelid, 1 FROM pg_inherits "
+        "WHERE inhparent = to_regclass(quote_ident(%s)) "
+        "UNION ALL "
+        "SELECT i.inhrelid, c.depth + 1 FROM pg_inherits i "
+        "JOIN children c ON i.inhparent = c.oid) "
+        "SELECT n.nspname, r.relname FROM children c "
+        "JOIN pg_class r ON r.oid = c.oid "
+        "JOIN pg_namespace n ON n.oid = r.relnamespace "
+        "ORDER BY c.depth, n.nspname, r.relname"
+    )
+
+    def row_count_sql(self, table):
+        # reltuples is -1 for tables that were never vacuumed or analyzed
+        return (
+            "SELECT reltuples FROM pg_class WHERE oid = to_regclass(quote_ident(%s))",
+            [table],
+        )
+
+
+class CockroachDBDialect(PostgreSQLDialect):
+    vendor = "cockroachdb"
+    # COPY only accepts a subset of the PostgreSQL options and types
+    supports_copy = False
+    # Schema changes in multi-statement transactions aren't atomic
+    supports_schemas = False
+    # Partitions are ranges of one table, not tables of their own
+    supports_partitions = False
+    # Schema changes run as background jobs, without blocking writes
+    alter_table_lock = "ONLINE"
+
+    # pg_attrdef is only partly filled in
+    defaults_fingerprint_sql = Dialect.defaults_fingerprint_sql
+
+    # The schema change jobs on a table started since a given time that
+    # haven't succeeded yet
+    schema_change_jobs_sql = (
+        "SELECT job_id, status, error FROM crdb_internal.jobs "
+        "WHERE job_type IN ('SCHEMA CHANGE', 'NEW SCHEMA CHANGE') "
+        "AND created >= %s "
+        "AND to_regclass(quote_ident(%s))::INT8 = ANY (descriptor_ids) "
+        "AND status NOT IN ('succeeded', 'canceled')"
+    )
+
+    @classmethod
+    def probe_server_version(cls, connection):
+        # pg_version is the PostgreSQL version CockroachDB claims to speak
+        return None
+
+    def add_column_cost(self, volatile=False, indexed=False, lock=None):
+        return REWRITE, self.alter_table_lock, "a job backfills every row"
+
+    def uses_not_null_check(self):
+        # SET NOT NULL is a job validating a NOT VALID check by itself
+        return False
+
+    def set_not_null_cost(self, lock=None, online=False):
+        return REWRITE, self.alter_table_lock, "a job checks every row"
+
+    def row_count_sql(self, table):
+        return (
+            "SELECT estimated_row_count FROM crdb_internal.table_row_statistics "
+            "WHERE table_name = %s",
+            [table],
+        )
+
+
+class MySQLDialect(Dialect):
+    vendor = "mysql"
+    name_quotes = ("`", "`")
+    supports_today = False
+    not_null_needs_definition = True
+    catalog_columns_sql = (
+        "SELECT TABLE_NAME, COLUMN_NAME, COLUMN_DEFAULT "
+        "FROM information_schema.COLUMNS "
+        "WHERE TABLE_SCHEMA = DATABASE()"
+    )
+    # GROUP_CONCAT is cut off at group_concat_max_len, a sum of checksums isn't
+    defaults_fingerprint_sql = (
+        "SELECT CONCAT(COUNT(*), '-', "
+        "SUM(CRC32(CONCAT_WS('.', TABLE_NAME, COLUMN_NAME, COLUMN_DEFAULT)))) "
+        "FROM information_schema.COLUMNS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND COLUMN_DEFAULT IS NOT NULL"
+    )
+    quotes_literal_defaults = False
+
+    def __init__(self, server_version=None, is_mariadb=False):
+        super(MySQLDialect, self).__init__(server_version)
+        self.is_mariadb = is_mariadb
+
+    def __repr__(self):
+        return "<{name} {version}{mariadb}>".format(
+            name=self.__class__.__name__,
+            version=self.server_version,
+            mariadb=" MariaDB" if self.is_mariadb else "",
+        )
+
+    @classmethod
+    def from_connection(cls, connection):
+        return cls(
+            server_version=cls.probe_server_version(connection),
+            is_mariadb=cls.probe_is_mariadb(connection),
+        )
+
+    @classmethod
+    def probe_server_version(cls, connection):
+        """
+        :return: The server version as a 3-tuple, or None if the connection
+                 does not tell
+        """
+        if not hasattr(connection, "mysql_version"):
+            return None
+
+        # noinspection PyUnresolvedReferences
+        try:  # see if we need to calculate the version
+            return tuple(connection.mysql_version())
+        except TypeError:  # if it is already calculated, then it can't be called
+            return tuple(connection.mysql_version)
+
+    @classmethod
+    def probe_is_mariadb(cls, connection):
+        is_mariadb = getattr(connection, "mysql_is_mariadb", False)
+        if callable(is_mariadb):
+            return is_mariadb()
+        return is_mariadb
+
+    @cached_property
+    def supports_default_for_text(self):
+        """
+        MySQL has not allowed DEFAULT for BLOB and TEXT fields since the
+        beginning of time, but it is changing:
+
+            Before MariaDB 10.2.1, BLOB and TEXT columns could not be assigned
+            a DEFAULT value. This restriction was lifted in MariaDB 10.2.1.
+
+        Oracle does not yet have a version available that supports it,
+        quoting the `documentation
+        <https://dev.mysql.com/doc/refman/8.0/en/blob.html>`_:
+
+            BLOB and TEXT columns cannot have DEFAULT values.
+        """
+        return (
+            self.is_mariadb
+            and self.server_version is not None
+            and self.server_version >= (10, 2, 1)
+        )
+
+    def clean_temporal_constant(self, value):
+        # https://stackoverflow.com/a/20461045/10000573
+        if value == NOW:
+            return "CURRENT_TIMESTAMP", NO_QUOTES
+        return value, VALUE_QUOTES
+
+    @cached_property
+    def supports_expression_defaults(self):
+        """
+        MySQL 8.0.13 and MariaDB 10.2.1 accept expressions in parentheses as
+        defaults.
+        """
+        return self.server_version is None or self.server_version >= (
+            (10, 2, 1) if self.is_mariadb else (8, 0, 13)
+        )
+
+    @cached_property
+    def instant_version(self):
+        return (10, 3, 2) if self.is_mariadb else (8, 0, 12)
+
+    @cached_property
+    def inplace_version(self):
+        return (10, 0, 0) if self.is_mariadb else (5, 6, 0)
+
+    def supports_instant_add_column(self):
+        """
+        MySQL 8.0.12 and MariaDB 10.3.2 can add a column by only changing the
+        table metadata.
+        """
+        return (
+            self.server_version is not None
+            and self.server_version >= self.instant_version
+        )
+
+    def rewrites_table_on_add_column(self):
+        return not self.supports_instant_add_column()
+
+    def supported_algorithm(self, algorithm):
+        """
+        :raises NotSupportedError: if the server can only change the default
+                                   by copying the table
+        """
+        if self.server_version is None:
+            return algorithm
+
+        if algorithm == "INSTANT" and self.server_version >= self.instant_version:
+            return "INSTANT"
+        if self.server_version >= self.inplace_version:
+            return "INPLACE"
+
+        raise NotSupportedError(
+            "MySQL {version} can only change a column default by copying the "
+            "table.".format(version=".".join(str(part) for part in self.server_version))
+        )
+
+    def copies_table(self):
+        """
+        Tell whether the server knows no online DDL and alters every table by
+        copying it.
+        """
+        return (
+            self.server_version is not None
+            and self.server_version < self.inplace_version
+        )
+
+    def set_default_cost(self, algorithm=None, lock=None):
+        if self.copies_table():
+            return REWRITE, "SHARED", "the server copies the table"
+        return METADATA, (lock or "NONE").upper(), "only the table definition changes"
+
+    def add_column_cost(self, volatile=False, indexed=False, lock=None):
+        if self.copies_table():
+            return REWRITE, "SHARED", "the server copies the table"
+        if volatile or indexed or not self.supports_instant_add_column():
+            return (
+                REWRITE,
+                (lock or "NONE").upper(),
+                "the table is rebuilt in place, there is no instant ADD COLUMN",
+            )
+        return METADATA, "NONE", "the column is added instantly"
+
+    def set_not_null_sql(
+        self, table, column, check_name, definition, default, options=()
+    ):
+        return [
+            self.modify_column_sql(
+                table, column, definition, "NOT NULL", default, options
+            )
+        ]
+
+    def drop_not_null_sql(self, table, column, definition, default, options=()):
+        return [
+            self.modify_column_sql(table, column, definition, "NULL", default, options)
+        ]
+
+    def modify_column_sql(self, table, column, definition, null, default, options):
+        # MODIFY replaces the whole column definition, default included
+        clauses = [
+            "MODIFY {column} {definition} {null}".format(
+                column=self.quote_name(column), definition=definition, null=null
+            )
+        ]
+        if default is not None:
+            clauses[0] += " DEFAULT {default}".format(default=default)
+        return self.alter_table_sql(table, clauses + list(options))
+
+    def not_null_options(self, algorithm=None, lock=None, online=False):
+        """
+        The column is rebuilt in place while reads and writes go on, unless
+        the operation asks for something else. Servers without online DDL
+        copy the table anyway.
+        """
+        if self.copies_table():
+            return []
+        return self.alter_table_options(algorithm or "INPLACE", lock or "NONE")
+
+    def set_not_null_cost(self, lock=None, online=False):
+        if self.copies_table():
+            return REWRITE, "SHARED", "the server copies the table"
+        return REWRITE, (lock or "NONE").upper(), "the table is rebuilt in place"
+
+    def row_count_sql(self, table):
+        return (
+            "SELECT TABLE_ROWS FROM information_schema.TABLES "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+            [table],
+        )
+
+    def alter_table_options(self, algorithm=None, lock=None):
+        """
+        An explicit algorithm makes MySQL refuse the statement instead of
+        silently falling back to copying the table. ``INSTANT`` is lowered to
+        ``INPLACE`` on servers that do not know it yet.
+        """
+        clauses = []
+        if algorithm:
+            algorithm = self.supported_algorithm(algorithm.upper())
+            clauses.append("ALGORITHM={algorithm}".format(algorithm=algorithm))
+        # MySQL only accepts the default lock level for instant changes, which
+        # take no lock besides the metadata lock anyway.
+        if lock and not (algorithm == "INSTANT" and not self.is_mariadb):
+            clauses.append("LOCK={lock}".format(lock=lock.upper()))
+
+        return clauses
+
+
+class MSSQLDialect(Dialect):
+    vendor = "microsoft"
+    name_quotes = ("[", "]")
+    has_default_constraints = True
+    alter_table_lock = "SCH-M"
+    not_null_needs_definition = True
+
+    alter_table_template = "ALTER TABLE {table} {clauses}"
+    set_default_template = "CONSTRAINT {constraint_name} DEFAULT {default} FOR {column}"
+    add_column_default_template = "CONSTRAINT {constraint_name} DEFAULT {default}"
+    catalog_columns_sql = (
+        "SELECT t.name, c.name, d.definition "
+        "FROM sys.columns c "
+        "JOIN sys.tables t ON t.object_id = c.object_id "
+        "LEFT JOIN sys.default_constraints d "
+        "ON d.parent_object_id = c.object_id AND d.parent_column_id = c.column_id "
+        "WHERE t.schema_id = SCHEMA_ID()"
+    )
+    defaults_fingerprint_sql = (
+        "SELECT CONCAT(COUNT(*), '-', "
+        "CHECKSUM_AGG(CHECKSUM(t.name, c.name, d.definition))) "
+        "FROM sys.default_constraints d "
+        "JOIN sys.tables t ON t.object_id = d.parent_object_id "
+        "JOIN sys.columns c "
+        "ON c.object_id = d.parent_object_id AND c.column_id = d.parent_column_id "
+        "WHERE t.schema_id = SCHEMA_ID()"
+    )
+
+    def clean_temporal_constant(self, value):
+        return "GETDATE()", NO_QUOTES
+
+    def set_defaults_sql(self, table, defaults, options=(), schema=None, only=False):
+        clauses = [
+            self.set_default_template.format(
+                constraint_name=self.quote_name(constraint_name),
+                default=self.render_default(value),
+                column=self.quote_name(column),
+            )
+            for column, constraint_name, value in defaults
+        ]
+        return "ALTER TABLE {table} ADD {clauses};".format(
+            table=self.quote_table(table, schema), clauses=", ".join(clauses)
+        )
+
+    def drop_defaults_sql(self, table, defaults, options=(), schema=None, only=False):
+        return "ALTER TABLE {table} DROP CONSTRAINT {constraint_names}".format(
+            table=self.quote_table(table, schema),
+            constraint_names=", ".join(
+                self.quote_name(constraint_name) for __, constraint_name in defaults
+            ),
+        )
+
+    def set_not_null_sql(
+        self, table, column, check_name, definition, default, options=()
+    ):
+        return [self.alter_column_sql(table, column, definition, "NOT NULL", options)]
+
+    def drop_not_null_sql(self, table, column, definition, default, options=()):
+        return [self.alter_column_sql(table, column, definition, "NULL", options)]
+
+    def alter_column_sql(self, table, column, definition, null, options):
+        # The default is a constraint of its own, which stays
+        sql = "ALTER TABLE {table} ALTER COLUMN {column} {definition} {null}".format(
+            table=self.quote_name(table),
+            column=self.quote_name(column),
+            definition=definition,
+            null=null,
+        )
+        if options:
+            sql += " WITH ({options})".format(options=", ".join(options))
+        return sql
+
+    def not_null_options(self, algorithm=None, lock=None, online=False):
+        # Only the Enterprise Edition alters columns online, the edition is
+        # not probed
+        return ["ONLINE = ON"] if online else []
+
+    def set_not_null_cost(self, lock=None, online=False):
+        if online:
+            return REWRITE, "NONE", "every row is checked online"
+        return super(MSSQLDialect, self).set_not_null_cost(lock, online)
+
+    def add_column_cost(self, volatile=False, indexed=False, lock=None):
+        # Only the Enterprise Edition adds NOT NULL columns with a constant
+        # default as a metadata change, the edition is not probed.
+        return (
+            REWRITE,
+            self.alter_table_lock,
+            "only the Enterprise Edition adds the column without writing rows",
+        )
+
+    def row_count_sql(self, table):
+        return (
+            "SELECT SUM(rows) FROM sys.partitions "
+            "WHERE object_id = OBJECT_ID(%s) AND index_id IN (0, 1)",
+            [table],
+        )
+
+    def normalize_catalog_default(self, default):
+        default = default.strip()
+        while default[:1] == "(" and default[-1:] == ")":
+            default = default[1:-1].strip()
+        return default
+
+
+class SQLiteDialect(Dialect):
+    vendor = "sqlite"
+    remakes_table = True
+    # Django rebuilds the table to add a column, so there is nothing to gain
+    supports_add_column_default = False
+    catalog_columns_sql = (
+        "SELECT m.name, p.name, p.dflt_value "
+        "FROM sqlite_master m JOIN pragma_table_info(m.name) p "
+        "WHERE m.type = 'table'"
+    )
+    # Counts every change of the schema
+    defaults_fingerprint_sql = "SELECT schema_version FROM pragma_schema_version"
+
+    # Rebuilding a table locks the whole database for writing
+    alter_table_lock = "EXCLUSIVE"
+
+    @classmethod
+    def probe_server_version(cls, connection):
+        # Python can be built without sqlite3, only import it when it is used
+        import sqlite3
+
+        return sqlite3.sqlite_version_info
+
+    def set_default_cost(self, algorithm=None, lock=None):
+        return REWRITE, self.alter_table_lock, "the table is rebuilt"
+
+    def add_column_cost(self, volatile=False, indexed=False, lock=None):
+        return REWRITE, self.alter_table_lock, "the table is rebuilt"
+
+    def set_not_null_cost(self, lock=None, online=False):
+        return REWRITE, self.alter_table_lock, "the table is rebuilt"
+
+    def row_count_sql(self, table):
+        # There are no statistics to estimate from without ANALYZE
+        return "SELECT COUNT(*) FROM {table}".format(table=self.quote_name(table)), []
+
+    def clean_temporal_constant(self, value):
+        if value == NOW:
+            return "CURRENT_TIMESTAMP", NO_QUOTES
+        return "CURRENT_DATE", NO_QUOTES
+
+
+DIALECTS = (
+    ("postgre", PostgreSQLDialect),
+    ("cockroachdb", CockroachDBDialect),
+    ("mysql", MySQLDialect),
+    ("microsoft", MSSQLDialect),
+    ("sqlite", SQLiteDialect),
+)
+
+
+def get_dialect_class(vendor):
+    """
+    :return: The dialect class for the connection vendor string, or None if
+             the vendor isn't supported
+    """
+    for prefix, dialect_class in DIALECTS:
+        if vendor.startswith(prefix):
+            return dialect_class
+    return None
+
+
+def get_dialect(connection):
+    """
+    Return the dialect of ``connection``, resolving it once per alias.
+    Resolving a dialect probes the server version.
+
+    :return: A :class:`Dialect`, or None if the vendor isn't supported
+    """
+    key = (connection.alias, connection.vendor)
+    dialect = _dialects.get(key)
+    if dialect is not None:
+        return dialect
+
+    with _dialects_lock:
+        if key not in _dialects:
+            dialect_class = get_dialect_class(connection.vendor)
+            _dialects[key] = dialect_class and dialect_class.from_connection(connection)
+            if dialect_class is MySQLDialect:
+                patch_quote_value(connection)
+        return _dialects[key]
+
+
+def reset_dialects():
+    """
+    Forget all resolved dialects, for instance after the servers have been
+    upgraded.
+    """
+    with _dialects_lock:
+        _dialects.clear()
+
+
+def patch_quote_value(connection):
+    """
+    Replace the broken ``quote_value`` of the MySQL schema editor of some
+    Django versions, once for the whole process.
+    """
+    major, minor, patch, __, ___ = django.VERSION
+    schema_editor_class = getattr(connection, "SchemaEditorClass", None)
+    if (
+        schema_editor_class is not None
+        and version_with_broken_quote_value(major, minor, patch)
+        and not hasattr(schema_editor_class, "_patched_quote_value")
+    ):
+        schema_editor_class.quote_value = quote_value
+        schema_editor_class._patched_quote_value = True
+
+
+def version_with_broken_quote_value(major, minor, patch):
+    if major == 2:
+        if minor == 1 and patch < 9:
+            return True
+        elif minor == 2 and patch < 2:
+            return True
+
+    return False
+
+
+def quote_value(self, value):
+    self.connection.ensure_connection()
+
+    # MySQLdb escapes to string, PyMySQL to bytes.
+    quoted = self.connection.connection.escape(
+        value, self.connection.connection.encoders
+    )
+    if isinstance(value, str) and isinstance(quoted, bytes):
+        quoted = quoted.decode()
+    return quoted
@@ -0,0 +1,66 @@
+# Copyright 2018 3YOURMIND GmbH
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import unicode_literals
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+
+DEFAULT_WORKERS = 8
+
+
+def get_workers(workers=None, items=None):
+    """
+    :return: ``workers``, falling back to the ``DADV_WORKERS`` setting, but
+             never more than there are ``items``
+    """
+    workers = workers or getattr(settings, "DADV_WORKERS", DEFAULT_WORKERS)
+    if items is not None:
+        workers = min(workers, len(items))
+    return max(workers, 1)
+
+
+def fan_out(function, items, workers=None, callback=None):
+    """
+    Call ``function`` with every item of ``items`` on a pool of at most
+    ``workers`` threads, so the whole run takes about as long as the slowest
+    call.
+
+    Errors are collected instead of raised, so one failing item doesn't stop
+    the others. ``function`` must be thread-safe: running SQL on
+    ``connections[alias]`` is, running migrations isn't, start a process for
+    those.
+
+    :param callback: Called with every ``(item, result, error)`` 3-tuple as
+                     soon as it is available
+    :return: ``(item, result, error)`` 3-tuples, in the order of ``items``
+    """
+    items = list(items)
+    if not items:
+        return []
+
+    with ThreadPoolExecutor(max_workers=get_workers(workers, items)) as executor:
+        return list(
+            executor.map(partial(call_safely, function, callback=callback), items)
+        )
+
+
+def call_safely(function, item, callback=None):
+    try:
+        outcome = (item, function(item), None)
+    except Exception as exc:
+        outcome = (item, None, exc)
+    if callback is not None:
+        callback(*outcome)
+    return outcome
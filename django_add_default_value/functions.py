@@ -0,0 +1,157 @@
+# Copyright 2018 3YOURMIND GmbH
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+The SQL functions standing in for Python callables used as field defaults,
+such as ``uuid.uuid4`` or ``timezone.now``, so the database generates the
+values of inserted rows instead of Python.
+
+Every callable is registered with its SQL expression per vendor. A vendor
+without an expression falls back to the one of the vendor its dialect derives
+from, so CockroachDB uses the PostgreSQL expression unless it has its own::
+
+    register_function(
+        make_code,
+        postgresql="make_code()",
+        mysql=lambda dialect: "(make_code())",
+        volatile=True,
+    )
+
+An expression may also be a callable taking the dialect and returning the
+expression, or None if that server cannot generate the value.
+"""
+
+from __future__ import unicode_literals
+import uuid
+
+from django.utils import timezone
+
+_functions = {}
+
+
+class SQLFunction(object):
+    """
+    The SQL expressions of a Python callable.
+
+    :param expressions: The expressions by dialect vendor
+    :param volatile: Whether the expression gives every row its own value
+    """
+
+    def __init__(self, function, expressions, volatile=False):
+        self.function = function
+        self.expressions = expressions
+        self.volatile = volatile
+
+    def __repr__(self):
+        return "<SQLFunction {path}>".format(path=function_path(self.function))
+
+    def as_sql(self, dialect):
+        """
+        :return: The expression for ``dialect``, or None if it has none
+        """
+        for dialect_class in type(dialect).__mro__:
+            vendor = getattr(dialect_class, "vendor", None)
+            if vendor in self.expressions:
+                expression = self.expressions[vendor]
+                return expression(dialect) if callable(expression) else expression
+        return None
+
+
+def register_function(function, volatile=False, **expressions):
+    """
+    Let ``function`` be used as a default value, replacing an earlier
+    registration. Register your own functions in the ``ready()`` method of an
+    app config, so they are known before the migrations are loaded.
+
+    :param expressions: The SQL expression per dialect vendor:
+                        ``postgresql``, ``cockroachdb``, ``mysql``,
+                        ``microsoft`` or ``sqlite``
+    :return: ``function``
+    """
+    _functions[function] = SQLFunction(function, expressions, volatile)
+    return function
+
+
+def unregister_function(function):
+    _functions.pop(function, None)
+
+
+def get_function(function):
+    """
+    :return: The :class:`SQLFunction` of ``function``, or None if it isn't
+             registered
+    """
+    return _functions.get(function)
+
+
+def function_path(function):
+    """
+    :return: The dotted path of ``function``, as written in migrations
+    """
+    return "{module}.{name}".format(
+        module=function.__module__,
+        name=getattr(function, "__qualname__", function.__name__),
+    )
+
+
+def check_value(value):
+    """
+    :raises ValueError: if ``value`` is a callable that isn't registered
+    """
+    if callable(value) and get_function(value) is None:
+        raise ValueError(
+            "{function} has no SQL function, register one with "
+            "register_function().".format(function=function_path(value))
+        )
+
+
+def format_value(value):
+    """
+    :return: ``value`` as shown in descriptions, callables by their path
+    """
+    if callable(value):
+        return function_path(value)
+    return value
+
+
+def mysql_uuid(dialect):
+    # Django stores UUIDs as char(32) outside PostgreSQL
+    if not dialect.supports_expression_defaults:
+        return None
+    return "(REPLACE(UUID(), '-', ''))"
+
+
+# SQLite has no UUID function, so the random bits are put together as a
+# version 4 UUID
+SQLITE_UUID4 = (
+    "lower(hex(randomblob(4)) || hex(randomblob(2)) || '4' || "
+    "substr(hex(randomblob(2)), 2) || "
+    "substr('89ab', 1 + (random() & 3), 1) || "
+    "substr(hex(randomblob(2)), 2) || hex(randomblob(6)))"
+)
+
+register_function(
+    uuid.uuid4,
+    volatile=True,
+    postgresql="gen_random_uuid()",
+    mysql=mysql_uuid,
+    microsoft="REPLACE(CONVERT(char(36), NEWID()), '-', '')",
+    sqlite=SQLITE_UUID4,
+)
+register_function(
+    timezone.now,
+    postgresql="now()",
+    mysql="CURRENT_TIMESTAMP",
+    microsoft="GETDATE()",
+    sqlite="CURRENT_TIMESTAMP",
+)
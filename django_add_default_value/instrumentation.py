@@ -0,0 +1,305 @@
+# Copyright 2018 3YOURMIND GmbH
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Report every default change the operations make, or decide not to make.
+
+Every change is described by a :class:`DefaultDDLEvent`, which is sent with
+the :data:`default_ddl` signal and passed to the callables listed in the
+``DADV_DDL_CALLBACKS`` setting. Two such callables come with this module:
+:func:`log_event` and :func:`write_prometheus_textfile`.
+"""
+
+from __future__ import unicode_literals
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.dispatch import Signal
+from django.utils.module_loading import import_string
+
+EXECUTED = "executed"
+# Queued by a schema editor that applies the change later, see
+# django_add_default_value.backends.sqlite3
+DEFERRED = "deferred"
+FAILED = "failed"
+# The database already has the default
+SKIPPED = "skipped"
+# The database or the field cannot have the default
+UNSUPPORTED = "unsupported"
+
+logger = logging.getLogger(__name__)
+
+# Sent with ``event``, a DefaultDDLEvent, after every default change
+default_ddl = Signal()
+
+
+class DefaultDDLEvent(object):
+    """
+    One default change of an operation on one table.
+
+    :ivar retry_wait: Seconds spent in the attempts that timed out waiting for
+                      the table lock, including the backoff between them. The
+                      wait of the attempt that succeeds is part of
+                      ``duration``, the databases don't report it per
+                      statement.
+    :ivar duration: Seconds the statement took, without ``retry_wait``
+    """
+
+    def __init__(self, operation, connection, table, columns, sql=None, status=None):
+        self.operation = operation
+        self.using = connection.alias
+        self.vendor = connection.vendor
+        self.table = table
+        self.columns = tuple(columns)
+        self.sql = sql
+        self.status = status
+        self.retry_wait = 0.0
+        self.duration = 0.0
+        self.error = None
+        self.thread = threading.current_thread().ident
+
+    def __repr__(self):
+        return "<DefaultDDLEvent {status} {table}({columns})>".format(
+            status=self.status, table=self.table, columns=", ".join(self.columns)
+        )
+
+    def as_dict(self):
+        return OrderedDict(
+            [
+                ("operation", self.operation.describe()),
+                ("database", self.using),
+                ("vendor", self.vendor),
+                ("table", self.table),
+                ("columns", list(self.columns)),
+                ("sql", self.sql),
+                ("status", self.status),
+                ("retry_wait", round(self.retry_wait, 6)),
+                ("duration", round(self.duration, 6)),
+                ("error", None if self.error is None else str(self.error)),
+            ]
+        )
+
+
+def send(event):
+    """
+    Pass ``event`` to the receivers of :data:`default_ddl` and the
+    ``DADV_DDL_CALLBACKS``. Their errors are logged, so a broken receiver
+    never fails a migration.
+    """
+    for receiver, result in default_ddl.send_robust(
+        sender=event.operation.__class__, event=event
+    ):
+        if isinstance(result, Exception):
+            logger.error("Receiver %r failed on %r: %s", receiver, event, result)
+
+    for callback in get_callbacks():
+        call_safely(callback, event)
+
+
+def call_safely(callback, event):
+    try:
+        callback(event)
+    except Exception:
+        logger.exception("Callback %r failed on %r", callback, event)
+
+
+def get_callbacks():
+    return [
+        callback if callable(callback) else import_string(callback)
+        for callback in getattr(settings, "DADV_DDL_CALLBACKS", ())
+    ]
+
+
+@contextmanager
+def reporting(operation, schema_editor, table, columns, sql=None):
+    """
+    Time the change made in the block and send its event. The block can set
+    the ``retry_wait`` and ``status`` of the event it gets. Nothing is sent
+    while collecting SQL, as for ``sqlmigrate``.
+    """
+    event = DefaultDDLEvent(
+        operation, schema_editor.connection, table, columns, sql, status=EXECUTED
+    )
+    started = time.time()
+    try:
+        yield event
+    except Exception as exc:
+        event.status = FAILED
+        event.error = exc
+        raise
+    finally:
+        event.duration = max(time.time() - started - event.retry_wait, 0.0)
+        if not schema_editor.collect_sql:
+            send(event)
+
+
+def report(operation, schema_editor, table, columns, status):
+    """
+    Send the event of a change that is not made.
+    """
+    if columns and not schema_editor.collect_sql:
+        send(
+            DefaultDDLEvent(
+                operation, schema_editor.connection, table, columns, status=status
+            )
+        )
+
+
+@contextmanager
+def recording_events():
+    """
+    Collect the events sent on the current thread while in the block.
+
+    :return: The list the events get appended to
+    """
+    events = []
+    thread = threading.current_thread().ident
+
+    def record(sender, event, **kwargs):
+        if event.thread == thread:
+            events.append(event)
+
+    default_ddl.connect(record, weak=False)
+    try:
+        yield events
+    finally:
+        default_ddl.disconnect(record)
+
+
+ddl_logger = logging.getLogger("django_add_default_value.ddl")
+
+
+def log_event(event):
+    """
+    Log ``event`` as JSON to the ``django_add_default_value.ddl`` logger. The
+    fields are also available as the ``default_ddl`` attribute of the record.
+    """
+    fields = event.as_dict()
+    level = logging.ERROR if event.status == FAILED else logging.INFO
+    ddl_logger.log(
+        level, json.dumps(fields, sort_keys=True), extra={"default_ddl": fields}
+    )
+
+
+class PrometheusTextfile(object):
+    """
+    Keep totals of the events of this process and write them to the file
+    named by the ``DADV_PROMETHEUS_TEXTFILE`` setting, for the textfile
+    collector of the Prometheus node exporter.
+    """
+
+    metrics = (
+        (
+            "dadv_default_ddl_total",
+            "Default changes by database, table and status.",
+            lambda event: 1,
+        ),
+        (
+            "dadv_default_ddl_seconds_total",
+            "Seconds spent executing default changes.",
+            lambda event: event.duration,
+        ),
+        (
+            "dadv_default_ddl_retry_wait_seconds_total",
+            "Seconds default changes spent in attempts that timed out waiting "
+            "for table locks, and the backoff before retrying them.",
+            lambda event: event.retry_wait,
+        ),
+    )
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = OrderedDict()
+
+    def __call__(self, event):
+        path = getattr(settings, "DADV_PROMETHEUS_TEXTFILE", None)
+        if not path:
+            return
+
+        labels = (event.using, event.vendor, event.table, event.status)
+        with self.lock:
+            totals = self.totals.setdefault(labels, [0] * len(self.metrics))
+            for index, (__, __, value) in enumerate(self.metrics):
+                totals[index] += value(event)
+            self.write(path)
+
+    def write(self, path):
+        lines = []
+        for index, (name, description, __) in enumerate(self.metrics):
+            lines.append(
+                "# HELP {name} {description}".format(name=name, description=description)
+            )
+            lines.append("# TYPE {name} counter".format(name=name))
+            for labels, totals in self.totals.items():
+                lines.append(
+                    "{name}{{{labels}}} {value}".format(
+                        name=name, labels=format_labels(labels), value=totals[index]
+                    )
+                )
+
+        # The collector may read at any time, so replace the file in one go
+        temporary_path = "{path}.{pid}.tmp".format(path=path, pid=os.getpid())
+        with open(temporary_path, "w") as textfile:
+            textfile.write("\n".join(lines) + "\n")
+        os.replace(temporary_path, path)
+
+
+def format_labels(values):
+    return ",".join(
+        '{name}="{value}"'.format(
+            name=name,
+            value="{}".format(value)
+            .replace("\\", "\\\\")
+            .replace('"', '\\"')
+            .replace("\n", "\\n"),
+        )
+        for name, value in zip(("database", "vendor", "table", "status"), values)
+    )
+
+
+write_prometheus_textfile = PrometheusTextfile()
+
+
+def format_summary(events):
+    """
+    :return: One line per event with its timings, slowest first, and the
+             totals
+    """
+    lines = ["Default value changes:"]
+    for event in sorted(events, key=lambda event: -(event.duration + event.retry_wait)):
+        lines.append(
+            "  {duration:8.3f}s  retry wait {retry_wait:7.3f}s  {status:<11}  "
+            "{table}({columns})  {description}".format(
+                duration=event.duration,
+                retry_wait=event.retry_wait,
+                status=event.status,
+                table=event.table,
+                columns=", ".join(event.columns),
+                description=event.operation.describe(),
+            )
+        )
+    lines.append(
+        "  {duration:8.3f}s  retry wait {retry_wait:7.3f}s  total of {count} "
+        "change(s)".format(
+            duration=sum(event.duration for event in events),
+            retry_wait=sum(event.retry_wait for event in events),
+            count=len(events),
+        )
+    )
+    return "\n".join(lines)
@@ -0,0 +1,161 @@
+# Copyright 2018 3YOURMIND GmbH
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import unicode_literals
+import threading
+import time
+from functools import partial
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, NotSupportedError
+from django.db.migrations.loader import MigrationLoader
+
+from django_add_default_value.schemas import SchemaCheckpoint, SchemaRollout
+
+from .plan_defaults import get_migration_name
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply a migration that only sets defaults to many schemas of one "
+        "database, a batch of schemas per transaction and several batches at "
+        "once. Run it again with the same --checkpoint to resume a failed run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("app_label", help="App label of the migration.")
+        parser.add_argument("migration_name", help="The migration to apply.")
+        parser.add_argument(
+            "--schema",
+            action="append",
+            dest="schemas",
+            default=[],
+            help="A schema to apply the migration to, can be given more than once.",
+        )
+        parser.add_argument(
+            "--schemas-file",
+            help="A file with one schema per line to apply the migration to.",
+        )
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help='Nominates the database of the schemas. Defaults to the "default" '
+            "database.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            help="How many schemas to change per transaction. Defaults to the "
+            "DADV_SCHEMA_BATCH_SIZE setting or 50.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            help="How many batches to apply at the same time. Defaults to the "
+            "DADV_WORKERS setting or 8.",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            help="A JSON file to record the schemas that are done in, and to "
+            "skip them when the command runs again.",
+        )
+        parser.add_argument(
+            "--record",
+            action="store_true",
+            help="Also record the migration as applied in the django_migrations "
+            "table of every schema.",
+        )
+
+    def handle(self, *args, **options):
+        schemas = self.get_schemas(options)
+        rollout = self.get_rollout(options)
+        checkpoint = SchemaCheckpoint(options["checkpoint"])
+
+        self.output_lock = threading.Lock()
+        started = time.time()
+        try:
+            results = rollout.run(
+                schemas,
+                workers=options["workers"],
+                checkpoint=checkpoint,
+                callback=partial(self.report, started=started),
+            )
+        except ValueError as exc:
+            raise CommandError(exc)
+
+        failed = [schema for batch, __, error in results if error for schema in batch]
+        self.stdout.write(
+            "Changed {count} schema(s) in {elapsed:.1f}s, {skipped} already done, "
+            "{failed} failed.".format(
+                count=sum(result for __, result, __ in results if result),
+                elapsed=time.time() - started,
+                skipped=len(schemas) - sum(len(batch) for batch, __, __ in results),
+                failed=len(failed),
+            )
+        )
+        if failed:
+            raise CommandError(
+                "{count} schema(s) failed, run the command again with the same "
+                "--checkpoint to resume.".format(count=len(failed))
+            )
+
+    def get_schemas(self, options):
+        schemas = list(options["schemas"])
+        if options["schemas_file"]:
+            with open(options["schemas_file"]) as schemas_file:
+                schemas += [line.strip() for line in schemas_file if line.strip()]
+        if not schemas:
+            raise CommandError("Pass the schemas with --schema or --schemas-file.")
+        return schemas
+
+    def get_rollout(self, options):
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        app_label = options["app_label"]
+        if app_label not in loader.migrated_apps:
+            raise CommandError(
+                "App '{app_label}' does not have migrations.".format(
+                    app_label=app_label
+                )
+            )
+        key = (
+            app_label,
+            get_migration_name(loader, app_label, options["migration_name"]),
+        )
+        try:
+            return SchemaRollout(
+                loader.graph.nodes[key],
+                loader.project_state(key, at_end=True),
+                using=options["database"],
+                batch_size=options["batch_size"],
+                record=options["record"],
+            )
+        except (NotSupportedError, ValueError) as exc:
+            raise CommandError(exc)
+
+    def report(self, batch, result, error, started):
+        with self.output_lock:
+            description = "{first}..{last} ({count} schema(s))".format(
+                first=batch[0], last=batch[-1], count=len(batch)
+            )
+            if error is not None:
+                self.stderr.write(
+                    "{batch}: failed: {error}".format(batch=description, error=error)
+                )
+                return
+
+            self.stdout.write(
+                "{batch}: OK after {elapsed:.1f}s".format(
+                    batch=description, elapsed=time.time() - started
+                ),
+                self.style.SUCCESS,
+            )
@@ -0,0 +1,139 @@
+# Copyright 2018 3YOURMIND GmbH
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import unicode_literals
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from django_add_default_value.backfill import Backfill, Checkpoint, collect_defaults
+
+
+class Command(BaseCommand):
+    help = (
+        "Set the defaults transferred by AddDefaultValue on existing rows that "
+        "are NULL, in small batches that can be throttled, interrupted and "
+        "resumed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "app_label",
+            nargs="*",
+            help="Only backfill the defaults of these apps. Defaults to all apps.",
+        )
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help='Nominates a database to backfill. Defaults to the "default" '
+            "database.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="How many rows to update per transaction. Defaults to 1000.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0,
+            help="Seconds to wait after every batch, to throttle the load.",
+        )
+        parser.add_argument(
+            "--max-runtime",
+            type=float,
+            help="Stop after this many seconds. Use --checkpoint to resume later.",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            help="A JSON file recording the progress, to resume an interrupted "
+            "run from.",
+        )
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Ignore the progress recorded in the checkpoint.",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        self.verbosity = options["verbosity"]
+        self.sleep = options["sleep"]
+        self.deadline = get_deadline(options["max_runtime"])
+        self.checkpoint = Checkpoint(options["checkpoint"])
+        if options["reset"]:
+            self.checkpoint.positions.clear()
+
+        backfills = Backfill.from_defaults(
+            collect_defaults(options["app_label"]),
+            using=options["database"],
+            batch_size=options["batch_size"],
+        )
+        for backfill in backfills:
+            if not self.run(backfill):
+                self.stdout.write(
+                    "Stopped after --max-runtime, run again to resume.",
+                    self.style.WARNING,
+                )
+                return
+
+    def run(self, backfill):
+        """
+        Update all batches of ``backfill``.
+
+        :return: False if the run got stopped by ``--max-runtime``
+        """
+        if self.checkpoint.is_done(backfill):
+            if self.verbosity > 1:
+                self.stdout.write("{backfill}: already done".format(backfill=backfill))
+            return True
+
+        after = self.checkpoint.position(backfill)
+        total = 0
+        while not self.out_of_time():
+            after, updated = self.run_batch(backfill, after)
+            total += updated
+            if after is None:
+                self.report(backfill, total, "done")
+                return True
+
+        self.report(backfill, total, "stopped")
+        return False
+
+    def run_batch(self, backfill, after):
+        end, updated = backfill.run_batch(after)
+        self.checkpoint.save(backfill, after=end, done=end is None)
+        if end is not None and self.sleep:
+            time.sleep(self.sleep)
+        return end, updated
+
+    def out_of_time(self):
+        return self.deadline is not None and time.time() >= self.deadline
+
+    def report(self, backfill, total, state):
+        if total or self.verbosity > 1:
+            self.stdout.write(
+                "{backfill}: {total} row(s) updated, {state}".format(
+                    backfill=backfill, total=total, state=state
+                )
+            )
+
+
+def get_deadline(max_runtime):
+    if max_runtime is None:
+        return None
+    return time.time() + max_runtime
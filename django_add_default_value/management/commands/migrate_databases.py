@@ -0,0 +1,164 @@
+# Copyright 2018 3YOURMIND GmbH
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import unicode_literals
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from functools import partial
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from django_add_default_value.fanout import fan_out
+
+# The line migrate prints for every migration it applies, or fakes
+APPLYING = re.compile(r"^\s*Applying \S+\.\.\.", re.MULTILINE)
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply the pending migrations to several databases at once. Every "
+        "database is migrated by a process of its own, so the run takes about as "
+        "long as the slowest database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "app_label", nargs="?", help="App label of an application to migrate."
+        )
+        parser.add_argument(
+            "migration_name",
+            nargs="?",
+            help="Database state will be brought to the state after that migration.",
+        )
+        parser.add_argument(
+            "--database",
+            action="append",
+            dest="databases",
+            help="A database to migrate, can be given more than once. Defaults to "
+            "all databases.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            help="How many databases to migrate at the same time. Defaults to the "
+            "DADV_WORKERS setting or 8.",
+        )
+        parser.add_argument(
+            "--fake",
+            action="store_true",
+            help="Mark migrations as run without actually running them.",
+        )
+
+    def handle(self, *args, **options):
+        aliases = options["databases"] or list(connections)
+        unknown = [alias for alias in aliases if alias not in connections]
+        if unknown:
+            raise CommandError(
+                "Unknown database(s): {aliases}".format(aliases=", ".join(unknown))
+            )
+
+        self.output_lock = threading.Lock()
+        started = time.time()
+        # The threads only wait for the processes
+        results = fan_out(
+            partial(self.migrate, options=options),
+            aliases,
+            workers=options["workers"],
+            callback=partial(self.report, verbosity=options["verbosity"]),
+        )
+
+        failed = [alias for alias, __, error in results if error is not None]
+        self.stdout.write(
+            "Migrated {count} database(s) in {elapsed:.1f}s, {failed} failed.".format(
+                count=len(results), elapsed=time.time() - started, failed=len(failed)
+            )
+        )
+        if failed:
+            raise CommandError(
+                "Migrating failed on: {aliases}".format(aliases=", ".join(failed))
+            )
+
+    def migrate(self, alias, options):
+        """
+        Run ``migrate --database`` for one database in a new process. The
+        migration loader, the models the executor renders and the operations
+        are shared by everything in a process, so migrating isn't thread-safe.
+        Operations are routed the same way as with ``migrate --database``, so
+        ``allow_migrate_model`` is respected.
+
+        :return: The number of migrations applied, the time it took and the
+                 output of ``migrate``
+        """
+        started = time.time()
+        process = subprocess.Popen(
+            migrate_command(alias, options),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            env=dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, sys.path))),
+            universal_newlines=True,
+        )
+        output = process.communicate()[0]
+        if process.returncode:
+            lines = output.strip().splitlines()
+            raise CommandError(
+                lines[-1]
+                if lines
+                else "migrate exited with status {status}".format(
+                    status=process.returncode
+                )
+            )
+        return len(APPLYING.findall(output)), time.time() - started, output
+
+    def report(self, alias, result, error, verbosity):
+        with self.output_lock:
+            if error is not None:
+                self.stderr.write(
+                    "{alias}: failed: {error}".format(alias=alias, error=error)
+                )
+                return
+
+            applied, elapsed, output = result
+            self.stdout.write(
+                "{alias}: OK, {applied} migration(s) applied in {elapsed:.1f}s".format(
+                    alias=alias, applied=applied, elapsed=elapsed
+                ),
+                self.style.SUCCESS,
+            )
+            if verbosity > 1 and output:
+                self.stdout.write(output, ending="")
+
+
+def migrate_command(alias, options):
+    """
+    :return: The arguments starting ``migrate`` for the database ``alias``,
+             the settings module is passed on in ``DJANGO_SETTINGS_MODULE``
+    """
+    command = [sys.executable, "-m", "django", "migrate"]
+    command += [arg for arg in (options["app_label"], options["migration_name"]) if arg]
+    command += [
+        "--database",
+        alias,
+        "--noinput",
+        "--no-color",
+        # Lists the migrations applied
+        "--verbosity",
+        "1",
+    ]
+    if options["fake"]:
+        command.append("--fake")
+    return command
@@ -0,0 +1,38 @@
+# Copyright 2018 3YOURMIND GmbH
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import unicode_literals
+
+from django.core.management.commands import migrate
+
+from django_add_default_value.instrumentation import format_summary, recording_events
+
+
+class Command(migrate.Command):
+    """
+    Django's ``migrate``, ending with the timings of the default changes it
+    made, also when it fails.
+    """
+
+    help = (
+        migrate.Command.help + " Ends with the timings of every default change "
+        "made, slowest first."
+    )
+
+    def handle(self, *args, **options):
+        with recording_events() as events:
+            try:
+                return super(Command, self).handle(*args, **options)
+            finally:
+                if events and options["verbosity"] >= 1:
+                    self.stdout.write(format_summary(events))
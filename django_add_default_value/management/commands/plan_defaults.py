@@ -0,0 +1,138 @@
+# Copyright 2018 3YOURMIND GmbH
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.exceptions import AmbiguityError
+from django.db.migrations.executor import MigrationExecutor
+
+from django_add_default_value.dialects import get_dialect
+from django_add_default_value.plan import estimate_plan
+
+
+class Command(BaseCommand):
+    help = (
+        "Estimate the default changes of the pending migrations without "
+        "applying them: whether they only change the table definition or "
+        "rewrite every row, the lock they take and the rows of the table."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "app_label", nargs="?", help="App label of an application to migrate."
+        )
+        parser.add_argument(
+            "migration_name",
+            nargs="?",
+            help="Database state will be brought to the state after that "
+            'migration. Use the name "zero" to unapply all migrations.',
+        )
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help='Nominates a database to plan for. Defaults to the "default" '
+            "database.",
+        )
+        parser.add_argument(
+            "--max-rows",
+            type=int,
+            help="Fail if a change would rewrite more rows. Defaults to the "
+            "max_rows of every operation or the DADV_MAX_ROWS setting.",
+        )
+
+    def handle(self, *args, **options):
+        connection = connections[options["database"]]
+        dialect = get_supported_dialect(connection)
+        executor = MigrationExecutor(connection)
+        plan = executor.migration_plan(
+            get_targets(
+                executor.loader, options["app_label"], options["migration_name"]
+            )
+        )
+        estimates = estimate_plan(connection, executor.loader, plan, dialect)
+        if not estimates:
+            self.stdout.write("No default changes")
+            return
+
+        refused = []
+        for migration, estimate in estimates:
+            over = self.is_refused(estimate, options["max_rows"])
+            if over:
+                refused.append(estimate)
+            self.report(migration, estimate, over)
+
+        if refused:
+            raise CommandError(
+                "{count} default change(s) would rewrite more rows than "
+                "allowed.".format(count=len(refused))
+            )
+
+    def is_refused(self, estimate, max_rows=None):
+        operation = estimate.operation
+        if max_rows is None:
+            max_rows = operation.get_option("max_rows")
+        return estimate.exceeds(max_rows) and not operation.get_option("force")
+
+    def report(self, migration, estimate, refused):
+        style = self.style.ERROR if refused else self.style.SUCCESS
+        self.stdout.write(
+            "{app_label}.{name}: {description}\n    {estimate}".format(
+                app_label=migration.app_label,
+                name=migration.name,
+                description=estimate.operation.describe(),
+                estimate=style(str(estimate)),
+            )
+        )
+
+
+def get_targets(loader, app_label=None, migration_name=None):
+    """
+    :return: The nodes to migrate to, the way ``migrate`` picks them
+    """
+    if app_label is None:
+        return loader.graph.leaf_nodes()
+
+    if app_label not in loader.migrated_apps:
+        raise CommandError(
+            "App '{app_label}' does not have migrations.".format(app_label=app_label)
+        )
+    if migration_name is None:
+        return [key for key in loader.graph.leaf_nodes() if key[0] == app_label]
+    if migration_name == "zero":
+        return [(app_label, None)]
+    return [(app_label, get_migration_name(loader, app_label, migration_name))]
+
+
+def get_migration_name(loader, app_label, migration_name):
+    try:
+        migration = loader.get_migration_by_prefix(app_label, migration_name)
+    except (AmbiguityError, KeyError) as exc:
+        raise CommandError(
+            "Cannot find the migration '{name}' of '{app_label}': {error}".format(
+                name=migration_name, app_label=app_label, error=exc
+            )
+        )
+    return migration.name
+
+
+def get_supported_dialect(connection):
+    dialect = get_dialect(connection)
+    if dialect is None:
+        raise CommandError(
+            "The {vendor} database {alias} is not supported.".format(
+                vendor=connection.vendor, alias=connection.alias
+            )
+        )
+    return dialect
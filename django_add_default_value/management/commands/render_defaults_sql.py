@@ -0,0 +1,102 @@
+# Copyright 2018 3YOURMIND GmbH
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, NotSupportedError
+from django.db.migrations.loader import MigrationLoader
+
+from django_add_default_value.offline import (
+    NOT_RENDERED,
+    offline_dialect,
+    render_sql,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Print the SQL of every default change in the migrations as one script "
+        "for a given database server, without connecting to a database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "app_labels",
+            nargs="*",
+            help="Only render the migrations of these apps. Defaults to all apps.",
+        )
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help="The database alias to ask the routers about. Nothing connects "
+            'to it. Defaults to the "default" database.',
+        )
+        # --version is the version of the server here, not of Django
+        server = parser.add_argument_group("server", conflict_handler="resolve")
+        server.add_argument(
+            "--vendor",
+            required=True,
+            choices=["postgresql", "cockroachdb", "mysql", "microsoft"],
+            help="The database server to render the SQL for.",
+        )
+        server.add_argument(
+            "--version",
+            dest="server_version",
+            help='The version of the server, like "8.0.34". Defaults to the '
+            "newest server.",
+        )
+        server.add_argument(
+            "--mariadb", action="store_true", help="The MySQL server is MariaDB."
+        )
+
+    def handle(self, *args, **options):
+        lines = render_sql(
+            self.get_loader(options["app_labels"]),
+            self.get_dialect(options),
+            options["app_labels"],
+            using=options["database"],
+        )
+        not_rendered = 0
+        try:
+            for line in lines:
+                self.stdout.write(line)
+                not_rendered += line.startswith(NOT_RENDERED)
+        except NotSupportedError as exc:
+            raise CommandError(exc)
+        if not_rendered:
+            self.stderr.write(
+                "{count} step(s) need the database backend and were not rendered, "
+                "run sqlmigrate for the migrations marked NOT RENDERED.".format(
+                    count=not_rendered
+                )
+            )
+
+    def get_dialect(self, options):
+        try:
+            return offline_dialect(
+                options["vendor"], options["server_version"], options["mariadb"]
+            )
+        except ValueError as exc:
+            raise CommandError(exc)
+
+    def get_loader(self, app_labels):
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        unknown = set(app_labels) - set(loader.migrated_apps)
+        if unknown:
+            raise CommandError(
+                "App(s) without migrations: {apps}".format(
+                    apps=", ".join(sorted(unknown))
+                )
+            )
+        return loader
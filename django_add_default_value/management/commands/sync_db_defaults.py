@@ -0,0 +1,160 @@
+# Copyright 2018 3YOURMIND GmbH
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import unicode_literals
+import io
+import os
+from collections import OrderedDict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.writer import MigrationWriter
+
+from django_add_default_value.catalog import CatalogSnapshot
+from django_add_default_value.dialects import get_dialect
+from django_add_default_value.fanout import fan_out
+from django_add_default_value.sync import (
+    build_migrations,
+    default_operations,
+    get_app_configs,
+    literal_defaults,
+    missing_defaults,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the literal defaults of the models with the column defaults in "
+        "the database and write one migration per app transferring the missing "
+        "ones."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "app_label",
+            nargs="*",
+            help="Only look at the models of these apps. Defaults to all apps.",
+        )
+        parser.add_argument(
+            "--database",
+            action="append",
+            dest="databases",
+            help="A database to compare with, can be given more than once. "
+            'Defaults to the "default" database.',
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            help="How many databases to introspect at the same time. Defaults to "
+            "the DADV_WORKERS setting or 8.",
+        )
+        parser.add_argument(
+            "--name", default="sync_db_defaults", help="The name of the migrations."
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Just show what migrations would be made.",
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options["verbosity"]
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        app_configs = [
+            app_config
+            for app_config in get_app_configs(options["app_label"])
+            if app_config.label in loader.migrated_apps
+        ]
+        defaults = literal_defaults(app_configs)
+
+        missing = OrderedDict()
+        for alias, snapshot_missing in self.introspect(
+            options["databases"] or [DEFAULT_DB_ALIAS], defaults, options["workers"]
+        ):
+            for model, field, value in snapshot_missing:
+                missing[model, field.name] = (model, field, value)
+
+        if not missing:
+            self.stdout.write("No missing defaults")
+            return
+
+        for migration in build_migrations(
+            default_operations(missing.values()), loader, options["name"]
+        ):
+            self.write_migration(migration, options["dry_run"])
+
+    def introspect(self, aliases, defaults, workers):
+        """
+        Load the catalog of every database concurrently and compare it with
+        ``defaults``.
+
+        :return: ``(alias, missing defaults)`` 2-tuples
+        """
+        check_databases(aliases)
+        results = []
+        for alias, result, error in fan_out(
+            lambda alias: missing_defaults(defaults, load_snapshot(alias)),
+            aliases,
+            workers=workers,
+        ):
+            if error is not None:
+                raise CommandError(
+                    "Introspecting {alias} failed: {error}".format(
+                        alias=alias, error=error
+                    )
+                )
+            results.append((alias, result))
+        return results
+
+    def write_migration(self, migration, dry_run):
+        writer = MigrationWriter(migration)
+        self.stdout.write(
+            self.style.MIGRATE_HEADING(
+                "Migration for '{app_label}':".format(app_label=migration.app_label)
+            )
+        )
+        self.stdout.write("  {path}".format(path=os.path.relpath(writer.path)))
+        for operation in migration.operations:
+            self.stdout.write(
+                "    - {description}".format(description=operation.describe())
+            )
+
+        if dry_run:
+            if self.verbosity > 2:
+                self.stdout.write(writer.as_string())
+            return
+
+        with io.open(writer.path, "w", encoding="utf-8") as migration_file:
+            migration_file.write(writer.as_string())
+
+
+def check_databases(aliases):
+    for alias in aliases:
+        if alias not in connections:
+            raise CommandError("Unknown database: {alias}".format(alias=alias))
+        if get_dialect(connections[alias]) is None:
+            raise CommandError(
+                "The {vendor} database {alias} is not supported.".format(
+                    vendor=connections[alias].vendor, alias=alias
+                )
+            )
+
+
+def load_snapshot(alias):
+    connection = connections[alias]
+    try:
+        return CatalogSnapshot.load(connection)
+    finally:
+        # Connections are per thread, the pool's threads don't close them
+        connection.close()
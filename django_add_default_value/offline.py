@@ -0,0 +1,216 @@
+# Copyright 2018 3YOURMIND GmbH
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Render the default changes of the migrations without a database.
+
+The SQL of a default change only depends on the dialect, so a dialect built
+from a declared vendor and server version renders the same statements as the
+live server would get. The migration graph is walked once, carrying a single
+project state forward, instead of building the state of every migration from
+scratch.
+
+Steps that restate the column definition of the database backend, like adding
+a column, can't be rendered without it. A line starting with ``NOT_RENDERED``
+takes their place, pointing to ``sqlmigrate``.
+"""
+
+from __future__ import unicode_literals
+
+from django.db import DEFAULT_DB_ALIAS, NotSupportedError
+from django.db.migrations.state import ProjectState
+
+from .add_default_value import (
+    AddDefaultAndSetNotNull,
+    AddDefaultValue,
+    AddFieldWithDefault,
+)
+from .dialects import MySQLDialect, get_dialect_class
+from .plan import migration_plan
+
+NOT_RENDERED = "-- NOT RENDERED: "
+
+
+def parse_version(version):
+    """
+    :return: ``version`` like ``"8.0.34"`` as a tuple of integers
+    :raises ValueError: if ``version`` isn't dotted numbers
+    """
+    try:
+        return tuple(int(part) for part in version.split("."))
+    except ValueError:
+        raise ValueError("Invalid server version: {version!r}".format(version=version))
+
+
+def offline_dialect(vendor, version=None, is_mariadb=False):
+    """
+    :param version: The server version as a string, or None if unknown
+    :return: The :class:`~.dialects.Dialect` of a server that isn't connected
+    :raises ValueError: if the vendor isn't supported or can't be rendered
+                        without a database
+    """
+    dialect_class = get_dialect_class(vendor)
+    if dialect_class is None or dialect_class.remakes_table:
+        # Rebuilding a table depends on its current definition
+        raise ValueError(
+            "Can't render SQL for {vendor} without a database.".format(vendor=vendor)
+        )
+
+    server_version = version and parse_version(version)
+    if is_mariadb:
+        if not issubclass(dialect_class, MySQLDialect):
+            raise ValueError("Only MySQL servers can be MariaDB.")
+        return dialect_class(server_version, is_mariadb=True)
+    return dialect_class(server_version)
+
+
+def render_sql(loader, dialect, app_labels=None, using=DEFAULT_DB_ALIAS):
+    """
+    Yield the lines of a script with the SQL of every default change of
+    ``app_labels``, or of all apps, as soon as it is rendered.
+
+    :param using: The database alias routers are asked about
+    :raises NotSupportedError: if a change can't be applied on the server
+    """
+    state = ProjectState(real_apps=list(loader.unmigrated_apps))
+    for migration in migration_plan(loader, app_labels):
+        render = not app_labels or migration.app_label in app_labels
+        changes = list(default_changes(migration, state, render, using))
+        try:
+            for line in migration_lines(dialect, migration, changes):
+                yield line
+        except NotSupportedError as exc:
+            raise NotSupportedError(
+                "{migration}: {error}".format(migration=migration, error=exc)
+            )
+
+
+def migration_lines(dialect, migration, changes):
+    if changes:
+        yield "-- {app_label}.{name}".format(
+            app_label=migration.app_label, name=migration.name
+        )
+    for operation, model, sets_not_null in changes:
+        for line in operation_lines(dialect, operation, model, sets_not_null):
+            yield line
+
+
+def default_changes(migration, state, render=True, using=DEFAULT_DB_ALIAS):
+    """
+    Bring ``state`` forward to the end of ``migration``.
+
+    :param render: Whether to yield the default changes
+    :return: ``(operation, model, sets not null)`` 3-tuples of the default
+             changes, with the model as of the operation and whether it makes
+             a nullable column NOT NULL
+    """
+    for operation in migration.operations:
+        sets_not_null = render and was_null(migration.app_label, operation, state)
+        operation.state_forwards(migration.app_label, state)
+        if render and isinstance(operation, AddDefaultValue):
+            model = state.apps.get_model(migration.app_label, operation.model_name)
+            if operation.allow_migrate_model(using, model):
+                yield operation, model, sets_not_null
+
+
+def was_null(app_label, operation, state):
+    if not isinstance(operation, AddDefaultAndSetNotNull):
+        return False
+    model = state.apps.get_model(app_label, operation.model_name)
+    return model._meta.get_field(operation.name).null
+
+
+def operation_lines(dialect, operation, model, sets_not_null=False):
+    yield "-- {description}".format(description=operation.describe())
+    if isinstance(operation, AddFieldWithDefault):
+        yield not_rendered_line(
+            operation, "needs the column definition of the database backend"
+        )
+        return
+
+    for line in default_lines(dialect, operation, model):
+        yield line
+    if sets_not_null:
+        for line in not_null_lines(dialect, operation, model):
+            yield line
+
+
+def default_lines(dialect, operation, model):
+    defaults = operation.applicable_defaults(model, dialect)
+    for line in skipped_lines(operation, model, defaults):
+        yield line
+    for statement in default_statements(dialect, operation, model, defaults):
+        yield statement_line(statement)
+
+
+def not_null_lines(dialect, operation, model):
+    """
+    Yield the statements making the column of ``operation`` NOT NULL, or a
+    ``NOT_RENDERED`` line where they restate the column type.
+    """
+    statements = None
+    if not dialect.not_null_needs_definition:
+        field = model._meta.get_field(operation.name)
+        statements = operation.not_null_sql(dialect, model, field, None)
+    if statements is None:
+        yield not_rendered_line(
+            operation,
+            "needs the column definition of the database backend to make the "
+            "column NOT NULL",
+        )
+        return
+    for statement in statements:
+        for timed in with_lock_timeout(dialect, operation, statement):
+            yield statement_line(timed)
+
+
+def not_rendered_line(operation, reason):
+    return "{prefix}{operation} {reason}, run sqlmigrate for this migration.".format(
+        prefix=NOT_RENDERED, operation=operation.describe(), reason=reason
+    )
+
+
+def statement_line(statement):
+    return "{statement};".format(statement=statement.rstrip(";"))
+
+
+def skipped_lines(operation, model, defaults):
+    applied = set(field.name for field, __ in defaults)
+    for name, __ in operation.get_defaults():
+        if model._meta.get_field(name).name not in applied:
+            yield "-- Skipped {model}.{field}, it can't have a default here.".format(
+                model=model.__name__, field=name
+            )
+
+
+def default_statements(dialect, operation, model, defaults):
+    """
+    :return: The statements setting ``defaults``, within the lock timeout of
+             ``operation``
+    """
+    if not defaults:
+        return []
+    return with_lock_timeout(
+        dialect, operation, operation.forwards_sql(dialect, model, defaults)
+    )
+
+
+def with_lock_timeout(dialect, operation, sql):
+    lock_timeout = operation.get_option("lock_timeout")
+    if lock_timeout is None or not dialect.supports_lock_timeout:
+        return [sql]
+    return [
+        dialect.lock_timeout_sql(lock_timeout),
+        sql,
+        dialect.reset_lock_timeout_sql,
+    ]
@@ -0,0 +1,163 @@
+# Copyright 2018 3YOURMIND GmbH
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Collect the default changes of a migration per table in the schema editor
+and apply them together, when the migration ends or right before the next
+statement on the table or the next ``RunPython``, for databases where every
+change to a table is expensive.
+"""
+
+from __future__ import unicode_literals
+import functools
+import re
+import sys
+from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
+
+from django.db.migrations.operations import RunPython
+
+IDENTIFIER = r'(?:"[^"]+"|`[^`]+`|\[[^\]]+\]|[\w$]+)'
+
+# The statements whose table is known, anything else may touch any table
+TARGET_TABLE = re.compile(
+    r"^\s*(?:"
+    r"ALTER\s+TABLE(?:\s+IF\s+EXISTS)?(?:\s+ONLY)?"
+    r"|CREATE\s+(?:UNIQUE\s+)?INDEX(?:\s+CONCURRENTLY)?(?:\s+IF\s+NOT\s+EXISTS)?"
+    r"\s+{identifier}\s+ON"
+    r"|CREATE\s+TABLE(?:\s+IF\s+NOT\s+EXISTS)?"
+    r"|DROP\s+TABLE(?:\s+IF\s+EXISTS)?"
+    r"|INSERT\s+INTO|UPDATE|DELETE\s+FROM"
+    r")\s+((?:{identifier}\.)*{identifier})".format(identifier=IDENTIFIER),
+    re.IGNORECASE,
+)
+
+
+def unquote(name):
+    """
+    :return: The last part of the, possibly qualified, table ``name`` without
+             quotes, in lower case
+    """
+    last = re.findall(IDENTIFIER, name)[-1]
+    if last[0] in '"`[':
+        last = last[1:-1]
+    return last.lower()
+
+
+def statement_table(sql):
+    """
+    :return: The unquoted name of the table ``sql`` changes, or None if it
+             may change any table
+    """
+    statement = sql.strip().rstrip(";")
+    if ";" in statement:
+        # Several statements
+        return None
+    match = TARGET_TABLE.match(statement)
+    return unquote(match.group(1)) if match else None
+
+
+def applying_pending_defaults(method):
+    @functools.wraps(method)
+    def wrapper(self, app_label, schema_editor, from_state, to_state):
+        if isinstance(schema_editor, PendingDefaultsMixin):
+            # The code may use the defaults through the ORM, without a
+            # statement of the schema editor applying them first
+            schema_editor.apply_pending_defaults()
+        return method(self, app_label, schema_editor, from_state, to_state)
+
+    return wrapper
+
+
+def patch_run_python():
+    """
+    Apply the pending defaults before every ``RunPython``, once for the whole
+    process. ``RunSQL`` goes through :meth:`PendingDefaultsMixin.execute`.
+    """
+    if not hasattr(RunPython, "_patched_pending_defaults"):
+        RunPython.database_forwards = applying_pending_defaults(
+            RunPython.database_forwards
+        )
+        RunPython.database_backwards = applying_pending_defaults(
+            RunPython.database_backwards
+        )
+        RunPython._patched_pending_defaults = True
+
+
+class PendingDefaultsMixin(metaclass=ABCMeta):
+    """
+    A schema editor mixin keeping the default changes per table until they
+    are applied with :meth:`apply_defaults`, which backends implement.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(PendingDefaultsMixin, self).__init__(*args, **kwargs)
+        patch_run_python()
+        # The latest model and the changes per column, per table
+        self.pending_defaults = OrderedDict()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            try:
+                self.apply_pending_defaults()
+            except Exception:
+                # Roll the migration back like for any failed statement
+                super(PendingDefaultsMixin, self).__exit__(*sys.exc_info())
+                raise
+        return super(PendingDefaultsMixin, self).__exit__(
+            exc_type, exc_value, traceback
+        )
+
+    def queue_defaults(self, table, changes, model=None):
+        """
+        :param changes: The change per column, replacing the pending ones of
+                        the same columns
+        """
+        queued_model, pending = self.pending_defaults.pop(table, (None, OrderedDict()))
+        pending.update(changes)
+        self.pending_defaults[table] = (model or queued_model, pending)
+
+    def apply_pending_defaults(self, tables=None):
+        for table in list(self.pending_defaults):
+            if tables is None or table in tables:
+                model, changes = self.pending_defaults.pop(table)
+                self.apply_defaults(table, model, changes)
+
+    @abstractmethod
+    def apply_defaults(self, table, model, changes):
+        """
+        Apply the queued ``changes`` of ``table``, whose latest model is
+        ``model`` or None.
+        """
+
+    def flushes_pending_defaults(self):
+        return bool(self.pending_defaults)
+
+    def execute(self, sql, params=()):
+        if self.flushes_pending_defaults():
+            # Keep the order of statements that may rely on the defaults
+            target = statement_table(str(sql))
+            self.apply_pending_defaults(
+                None
+                if target is None
+                else [
+                    table
+                    for table in self.pending_defaults
+                    if unquote('"{table}"'.format(table=table)) == target
+                ]
+            )
+        return super(PendingDefaultsMixin, self).execute(sql, params)
+
+    def delete_model(self, model, *args, **kwargs):
+        self.pending_defaults.pop(model._meta.db_table, None)
+        return super(PendingDefaultsMixin, self).delete_model(model, *args, **kwargs)
@@ -0,0 +1,238 @@
+# Copyright 2018 3YOURMIND GmbH
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Estimate what the default changes of a migration plan cost before applying
+it: whether they only change the table definition or touch every row, which
+lock they take and how many rows the table has.
+"""
+
+from __future__ import unicode_literals
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.migrations.state import ProjectState
+
+from .dialects import REWRITE
+
+
+class ExpensiveOperationError(Exception):
+    """
+    Raised instead of applying an operation that would rewrite more rows than
+    its ``max_rows`` allow.
+    """
+
+
+class CostEstimate(object):
+    """
+    What applying ``operation`` to ``table`` costs.
+
+    :param kind: :data:`~.dialects.METADATA` or :data:`~.dialects.REWRITE`
+    :param lock: The lock taken on the table
+    :param reason: Why the change is of that ``kind``
+    :param rows: The estimated number of rows of the table, None if unknown
+    """
+
+    def __init__(self, operation, table, kind, lock, reason, rows=None):
+        self.operation = operation
+        self.table = table
+        self.kind = kind
+        self.lock = lock
+        self.reason = reason
+        self.rows = rows
+
+    def __repr__(self):
+        return "<CostEstimate {kind} {table} rows={rows}>".format(
+            kind=self.kind, table=self.table, rows=self.rows
+        )
+
+    def __str__(self):
+        return "{kind}, {lock} lock, {rows} rows: {reason}".format(
+            kind=self.kind,
+            lock=self.lock,
+            rows="unknown" if self.rows is None else "~{}".format(self.rows),
+            reason=self.reason,
+        )
+
+    @property
+    def rewritten_rows(self):
+        """
+        :return: The number of rows the change touches, None if unknown
+        """
+        if self.kind != REWRITE:
+            return 0
+        return self.rows
+
+    def exceeds(self, max_rows):
+        """
+        Tell whether the change touches more than ``max_rows`` rows. Unknown
+        row counts never exceed.
+        """
+        rows = self.rewritten_rows
+        return max_rows is not None and rows is not None and rows > max_rows
+
+
+def count_rows(connection, dialect, table):
+    """
+    :return: The estimated number of rows of ``table``, None if the catalog
+             doesn't know
+    """
+    statement = dialect.row_count_sql(table)
+    if statement is None:
+        return None
+
+    sql, params = statement
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class RowCounts(object):
+    """
+    The estimated number of rows per table, counted once. Tables that don't
+    exist yet are created by the plan and have no rows.
+    """
+
+    def __init__(self, connection, dialect):
+        self.connection = connection
+        self.dialect = dialect
+        self.counts = {}
+        self.tables = None
+
+    def get(self, table):
+        if self.tables is None:
+            with self.connection.cursor() as cursor:
+                self.tables = set(self.connection.introspection.table_names(cursor))
+        if table not in self.tables:
+            return 0
+        if table not in self.counts:
+            self.counts[table] = count_rows(self.connection, self.dialect, table)
+        return self.counts[table]
+
+
+def estimate_plan(connection, loader, plan, dialect):
+    """
+    Estimate every default change of a migration plan, without applying it.
+    The rows of every table that gets rewritten are counted once.
+
+    :param loader: The :class:`~django.db.migrations.loader.MigrationLoader`
+                   of ``connection``
+    :param plan: ``(migration, backwards)`` 2-tuples, as built by the
+                 migration executor
+    :return: ``(migration, estimate)`` 2-tuples
+    """
+    estimates = []
+    row_counts = RowCounts(connection, dialect)
+    for migration, operation, state in operation_states(loader, plan):
+        estimate = estimate_operation(
+            connection, dialect, migration.app_label, operation, state
+        )
+        if estimate is None:
+            continue
+        if estimate.kind == REWRITE:
+            estimate.rows = row_counts.get(estimate.table)
+        estimates.append((migration, estimate))
+    return estimates
+
+
+def migration_plan(loader, app_labels=None):
+    """
+    Yield the migrations of ``app_labels``, and the ones they depend on, in
+    the order ``migrate`` applies them to an empty database.
+    """
+    seen = set()
+    for leaf in loader.graph.leaf_nodes():
+        if app_labels and leaf[0] not in app_labels:
+            continue
+        for key in loader.graph.forwards_plan(leaf):
+            if key not in seen:
+                seen.add(key)
+                yield loader.graph.nodes[key]
+
+
+def operation_states(loader, plan):
+    """
+    Yield ``(migration, operation, state)`` 3-tuples for the operations of
+    ``plan`` with the state they bring the database to: the state after the
+    operation when applying it, the state before it when unapplying it. The
+    state is only valid until the next operation is yielded.
+
+    Like the migration executor, the state is built once from the applied
+    migrations and carried forward, instead of building the state of every
+    migration from the start of the graph.
+    """
+    backwards = bool(plan) and plan[0][1]
+    migration_states = unapplied_states if backwards else applied_states
+    for migration, state in migration_states(loader, plan):
+        for operation in migration.operations:
+            if not backwards:
+                operation.state_forwards(migration.app_label, state)
+            yield migration, operation, state
+            if backwards:
+                operation.state_forwards(migration.app_label, state)
+
+
+def applied_states(loader, plan):
+    """
+    Yield the migrations of a plan applying them with the state before them.
+    It is one state, the caller brings it forward through every migration.
+    """
+    state = ProjectState(real_apps=list(loader.unmigrated_apps))
+    for migration in migration_plan(loader):
+        if is_applied(loader, migration):
+            migration.mutate_state(state, preserve=False)
+    for migration, __ in plan:
+        yield migration, state
+
+
+def unapplied_states(loader, plan):
+    """
+    Yield the migrations of a plan unapplying them with the state before them,
+    which are built in a single pass over the graph.
+    """
+    unapplied = set(migration for migration, __ in plan)
+    states = {}
+    state = ProjectState(real_apps=list(loader.unmigrated_apps))
+    for migration in migration_plan(loader):
+        if migration in unapplied:
+            # Render the models once, the copies keep them
+            state.apps
+            states[migration] = state
+            state = migration.mutate_state(state, preserve=True)
+        elif is_applied(loader, migration):
+            migration.mutate_state(state, preserve=False)
+    for migration, __ in plan:
+        yield migration, states[migration]
+
+
+def is_applied(loader, migration):
+    return (migration.app_label, migration.name) in loader.applied_migrations
+
+
+def estimate_operation(connection, dialect, app_label, operation, state):
+    """
+    :return: The :class:`CostEstimate` of ``operation`` without its rows, or
+             None if it changes no defaults on this database
+    """
+    if not hasattr(operation, "estimate"):
+        return None
+
+    try:
+        model = state.apps.get_model(app_label, operation.model_name)
+        if operation.allow_migrate_model(connection.alias, model):
+            return operation.estimate(dialect, model)
+    except (LookupError, FieldDoesNotExist):
+        pass
+    return None
@@ -0,0 +1,243 @@
+# Copyright 2018 3YOURMIND GmbH
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Apply the default changes of a migration to many schemas of one database.
+
+Schema-per-tenant deployments keep the same tables in hundreds of schemas and
+usually migrate them one at a time, paying a transaction and a round trip per
+statement and schema. Setting a default only touches the catalog, so the
+statements of a whole batch of schemas are qualified with their schema and
+sent at once, in a single transaction. Batches run in parallel on a few
+connections, and the schemas that are done are kept in a checkpoint file so a
+failed run can be resumed.
+"""
+
+from __future__ import unicode_literals
+import json
+import os
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, NotSupportedError, connections, transaction
+
+from .add_default_value import sets_defaults_only
+from .dialects import get_dialect
+from .fanout import fan_out
+from .utils import batches
+
+DEFAULT_BATCH_SIZE = 50
+
+
+def get_batch_size(batch_size=None):
+    """
+    :return: ``batch_size``, falling back to the ``DADV_SCHEMA_BATCH_SIZE``
+             setting
+    """
+    batch_size = batch_size or getattr(
+        settings, "DADV_SCHEMA_BATCH_SIZE", DEFAULT_BATCH_SIZE
+    )
+    return max(batch_size, 1)
+
+
+def default_changes(migration, state, dialect):
+    """
+    :param state: The project state after ``migration``
+    :return: ``(operation, model, defaults)`` 3-tuples of the defaults
+             ``migration`` sets
+    :raises ValueError: if ``migration`` does more than set defaults
+    """
+    changes = []
+    for operation in migration.operations:
+        if not sets_defaults_only(operation):
+            raise ValueError(
+                "{migration} does more than set defaults ({operation}), migrate "
+                "every schema instead.".format(
+                    migration=migration, operation=operation.describe()
+                )
+            )
+
+        model = state.apps.get_model(migration.app_label, operation.model_name)
+        defaults = operation.applicable_defaults(model, dialect)
+        if defaults:
+            changes.append((operation, model, defaults))
+    return changes
+
+
+def quote_string(value):
+    return "'{value}'".format(value=value.replace("'", "''"))
+
+
+class SchemaCheckpoint(object):
+    """
+    The schemas a rollout is done with, kept in a JSON file so an interrupted
+    run can be resumed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path) as checkpoint:
+                self.done = set(json.load(checkpoint))
+
+    def is_done(self, schema):
+        return schema in self.done
+
+    def save(self, schemas):
+        with self.lock:
+            self.done.update(schemas)
+            if not self.path:
+                return
+            # Replace the file in one go, so a crash never leaves half of it
+            temporary_path = "{path}.tmp".format(path=self.path)
+            with open(temporary_path, "w") as checkpoint:
+                json.dump(sorted(self.done), checkpoint, indent=2)
+            os.replace(temporary_path, self.path)
+
+
+class SchemaRollout(object):
+    """
+    Apply the default changes of ``migration`` to schemas that all have the
+    tables of the migration state.
+
+    :param state: The project state after ``migration``
+    :param batch_size: How many schemas to change per transaction. Defaults to
+                       the ``DADV_SCHEMA_BATCH_SIZE`` setting or 50.
+    :param record: Also record ``migration`` as applied in the
+                   ``django_migrations`` table of every schema
+    :raises NotSupportedError: if the database can't qualify tables with a
+                               schema
+    """
+
+    def __init__(
+        self, migration, state, using=DEFAULT_DB_ALIAS, batch_size=None, record=False
+    ):
+        self.migration = migration
+        self.using = using
+        self.dialect = get_dialect(connections[using])
+        if self.dialect is None or not self.dialect.supports_schemas:
+            raise NotSupportedError(
+                "Rolling out defaults to schemas is only supported on PostgreSQL."
+            )
+
+        self.batch_size = get_batch_size(batch_size)
+        self.record = record
+        self.changes = default_changes(migration, state, self.dialect)
+
+    def check_schema(self, schema):
+        if not schema or any(quote in schema for quote in self.dialect.name_quotes):
+            raise ValueError("Invalid schema name: {schema!r}".format(schema=schema))
+
+    def schema_statements(self, schema):
+        """
+        :return: The statements changing the defaults of ``schema``
+        """
+        self.check_schema(schema)
+        statements = []
+        for operation, model, defaults in self.changes:
+            sql = operation.forwards_sql(self.dialect, model, defaults, schema=schema)
+            lock_timeout = operation.get_option("lock_timeout")
+            if lock_timeout is None:
+                statements.append(sql)
+            else:
+                statements += [
+                    self.dialect.lock_timeout_sql(lock_timeout),
+                    sql,
+                    self.dialect.reset_lock_timeout_sql,
+                ]
+
+        if self.record:
+            statements.append(self.record_sql(schema))
+        return statements
+
+    def record_sql(self, schema):
+        """
+        :return: The statement recording the migration as applied in
+                 ``schema``, unless it already is, for instance by
+                 ``migrate`` or by a run that didn't save its checkpoint
+        """
+        return (
+            "INSERT INTO {table} (app, name, applied) "
+            "SELECT {app}, {name}, now() "
+            "WHERE NOT EXISTS "
+            "(SELECT 1 FROM {table} WHERE app = {app} AND name = {name})".format(
+                table=self.dialect.quote_table("django_migrations", schema),
+                app=quote_string(self.migration.app_label),
+                name=quote_string(self.migration.name),
+            )
+        )
+
+    def batch_sql(self, schemas):
+        """
+        :return: The statements of all ``schemas``, as a single string
+        """
+        return "\n".join(
+            "{statement};".format(statement=statement.rstrip(";"))
+            for schema in schemas
+            for statement in self.schema_statements(schema)
+        )
+
+    def batches(self, schemas, checkpoint=None):
+        """
+        :return: Lists of at most ``batch_size`` of the ``schemas`` that
+                 ``checkpoint`` doesn't know to be done
+        """
+        if checkpoint is not None:
+            schemas = [schema for schema in schemas if not checkpoint.is_done(schema)]
+        return list(batches(schemas, self.batch_size))
+
+    def apply_batch(self, schemas):
+        """
+        Change the defaults of ``schemas`` in one transaction and round trip.
+
+        :return: The number of schemas changed
+        """
+        connection = connections[self.using]
+        try:
+            with transaction.atomic(using=self.using), connection.cursor() as cursor:
+                cursor.execute(self.batch_sql(schemas))
+        finally:
+            # Connections are per thread, the pool's threads don't close them
+            connection.close()
+        return len(schemas)
+
+    def run(self, schemas, workers=None, checkpoint=None, callback=None):
+        """
+        Apply the batches of ``schemas`` on at most ``workers`` connections.
+        A failed batch is rolled back as a whole and doesn't stop the others.
+
+        :param checkpoint: A :class:`SchemaCheckpoint` to skip the schemas
+                           that are done and to record the batches that
+                           succeed in
+        :param callback: Called with every ``(batch, result, error)`` 3-tuple
+                         as soon as the batch is done
+        :return: ``(batch, result, error)`` 3-tuples, see
+                 :func:`~.fanout.fan_out`
+        """
+        for schema in schemas:
+            self.check_schema(schema)
+
+        def done(batch, result, error):
+            if error is None and checkpoint is not None:
+                checkpoint.save(batch)
+            if callback is not None:
+                callback(batch, result, error)
+
+        return fan_out(
+            self.apply_batch,
+            self.batches(list(schemas), checkpoint),
+            workers=workers,
+            callback=done,
+        )
@@ -0,0 +1,105 @@
+# Copyright 2018 3YOURMIND GmbH
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+SQLite keeps column defaults in the table definition and cannot alter them,
+so they are changed by rebuilding the table the way Django alters columns on
+SQLite: create a new table, copy the rows over and swap the tables.
+"""
+
+from __future__ import unicode_literals
+import re
+from contextlib import contextmanager
+
+# Defaults that can follow DEFAULT as they are, anything else is an
+# expression, which has to be parenthesized.
+SIMPLE_DEFAULT = re.compile(
+    r"^('([^']|'')*'|[-+]?\d+(\.\d+)?|NULL|TRUE|FALSE|CURRENT_(TIME|DATE|TIMESTAMP)"
+    r"|X'[0-9A-F]*')$",
+    re.IGNORECASE,
+)
+
+
+def set_column_defaults(schema_editor, model, column_defaults):
+    """
+    Give the columns of ``model`` new defaults.
+
+    The schema editor of ``django_add_default_value.backends.sqlite3``
+    collects the changes and rebuilds every table once per migration, with
+    any other schema editor the table is rebuilt right away.
+
+    :param column_defaults: The new default SQL per column name, None to
+                            drop a default
+    """
+    if hasattr(schema_editor, "set_column_defaults"):
+        schema_editor.set_column_defaults(model, column_defaults)
+        return
+
+    with rendering_defaults(schema_editor, model._meta.db_table, column_defaults):
+        schema_editor._remake_table(model)
+
+
+def current_defaults(schema_editor, table):
+    """
+    :return: The default SQL per column of ``table``, for the columns that
+             have one
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "PRAGMA table_info({table})".format(table=schema_editor.quote_name(table))
+        )
+        return {row[1]: row[4] for row in cursor.fetchall() if row[4] is not None}
+
+
+def rename_columns(defaults, renamed_columns):
+    return {
+        renamed_columns.get(column, column): default
+        for column, default in defaults.items()
+    }
+
+
+def default_clause(default):
+    if SIMPLE_DEFAULT.match(default):
+        return "DEFAULT {default}".format(default=default)
+    return "DEFAULT ({default})".format(default=default)
+
+
+@contextmanager
+def rendering_defaults(schema_editor, table, column_defaults, renamed_columns=None):
+    """
+    Make the column definitions of ``schema_editor`` include the current
+    defaults of ``table``, updated with ``column_defaults``, while the table
+    gets rebuilt.
+
+    :param renamed_columns: The new name per column that gets renamed in the
+                            rebuild
+    """
+    defaults = rename_columns(
+        current_defaults(schema_editor, table), renamed_columns or {}
+    )
+    defaults.update(column_defaults)
+
+    column_sql = schema_editor.column_sql
+
+    def column_sql_with_default(model, field, include_default=False):
+        sql, params = column_sql(model, field, include_default=include_default)
+        default = defaults.get(field.column)
+        if sql is not None and default is not None and not include_default:
+            sql = "{sql} {default}".format(sql=sql, default=default_clause(default))
+        return sql, params
+
+    schema_editor.column_sql = column_sql_with_default
+    try:
+        yield
+    finally:
+        del schema_editor.column_sql
@@ -0,0 +1,180 @@
+# Copyright 2018 3YOURMIND GmbH
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+The database defaults in the migration state.
+
+The operations record the defaults they set in the project state, so which
+columns have a database default is known from the migrations alone, without
+asking the database. Django rejects unknown ``Meta`` options and drops
+unknown attributes when cloning states, so a default is recorded on a copy of
+the field in the model state. States are cloned without copying their fields,
+so the earlier states, which are used to unapply a migration, keep the field
+without it.
+
+A field is only copied when its default changes. The copies belong to the
+state alone, nothing else keeps them, so they go with the state.
+
+Operations that replace a field, such as ``AlterField``, forget its database
+default, as Django may drop the default when it alters the column.
+"""
+
+from __future__ import unicode_literals
+from collections import OrderedDict
+
+from django.db.migrations.operations.fields import AlterField
+
+
+class NoDefault(object):
+    def __repr__(self):
+        return "NO_DEFAULT"
+
+
+# The database default of a field without one, None being a valid default
+NO_DEFAULT = NoDefault()
+
+DEFAULT_ATTRIBUTE = "_dadv_database_default"
+
+
+def get_model_state(state, app_label, model_name):
+    return state.models.get((app_label, model_name.lower()))
+
+
+def field_items(model_state):
+    # The fields are a list of pairs before Django 3.1
+    fields = model_state.fields
+    return fields.items() if isinstance(fields, dict) else fields
+
+
+def find_field(model_state, name):
+    """
+    :return: The name and field of ``model_state`` called ``name``, or
+             ``(None, None)``
+    """
+    fields = model_state.fields
+    if isinstance(fields, dict) and name in fields:
+        return name, fields[name]
+
+    for field_name, field in field_items(model_state):
+        if field_name.lower() == name.lower():
+            return field_name, field
+    return None, None
+
+
+def replace_field(model_state, name, field):
+    if isinstance(model_state.fields, dict):
+        model_state.fields[name] = field
+    else:
+        model_state.fields = [
+            (field_name, field if field_name == name else old_field)
+            for field_name, old_field in model_state.fields
+        ]
+
+
+def set_state_default(state, app_label, model_name, name, value=NO_DEFAULT):
+    """
+    Record ``value`` as the database default of a field in ``state``, or
+    forget the default if ``value`` is ``NO_DEFAULT``. Fields that aren't in
+    the state are ignored.
+    """
+    set_state_defaults(state, app_label, model_name, [(name, value)])
+
+
+def set_state_defaults(state, app_label, model_name, defaults):
+    """
+    Record the ``(name, value)`` pairs of ``defaults`` like
+    :func:`set_state_default`, looking the model up once.
+    """
+    model_state = get_model_state(state, app_label, model_name)
+    if model_state is None:
+        return
+
+    for name, value in defaults:
+        field_name, field = find_field(model_state, name)
+        if field is None or same_value(
+            getattr(field, DEFAULT_ATTRIBUTE, NO_DEFAULT), value
+        ):
+            continue
+        replace_field(model_state, field_name, recorded_field(field, value))
+
+
+def recorded_field(field, value):
+    """
+    :return: A copy of ``field`` with the database default ``value``
+    """
+    recorded = copy_field(field)
+    if value is NO_DEFAULT:
+        del recorded.__dict__[DEFAULT_ATTRIBUTE]
+    else:
+        recorded.__dict__[DEFAULT_ATTRIBUTE] = value
+    return recorded
+
+
+def copy_field(field):
+    # Leave the field of the earlier states alone. Fields in states are not
+    # bound to models, so a shallow copy of their attributes is all it takes.
+    copied = object.__new__(field.__class__)
+    copied.__dict__.update(field.__dict__)
+    return copied
+
+
+def set_state_null(state, app_label, model_name, name, null):
+    """
+    Make a field in ``state`` nullable, or not, keeping its database default.
+    Fields that aren't in the state are ignored.
+    """
+    model_state = get_model_state(state, app_label, model_name)
+    if model_state is None:
+        return
+
+    field_name, field = find_field(model_state, name)
+    if field is None or field.null == null:
+        return
+
+    altered = copy_field(field)
+    altered.null = null
+    AlterField(model_name, field_name, altered).state_forwards(app_label, state)
+
+
+def same_value(recorded, value):
+    # Not only equal, True and 1 are different defaults
+    return recorded is value or (type(recorded) is type(value) and recorded == value)
+
+
+def get_state_default(state, app_label, model_name, name):
+    """
+    :return: The database default recorded for a field in ``state``, or
+             ``NO_DEFAULT``
+    """
+    model_state = get_model_state(state, app_label, model_name)
+    if model_state is None:
+        return NO_DEFAULT
+
+    __, field = find_field(model_state, name)
+    return getattr(field, DEFAULT_ATTRIBUTE, NO_DEFAULT)
+
+
+def get_state_defaults(state, app_label, model_name):
+    """
+    :return: The database defaults recorded for the fields of a model in
+             ``state``, by field name
+    """
+    model_state = get_model_state(state, app_label, model_name)
+    if model_state is None:
+        return OrderedDict()
+
+    return OrderedDict(
+        (name, getattr(field, DEFAULT_ATTRIBUTE))
+        for name, field in field_items(model_state)
+        if hasattr(field, DEFAULT_ATTRIBUTE)
+    )
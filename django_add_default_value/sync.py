@@ -0,0 +1,173 @@
+# Copyright 2018 3YOURMIND GmbH
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Find the model defaults the database doesn't know about and build the
+migrations transferring them.
+
+The live defaults come from one catalog query per database, see
+:class:`~.catalog.CatalogSnapshot`, so the cost doesn't grow with the number
+of models.
+"""
+
+from __future__ import unicode_literals
+import re
+import warnings
+from collections import OrderedDict
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from django.apps import apps
+from django.db import migrations
+
+from .add_default_value import AddDefaultValue, AddDefaultValues
+from .catalog import NOT_PRESENT
+
+# The types of the values the dialects render as SQL literals. Subclasses,
+# like the members of an enum or of Django's choices, are left out on purpose:
+# they render as whatever their __format__ returns.
+LITERAL_TYPES = (str, bool, int, float, Decimal, date, datetime, time)
+
+
+def literal_defaults(app_configs):
+    """
+    :return: ``(model, field, value)`` 3-tuples for the fields of the models
+             in ``app_configs`` with a default that isn't computed in Python.
+             Defaults of a type the dialects can't render as SQL, like an
+             enum, a ``timedelta``, a ``UUID``, a list, a dict or bytes, are
+             left out with a warning listing them.
+    """
+    fields = [
+        (model, field)
+        for app_config in app_configs
+        for model in app_config.get_models()
+        if has_own_table(model)
+        for field in model._meta.local_concrete_fields
+        if has_literal_default(field)
+    ]
+    unrenderable = [
+        "{label}.{field} ({type})".format(
+            label=model._meta.label,
+            field=field.name,
+            type=type(field.default).__name__,
+        )
+        for model, field in fields
+        if not is_renderable(field.default)
+    ]
+    if unrenderable:
+        warnings.warn(
+            "The defaults of these fields cannot be rendered as SQL and are "
+            "left out: {fields}.".format(fields=", ".join(unrenderable))
+        )
+    return [
+        (model, field, field.default)
+        for model, field in fields
+        if is_renderable(field.default)
+    ]
+
+
+def has_own_table(model):
+    options = model._meta
+    return options.managed and not options.proxy and not options.swapped
+
+
+def has_literal_default(field):
+    return (
+        field.has_default()
+        and not callable(field.default)
+        and field.default is not None
+        and not field.primary_key
+    )
+
+
+def is_renderable(value):
+    return type(value) in LITERAL_TYPES
+
+
+def missing_defaults(defaults, snapshot):
+    """
+    :param defaults: ``(model, field, value)`` 3-tuples
+    :param snapshot: The :class:`~.catalog.CatalogSnapshot` to compare with
+    :return: Those ``defaults`` the database doesn't have yet. Columns that
+             don't exist in the database, for instance because a migration
+             adding them is pending, are left out.
+    """
+    dialect = snapshot.dialect
+    missing = []
+    for model, field, value in defaults:
+        table = model._meta.db_table
+        if snapshot.get_default(table, field.column) is NOT_PRESENT:
+            continue
+        if not AddDefaultValue(model.__name__, field.name, value).can_apply_default(
+            model, field.name, dialect
+        ):
+            continue
+        if not snapshot.has_default(table, field.column, dialect.render_default(value)):
+            missing.append((model, field, value))
+    return missing
+
+
+def default_operations(defaults):
+    """
+    :param defaults: ``(model, field, value)`` 3-tuples
+    :return: The operations transferring ``defaults`` per app label, with a
+             single operation per table
+    """
+    tables = OrderedDict()
+    for model, field, value in defaults:
+        tables.setdefault(model, []).append((field.name, value))
+
+    operations = OrderedDict()
+    for model, table_defaults in tables.items():
+        if len(table_defaults) == 1:
+            ((name, value),) = table_defaults
+            operation = AddDefaultValue(
+                model_name=model.__name__, name=name, value=value
+            )
+        else:
+            operation = AddDefaultValues(
+                model_name=model.__name__, defaults=table_defaults
+            )
+        operations.setdefault(model._meta.app_label, []).append(operation)
+    return operations
+
+
+def build_migrations(operations, loader, name="sync_db_defaults"):
+    """
+    :param operations: Operations per app label
+    :param loader: A :class:`~django.db.migrations.loader.MigrationLoader`
+    :return: One migration per app, following the latest migrations of that
+             app
+    """
+    built = []
+    for app_label, app_operations in operations.items():
+        leaves = loader.graph.leaf_nodes(app_label)
+        number = max([migration_number(leaf_name) for __, leaf_name in leaves] + [0])
+        migration = migrations.Migration(
+            "{number:04d}_{name}".format(number=number + 1, name=name), app_label
+        )
+        migration.dependencies = list(leaves)
+        migration.operations = app_operations
+        built.append(migration)
+    return built
+
+
+def migration_number(name):
+    match = re.match(r"^\d+", name)
+    return int(match.group()) if match else 0
+
+
+def get_app_configs(app_labels=None):
+    if not app_labels:
+        return list(apps.get_app_configs())
+    return [apps.get_app_config(app_label) for app_label in app_labels]
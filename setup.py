@@ -17,6 +17,13 @@ from setuptools import setup
 
 setup(
     version='0.10.0',
-    packages=['django_add_default_value'],
+    packages=[
+        'django_add_default_value',
+        'django_add_default_value.backends',
+        'django_add_default_value.backends.cockroachdb',
+        'django_add_default_value.backends.sqlite3',
+        'django_add_default_value.management',
+        'django_add_default_value.management.commands',
+    ],
     long_description_content_type='text/markdown',
 )
@@ -0,0 +1,25 @@
+from django.db import migrations, models
+from django_add_default_value import AddDefaultValues
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dadv", "0005_testcustomcolumnname"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TestMultipleDefaults",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("title", models.CharField(default="Untitled", max_length=15)),
+                ("is_draft", models.BooleanField(default=True)),
+                ("priority", models.IntegerField(default=3)),
+            ],
+        ),
+        AddDefaultValues(
+            model_name="TestMultipleDefaults",
+            defaults=[("title", "Untitled"), ("is_draft", True), ("priority", 3)],
+        ),
+    ]
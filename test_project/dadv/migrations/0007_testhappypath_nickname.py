@@ -0,0 +1,18 @@
+from django.db import migrations, models
+from django_add_default_value import AddFieldWithDefault
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dadv", "0006_testmultipledefaults"),
+    ]
+
+    operations = [
+        AddFieldWithDefault(
+            model_name="testhappypath",
+            name="nickname",
+            field=models.CharField(default="Happy", max_length=15),
+            value="Happy",
+        ),
+    ]
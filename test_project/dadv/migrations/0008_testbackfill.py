@@ -0,0 +1,32 @@
+from django.db import migrations, models
+import django.utils.timezone
+from django_add_default_value import AddDefaultValues, NOW
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dadv", "0007_testhappypath_nickname"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TestBackfill",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                (
+                    "note",
+                    models.CharField(default="n/a", max_length=15, null=True),
+                ),
+                (
+                    "touched",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, null=True
+                    ),
+                ),
+            ],
+        ),
+        AddDefaultValues(
+            model_name="TestBackfill", defaults=[("note", "n/a"), ("touched", NOW)]
+        ),
+    ]
@@ -0,0 +1,33 @@
+import uuid
+
+from django.db import migrations, models
+import django.utils.timezone
+from django_add_default_value import AddDefaultValues
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dadv", "0008_testbackfill"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TestCallableDefaults",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("token", models.UUIDField(default=uuid.uuid4)),
+                (
+                    "created",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+            ],
+        ),
+        AddDefaultValues(
+            model_name="TestCallableDefaults",
+            defaults=[
+                ("token", uuid.uuid4),
+                ("created", django.utils.timezone.now),
+            ],
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from datetime import date
+import uuid
 from django.utils import timezone
 
 
@@ -19,8 +20,28 @@ class TestHappyPath(models.Model):
     dob = models.DateField(default=date(1970, 1, 1))
     rebirth = models.DateTimeField(default=timezone.now)
     married = models.DateField(default=date.today)
+    nickname = models.CharField(default="Happy", max_length=15)
 
 
 class TestCustomColumnName(models.Model):
     id = models.BigAutoField(primary_key=True, db_column="custom_id")
     is_functional = models.BooleanField(default=False, db_column="custom_field")
+
+
+class TestMultipleDefaults(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    title = models.CharField(default="Untitled", max_length=15)
+    is_draft = models.BooleanField(default=True)
+    priority = models.IntegerField(default=3)
+
+
+class TestBackfill(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    note = models.CharField(default="n/a", max_length=15, null=True)
+    touched = models.DateTimeField(default=timezone.now, null=True)
+
+
+class TestCallableDefaults(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    token = models.UUIDField(default=uuid.uuid4)
+    created = models.DateTimeField(default=timezone.now)
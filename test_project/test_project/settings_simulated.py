@@ -0,0 +1,12 @@
+# flake8: noqa
+from .settings import *
+
+# The vendor specific tests run against simulated connections, no server is
+# needed
+DATABASES = {
+    "default": {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"},
+}
+
+SECRET_KEY = "django_tests_secret_key"
+
+PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
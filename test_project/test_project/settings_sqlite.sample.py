@@ -0,0 +1,19 @@
+# flake8: noqa
+from .settings import *
+
+DATABASES = {
+    "default": {
+        # Keeps the defaults of a table across rebuilds and coalesces the
+        # default changes of a migration into one rebuild per table
+        "ENGINE": "django_add_default_value.backends.sqlite3",
+        "NAME": os.path.join(BASE_DIR, "dadv.sqlite3"),
+    },
+}
+
+SECRET_KEY = "django_tests_secret_key"
+
+# Use a fast hasher to speed up tests.
+PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+
+if os.environ.get("ADD_TEST_APP", False):
+    INSTALLED_APPS.append("dadv.apps.DadvConfig")
@@ -1,11 +1,133 @@
 from __future__ import unicode_literals
 
+import enum
+import gc
 import io
 import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
 import unittest
+import uuid
+import warnings
+import weakref
+from contextlib import closing
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-from django.core.management import call_command
-from django.test import TestCase, modify_settings
+from django.apps import apps
+from django.core.management import CommandError, call_command, get_commands
+from django.db import (
+    NotSupportedError,
+    OperationalError,
+    ProgrammingError,
+    connection,
+    migrations,
+    models,
+)
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.operations import RunPython
+from django.db.migrations.optimizer import MigrationOptimizer
+from django.db.migrations.state import ProjectState
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    modify_settings,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext, isolate_apps
+from django.utils import timezone
+
+from django_add_default_value import (
+    AddDefaultAndSetNotNull,
+    AddDefaultValue,
+    AddDefaultValues,
+    AddFieldWithDefault,
+)
+from django_add_default_value import NOW, TODAY, register_function
+from django_add_default_value.backfill import (
+    Backfill,
+    Checkpoint,
+    collect_defaults,
+    update_value,
+)
+from django_add_default_value.bulk import (
+    BulkLoader,
+    BulkLoadQuerySet,
+    CopyStream,
+    copy_text,
+    database_default_fields,
+)
+from django_add_default_value.catalog import (
+    NOT_PRESENT,
+    CatalogSnapshot,
+    clear_snapshots,
+)
+from django_add_default_value.checks import (
+    DRIFT,
+    FingerprintCache,
+    check_database,
+    check_default_drift,
+    declared_defaults,
+    drift_warnings,
+    drifted_defaults,
+    fingerprint,
+)
+from django_add_default_value.cockroachdb import (
+    GroupedDefaultsMixin,
+    SchemaChangeJobError,
+    wait_for_jobs,
+)
+from django_add_default_value.dialects import (
+    METADATA,
+    REWRITE,
+    CockroachDBDialect,
+    MSSQLDialect,
+    MySQLDialect,
+    PostgreSQLDialect,
+    SQLiteDialect,
+    get_dialect,
+    reset_dialects,
+)
+from django_add_default_value.fanout import fan_out
+from django_add_default_value.functions import unregister_function
+from django_add_default_value.instrumentation import (
+    EXECUTED,
+    SKIPPED,
+    UNSUPPORTED,
+    PrometheusTextfile,
+    default_ddl,
+    format_summary,
+)
+from django_add_default_value.management.commands import (
+    migrate_databases,
+    sync_db_defaults,
+)
+from django_add_default_value.offline import (
+    NOT_RENDERED,
+    default_changes,
+    migration_lines,
+    offline_dialect,
+    render_sql,
+)
+from django_add_default_value.pending import PendingDefaultsMixin, statement_table
+from django_add_default_value.plan import (
+    CostEstimate,
+    ExpensiveOperationError,
+    estimate_plan,
+    migration_plan,
+)
+from django_add_default_value.schemas import SchemaCheckpoint, SchemaRollout
+from django_add_default_value.state import (
+    NO_DEFAULT,
+    get_state_default,
+    get_state_defaults,
+)
+from django_add_default_value.sync import literal_defaults, missing_defaults
 
 settings_module = os.environ["DJANGO_SETTINGS_MODULE"]
 
@@ -58,6 +180,21 @@ class MigrationsTesterBase(MigrateMixin, CommandOutputMixin):
     )
 
     custom_column_match = 'ALTER TABLE "dadv_testcustomcolumnname" ALTER COLUMN "custom_field" SET DEFAULT \'False\';'
+    multiple_defaults_match = (
+        'ALTER TABLE "dadv_testmultipledefaults" '
+        "ALTER COLUMN \"title\" SET DEFAULT 'Untitled', "
+        "ALTER COLUMN \"is_draft\" SET DEFAULT 'True', "
+        "ALTER COLUMN \"priority\" SET DEFAULT '3';"
+    )
+    add_field_match = (
+        'ALTER TABLE "dadv_testhappypath" ADD COLUMN "nickname" varchar(15) '
+        "NOT NULL DEFAULT 'Happy';"
+    )
+    callable_match = (
+        'ALTER TABLE "dadv_testcallabledefaults" '
+        'ALTER COLUMN "token" SET DEFAULT gen_random_uuid(), '
+        'ALTER COLUMN "created" SET DEFAULT now();'
+    )
 
     def test_bool_default(self):
         actual = self.get_command_output("sqlmigrate", "dadv", "0001")
@@ -93,6 +230,1410 @@ class MigrationsTesterBase(MigrateMixin, CommandOutputMixin):
         actual = self.get_command_output("sqlmigrate", "dadv", "0005")
         self.assertIn(self.custom_column_match, actual)
 
+    def test_multiple_defaults(self):
+        """Make sure several defaults of one table are set in one statement"""
+        actual = self.get_command_output("sqlmigrate", "dadv", "0006")
+        self.assertIn(self.multiple_defaults_match, actual)
+
+    def test_add_field_with_default(self):
+        """Make sure the column is added with its default in one statement"""
+        actual = self.get_command_output("sqlmigrate", "dadv", "0007")
+        self.assertIn(self.add_field_match, actual)
+        self.assertNotIn("DROP DEFAULT", actual)
+
+    def test_callable_defaults(self):
+        """Make sure callables are generated by the database"""
+        actual = self.get_command_output("sqlmigrate", "dadv", "0009")
+        self.assertIn(self.callable_match, actual)
+
+    @unittest.skipIf(
+        settings_module != "test_project.settings_pgsql",
+        "Executing DDL statements while in a transaction on databases that can't "
+        "perform a rollback is prohibited.",
+    )
+    def test_backfill_defaults(self):
+        """Make sure existing NULL rows get the default in batches"""
+        call_command("migrate", "dadv", verbosity=0)
+        model = apps.get_model("dadv", "TestBackfill")
+        model.objects.bulk_create([model(note=None) for __ in range(5)])
+        with self.modify_settings(
+            INSTALLED_APPS={"append": "django_add_default_value"}
+        ):
+            self.get_command_output("backfill_defaults", "dadv", batch_size=2)
+        self.assertEqual(model.objects.filter(note="n/a").count(), 5)
+
+
+class OptimizerTests(SimpleTestCase):
+    def optimize(self, operations):
+        return MigrationOptimizer().optimize(operations, "dadv")
+
+    def assertOptimizesTo(self, operations, expected):
+        actual = [op.deconstruct() for op in self.optimize(operations)]
+        self.assertEqual(actual, [op.deconstruct() for op in expected])
+
+    def test_remove_field_drops_default(self):
+        """A default on a field that gets removed later is pointless"""
+        remove = migrations.RemoveField("TestHappyPath", "name")
+        self.assertOptimizesTo(
+            [AddDefaultValue("TestHappyPath", "name", "Happy path"), remove], [remove]
+        )
+
+    def test_remove_field_drops_one_of_many_defaults(self):
+        remove = migrations.RemoveField("TestHappyPath", "name")
+        self.assertOptimizesTo(
+            [
+                AddDefaultValues(
+                    "TestHappyPath", [("name", "Happy path"), ("dob", None)]
+                ),
+                remove,
+            ],
+            [AddDefaultValues("TestHappyPath", [("dob", None)]), remove],
+        )
+
+    def test_delete_model_drops_default(self):
+        delete = migrations.DeleteModel("TestHappyPath")
+        self.assertOptimizesTo(
+            [AddDefaultValue("TestHappyPath", "name", "Happy path"), delete], [delete]
+        )
+
+    def test_later_default_wins(self):
+        later = AddDefaultValue("testhappypath", "name", "Sad path")
+        self.assertOptimizesTo(
+            [AddDefaultValue("TestHappyPath", "name", "Happy path"), later], [later]
+        )
+
+    def test_defaults_on_one_model_are_merged(self):
+        self.assertOptimizesTo(
+            [
+                AddDefaultValue("TestHappyPath", "name", "Happy path"),
+                AddDefaultValue("TestHappyPath", "dob", None),
+            ],
+            [
+                AddDefaultValues(
+                    "TestHappyPath", [("name", "Happy path"), ("dob", None)]
+                )
+            ],
+        )
+
+    def test_add_field_remove_field_across_default(self):
+        """Adding and removing a field elides its default as well"""
+        self.assertOptimizesTo(
+            [
+                migrations.AddField(
+                    "TestHappyPath", "nickname", models.CharField(max_length=15)
+                ),
+                AddDefaultValue("TestHappyPath", "nickname", "Happy"),
+                migrations.RemoveField("TestHappyPath", "nickname"),
+            ],
+            [],
+        )
+
+    def test_unrelated_operations_optimize_across(self):
+        """A default is no barrier for operations on other fields"""
+        default = AddDefaultValue("TestHappyPath", "name", "Happy path")
+        self.assertOptimizesTo(
+            [
+                migrations.AddField(
+                    "TestHappyPath", "nickname", models.CharField(max_length=15)
+                ),
+                default,
+                migrations.RemoveField("TestHappyPath", "nickname"),
+            ],
+            [default],
+        )
+
+    def test_related_operations_do_not_optimize_across(self):
+        operations = [
+            migrations.AddField(
+                "TestHappyPath", "nickname", models.CharField(max_length=15)
+            ),
+            AddDefaultValue("TestHappyPath", "nickname", "Happy"),
+            migrations.AlterField(
+                "TestHappyPath", "nickname", models.CharField(max_length=30)
+            ),
+        ]
+        self.assertEqual(len(self.optimize(operations)), 3)
+
+    def test_defaults_merge_across_changes_to_their_fields(self):
+        """Every field keeps its default on the same side of the AlterField"""
+        alter = migrations.AlterField(
+            "TestHappyPath", "name", models.CharField(max_length=30)
+        )
+        self.assertOptimizesTo(
+            [
+                AddDefaultValue("TestHappyPath", "name", "Happy path"),
+                alter,
+                AddDefaultValue("TestHappyPath", "dob", None),
+            ],
+            [
+                AddDefaultValues(
+                    "TestHappyPath", [("name", "Happy path"), ("dob", None)]
+                ),
+                alter,
+            ],
+        )
+
+    def test_add_field_with_default_is_not_folded_into_create_model(self):
+        """CreateModel would silently lose the database default"""
+        operations = [
+            migrations.CreateModel(
+                "TestHappyPath",
+                [("id", models.BigAutoField(primary_key=True, serialize=False))],
+            ),
+            AddFieldWithDefault(
+                "TestHappyPath",
+                "nickname",
+                models.CharField(default="Happy", max_length=15),
+                "Happy",
+            ),
+        ]
+        self.assertEqual(len(self.optimize(operations)), 2)
+
+    def test_add_field_with_default_takes_later_default(self):
+        field = models.CharField(default="Happy", max_length=15)
+        self.assertOptimizesTo(
+            [
+                AddFieldWithDefault("TestHappyPath", "nickname", field, "Happy"),
+                AddDefaultValue("TestHappyPath", "nickname", "Sad"),
+            ],
+            [AddFieldWithDefault("TestHappyPath", "nickname", field, "Sad")],
+        )
+
+    def test_add_field_with_default_remove_field(self):
+        field = models.CharField(default="Happy", max_length=15)
+        self.assertOptimizesTo(
+            [
+                AddFieldWithDefault("TestHappyPath", "nickname", field, "Happy"),
+                migrations.RemoveField("TestHappyPath", "nickname"),
+            ],
+            [],
+        )
+
+
+class MySQLConnectionStub:
+    vendor = "mysql"
+    alias = "stub"
+
+    def __init__(self, version, is_mariadb=False):
+        self.mysql_version = version
+        self.mysql_is_mariadb = is_mariadb
+
+
+class MySQLAlterOptionsTests(SimpleTestCase):
+    def options(self, connection, **kwargs):
+        operation = AddDefaultValue("TestHappyPath", "name", "Happy path", **kwargs)
+        return operation.alter_table_options(MySQLDialect.from_connection(connection))
+
+    def test_no_options_by_default(self):
+        self.assertEqual(self.options(MySQLConnectionStub((8, 0, 34))), [])
+
+    def test_instant_takes_no_lock_clause(self):
+        self.assertEqual(
+            self.options(
+                MySQLConnectionStub((8, 0, 34)), algorithm="INSTANT", lock="NONE"
+            ),
+            ["ALGORITHM=INSTANT"],
+        )
+
+    def test_instant_falls_back_to_inplace(self):
+        self.assertEqual(
+            self.options(
+                MySQLConnectionStub((5, 7, 40)), algorithm="INSTANT", lock="NONE"
+            ),
+            ["ALGORITHM=INPLACE", "LOCK=NONE"],
+        )
+
+    def test_mariadb_instant(self):
+        self.assertEqual(
+            self.options(
+                MySQLConnectionStub((10, 5, 0), is_mariadb=True),
+                algorithm="INSTANT",
+                lock="NONE",
+            ),
+            ["ALGORITHM=INSTANT", "LOCK=NONE"],
+        )
+
+    @override_settings(DADV_MYSQL_ALGORITHM="INPLACE")
+    def test_setting(self):
+        self.assertEqual(
+            self.options(MySQLConnectionStub((8, 0, 34))), ["ALGORITHM=INPLACE"]
+        )
+
+    def test_copying_server_fails_fast(self):
+        with self.assertRaises(NotSupportedError):
+            self.options(MySQLConnectionStub((5, 5, 62)), algorithm="INPLACE")
+
+    def test_unknown_algorithm(self):
+        with self.assertRaises(ValueError):
+            AddDefaultValue("TestHappyPath", "name", "Happy path", algorithm="COPY")
+
+
+class PostgreSQLConnectionStub:
+    vendor = "postgresql"
+    alias = "stub"
+
+
+class SchemaEditorStub:
+    def __init__(self, connection, collect_sql=False, failures=0):
+        self.connection = connection
+        self.collect_sql = collect_sql
+        self.failures = failures
+        self.executed = []
+
+    def execute(self, sql, params=()):
+        if sql.startswith("ALTER") and self.failures:
+            self.failures -= 1
+            cause = Exception()
+            cause.pgcode = "55P03"
+            raise OperationalError("canceling statement due to lock timeout") from cause
+        self.executed.append(sql)
+
+
+@mock.patch("django_add_default_value.add_default_value.time.sleep")
+@mock.patch("django_add_default_value.add_default_value.transaction.atomic")
+class LockTimeoutTests(SimpleTestCase):
+    sql = 'ALTER TABLE "dadv_testhappypath" ALTER COLUMN "name" SET DEFAULT \'x\';'
+
+    def operation(self, **kwargs):
+        return AddDefaultValue("TestHappyPath", "name", "x", **kwargs)
+
+    def test_no_lock_timeout_by_default(self, atomic, sleep):
+        schema_editor = SchemaEditorStub(PostgreSQLConnectionStub())
+        self.operation().execute(schema_editor, self.sql)
+        self.assertEqual(schema_editor.executed, [self.sql])
+
+    def test_lock_timeout_is_set_locally(self, atomic, sleep):
+        schema_editor = SchemaEditorStub(PostgreSQLConnectionStub(), collect_sql=True)
+        self.operation(lock_timeout=500).execute(schema_editor, self.sql)
+        self.assertEqual(
+            schema_editor.executed,
+            [
+                "SET LOCAL lock_timeout = '500ms'",
+                self.sql,
+                "SET LOCAL lock_timeout TO DEFAULT",
+            ],
+        )
+        atomic.assert_not_called()
+
+    def test_retries_after_lock_timeout(self, atomic, sleep):
+        schema_editor = SchemaEditorStub(PostgreSQLConnectionStub(), failures=2)
+        with self.assertLogs("django_add_default_value", "WARNING") as logs:
+            self.operation(lock_timeout=500, lock_retries=2).execute(
+                schema_editor, self.sql
+            )
+        self.assertEqual(len(logs.records), 2)
+        self.assertIn(self.sql, schema_editor.executed)
+        self.assertEqual(atomic.call_count, 3)
+        self.assertEqual(sleep.call_count, 2)
+
+    @override_settings(DADV_LOCK_TIMEOUT=500, DADV_LOCK_RETRIES=1)
+    def test_gives_up_after_last_retry(self, atomic, sleep):
+        schema_editor = SchemaEditorStub(PostgreSQLConnectionStub(), failures=2)
+        with self.assertRaises(OperationalError), self.assertLogs(
+            "django_add_default_value", "WARNING"
+        ):
+            self.operation().execute(schema_editor, self.sql)
+        self.assertEqual(sleep.call_count, 1)
+
+
+class StateStub:
+    apps = apps
+
+
+@modify_settings(INSTALLED_APPS={"append": "dadv.apps.DadvConfig"})
+class InstrumentationTests(SimpleTestCase):
+    def setUp(self):
+        self.events = []
+        default_ddl.connect(self.record)
+
+    def tearDown(self):
+        default_ddl.disconnect(self.record)
+        reset_dialects()
+
+    def record(self, sender, event, **kwargs):
+        self.events.append(event)
+
+    def schema_editor(self, connection=None, **kwargs):
+        connection = connection or PostgreSQLConnectionStub()
+        connection.alias = "default"
+        return SchemaEditorStub(connection, **kwargs)
+
+    def forwards(self, operation, schema_editor):
+        operation.database_forwards("dadv", schema_editor, StateStub, StateStub)
+
+    def test_executed_statement(self):
+        schema_editor = self.schema_editor()
+        self.forwards(
+            AddDefaultValues(
+                "TestMultipleDefaults", [("title", "Untitled"), ("priority", 3)]
+            ),
+            schema_editor,
+        )
+        (event,) = self.events
+        self.assertEqual(event.status, EXECUTED)
+        self.assertEqual(event.table, "dadv_testmultipledefaults")
+        self.assertEqual(event.columns, ("title", "priority"))
+        self.assertEqual(event.vendor, "postgresql")
+        self.assertEqual(schema_editor.executed, [event.sql])
+
+    @mock.patch("django_add_default_value.add_default_value.transaction.atomic")
+    def test_retry_wait(self, atomic):
+        with mock.patch(
+            "django_add_default_value.add_default_value.time.sleep",
+            side_effect=lambda delay: threading.Event().wait(0.01),
+        ), self.assertLogs("django_add_default_value", "WARNING"):
+            self.forwards(
+                AddDefaultValue(
+                    "TestHappyPath", "name", "x", lock_timeout=500, lock_retries=1
+                ),
+                self.schema_editor(failures=1),
+            )
+        (event,) = self.events
+        self.assertEqual(event.status, EXECUTED)
+        self.assertGreaterEqual(event.retry_wait, 0.01)
+
+    def test_unsupported_default(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            self.forwards(
+                AddDefaultValue("TestTextDefault", "description", "x"),
+                self.schema_editor(MySQLConnectionStub((8, 0, 34))),
+            )
+        (event,) = self.events
+        self.assertEqual((event.status, event.columns), (UNSUPPORTED, ("description",)))
+
+    @override_settings(DADV_SKIP_UNCHANGED_DEFAULTS=True)
+    def test_skipped_default(self):
+        snapshot = CatalogSnapshot(
+            PostgreSQLDialect(), [("dadv_testmultipledefaults", "title", "'Untitled'")]
+        )
+        with mock.patch(
+            "django_add_default_value.add_default_value.get_snapshot",
+            return_value=snapshot,
+        ):
+            self.forwards(
+                AddDefaultValues(
+                    "TestMultipleDefaults", [("title", "Untitled"), ("priority", 3)]
+                ),
+                self.schema_editor(),
+            )
+        self.assertEqual(
+            [(event.status, event.columns) for event in self.events],
+            [(SKIPPED, ("title",)), (EXECUTED, ("priority",))],
+        )
+
+    def test_collected_sql_is_not_reported(self):
+        self.forwards(
+            AddDefaultValue("TestHappyPath", "name", "x"),
+            self.schema_editor(collect_sql=True),
+        )
+        self.assertEqual(self.events, [])
+
+    def test_callbacks(self):
+        callback = mock.Mock()
+        broken = mock.Mock(side_effect=Exception)
+        with override_settings(DADV_DDL_CALLBACKS=[broken, callback]), self.assertLogs(
+            "django_add_default_value.instrumentation", "ERROR"
+        ):
+            self.forwards(
+                AddDefaultValue("TestHappyPath", "name", "x"), self.schema_editor()
+            )
+        callback.assert_called_once_with(self.events[0])
+
+    def test_prometheus_textfile(self):
+        self.forwards(
+            AddDefaultValue("TestHappyPath", "name", "x"), self.schema_editor()
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "dadv.prom")
+            with override_settings(DADV_PROMETHEUS_TEXTFILE=path):
+                PrometheusTextfile()(self.events[0])
+            with open(path) as textfile:
+                metrics = textfile.read()
+        self.assertIn(
+            'dadv_default_ddl_total{database="default",vendor="postgresql",'
+            'table="dadv_testhappypath",status="executed"} 1\n',
+            metrics,
+        )
+
+    def test_summary(self):
+        self.forwards(
+            AddDefaultValue("TestHappyPath", "name", "x"), self.schema_editor()
+        )
+        summary = format_summary(self.events)
+        self.assertIn("executed     dadv_testhappypath(name)", summary)
+        self.assertIn("total of 1 change(s)", summary)
+
+
+@modify_settings(
+    INSTALLED_APPS={"append": ["dadv.apps.DadvConfig", "django_add_default_value"]}
+)
+class MigrateWithTimingsTests(SimpleTestCase, CommandOutputMixin):
+    def migrate(self, *args, **options):
+        connection = PostgreSQLConnectionStub()
+        connection.alias = "default"
+        schema_editor = SchemaEditorStub(connection)
+        AddDefaultValue("TestHappyPath", "name", "x").database_forwards(
+            "dadv", schema_editor, StateStub, StateStub
+        )
+
+    def test_migrate_is_left_alone(self):
+        self.assertEqual(get_commands()["migrate"], "django.core")
+
+    @mock.patch("django.core.management.commands.migrate.Command.handle")
+    def test_summary(self, handle):
+        handle.side_effect = self.migrate
+        output = self.get_command_output("migrate_with_timings", "dadv")
+        self.assertIn("Default value changes:", output)
+        self.assertIn("executed     dadv_testhappypath(name)", output)
+
+    @mock.patch("django.core.management.commands.migrate.Command.handle")
+    def test_summary_after_failure(self, handle):
+        def fail(*args, **options):
+            self.migrate()
+            raise OperationalError("connection lost")
+
+        handle.side_effect = fail
+        output = io.StringIO()
+        with self.assertRaises(OperationalError):
+            call_command("migrate_with_timings", "dadv", stdout=output)
+        self.assertIn("total of 1 change(s)", output.getvalue())
+
+
+class DialectTests(SimpleTestCase):
+    def tearDown(self):
+        reset_dialects()
+
+    def test_quotes_are_per_dialect(self):
+        self.assertEqual(MSSQLDialect().quote_name("name"), "[name]")
+        self.assertEqual(MySQLDialect().quote_name("name"), "`name`")
+        self.assertEqual(PostgreSQLDialect().quote_name("name"), '"name"')
+
+    def test_mariadb_text_defaults(self):
+        self.assertFalse(
+            MySQLDialect(
+                server_version=(10, 2, 0), is_mariadb=True
+            ).supports_default_for_text
+        )
+        self.assertTrue(
+            MySQLDialect(
+                server_version=(10, 10, 0), is_mariadb=True
+            ).supports_default_for_text
+        )
+        self.assertFalse(
+            MySQLDialect(server_version=(8, 0, 34)).supports_default_for_text
+        )
+
+    def test_resolved_once_per_alias(self):
+        connection = MySQLConnectionStub((8, 0, 34))
+        dialect = get_dialect(connection)
+        self.assertEqual(dialect.server_version, (8, 0, 34))
+        connection.mysql_version = (5, 7, 40)
+        self.assertIs(get_dialect(connection), dialect)
+        self.assertEqual(get_dialect(connection).server_version, (8, 0, 34))
+
+    def test_unsupported_vendor(self):
+        connection = mock.Mock(vendor="oracle", alias="stub")
+        self.assertIsNone(get_dialect(connection))
+
+    def test_deprecated_vendor_helpers(self):
+        operation = AddDefaultValue("TestHappyPath", "name", "x")
+        connection = MySQLConnectionStub((10, 3, 2), is_mariadb=True)
+        with self.assertWarns(DeprecationWarning):
+            operation.set_quotes("microsoft")
+        with self.assertWarns(DeprecationWarning):
+            self.assertEqual(operation.quotes["name"], ("[", "]"))
+        with self.assertWarns(DeprecationWarning):
+            self.assertEqual(
+                AddDefaultValue("TestHappyPath", "name", "x").quote_name("name"),
+                '"name"',
+            )
+        with self.assertWarns(DeprecationWarning):
+            self.assertEqual(operation.clean_value("mysql", True), (1, ("'", "'")))
+        with self.assertWarns(DeprecationWarning):
+            self.assertTrue(AddDefaultValue.is_mysql("mysql"))
+        with self.assertWarns(DeprecationWarning):
+            self.assertFalse(AddDefaultValue.is_postgresql("cockroachdb"))
+        with self.assertWarns(DeprecationWarning):
+            self.assertTrue(
+                AddDefaultValue.is_postgresql_syntax_compatible("cockroachdb")
+            )
+        with self.assertWarns(DeprecationWarning):
+            self.assertTrue(AddDefaultValue.is_mariadb(connection))
+        with self.assertWarns(DeprecationWarning):
+            self.assertEqual(AddDefaultValue.mysql_version(connection), (10, 3, 2))
+        with self.assertWarns(DeprecationWarning):
+            self.assertTrue(AddDefaultValue.can_have_default_for_text(connection))
+
+    @modify_settings(INSTALLED_APPS={"append": "dadv.apps.DadvConfig"})
+    def test_can_apply_default_with_a_connection(self):
+        model = apps.get_model("dadv", "TestTextDefault")
+        operation = AddDefaultValue("TestTextDefault", "description", "x")
+        with self.assertWarns(DeprecationWarning):
+            self.assertFalse(
+                operation.can_apply_default(
+                    model, "description", MySQLConnectionStub((8, 0, 34))
+                )
+            )
+
+
+@modify_settings(INSTALLED_APPS={"append": "dadv.apps.DadvConfig"})
+@mock.patch("django_add_default_value.add_default_value.count_rows", return_value=50)
+class CostEstimateTests(SimpleTestCase):
+    def tearDown(self):
+        reset_dialects()
+
+    def forwards(self, operation, connection=None):
+        # MySQL 5.5 copies the table to change a default
+        connection = connection or MySQLConnectionStub((5, 5, 62))
+        connection.alias = "default"
+        schema_editor = SchemaEditorStub(connection)
+        operation.database_forwards("dadv", schema_editor, StateStub, StateStub)
+        return schema_editor
+
+    def test_add_column_cost(self, count_rows):
+        self.assertEqual(PostgreSQLDialect((10, 0)).add_column_cost()[0], REWRITE)
+        self.assertEqual(PostgreSQLDialect((11, 0)).add_column_cost()[0], METADATA)
+        self.assertEqual(
+            PostgreSQLDialect((11, 0)).add_column_cost(volatile=True)[0], REWRITE
+        )
+        self.assertEqual(MySQLDialect((8, 0, 34)).add_column_cost()[0], METADATA)
+        self.assertEqual(MySQLDialect((5, 7, 40)).add_column_cost()[0], REWRITE)
+        self.assertEqual(
+            MySQLDialect((5, 5, 62)).add_column_cost(),
+            (REWRITE, "SHARED", "the server copies the table"),
+        )
+        self.assertEqual(MSSQLDialect().add_column_cost()[0], REWRITE)
+
+    def test_set_default_cost(self, count_rows):
+        self.assertEqual(PostgreSQLDialect((10, 0)).set_default_cost()[0], METADATA)
+        self.assertEqual(
+            MySQLDialect((8, 0, 34)).set_default_cost(lock="none")[:2],
+            (METADATA, "NONE"),
+        )
+        self.assertEqual(MySQLDialect((5, 5, 62)).set_default_cost()[0], REWRITE)
+        self.assertEqual(SQLiteDialect().set_default_cost()[0], REWRITE)
+
+    def test_unknown_rows_never_exceed(self, count_rows):
+        estimate = CostEstimate(None, "table", REWRITE, "EXCLUSIVE", "reason")
+        self.assertFalse(estimate.exceeds(0))
+        estimate.rows = 50
+        self.assertTrue(estimate.exceeds(49))
+        self.assertFalse(estimate.exceeds(None))
+        estimate.kind = METADATA
+        self.assertFalse(estimate.exceeds(0))
+
+    def test_refuses_expensive_operation(self, count_rows):
+        operation = AddDefaultValue("TestHappyPath", "name", "x", max_rows=49)
+        with self.assertRaises(ExpensiveOperationError):
+            self.forwards(operation)
+
+    def test_force(self, count_rows):
+        self.forwards(
+            AddDefaultValue("TestHappyPath", "name", "x", max_rows=0, force=True)
+        )
+        with override_settings(DADV_FORCE=True):
+            self.forwards(AddDefaultValue("TestHappyPath", "name", "x", max_rows=0))
+        count_rows.assert_not_called()
+
+    @override_settings(DADV_MAX_ROWS=0)
+    def test_metadata_changes_are_not_counted(self, count_rows):
+        schema_editor = self.forwards(
+            AddDefaultValue("TestHappyPath", "name", "x"), PostgreSQLConnectionStub()
+        )
+        self.assertEqual(len(schema_editor.executed), 1)
+        count_rows.assert_not_called()
+
+    def test_negative_max_rows(self, count_rows):
+        with self.assertRaises(ValueError):
+            AddDefaultValue("TestHappyPath", "name", "x", max_rows=-1)
+
+    def test_plan_builds_the_state_once(self, count_rows):
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        keys = [
+            key
+            for key in loader.graph.forwards_plan(("dadv", "0009_testcallabledefaults"))
+            if key[0] == "dadv"
+        ]
+        connection = SimulatedConnection(
+            "postgresql", (10, 0, 0), rows=[(5,)], tables=["dadv_testhappypath"]
+        )
+        loader.applied_migrations = {key: None for key in keys[:4]}
+        forwards = [(loader.graph.nodes[key], False) for key in keys[4:]]
+        with mock.patch.object(loader, "project_state", side_effect=AssertionError):
+            estimates = estimate_plan(
+                connection, loader, forwards, get_dialect(connection)
+            )
+        self.assertEqual(
+            [(migration.name, estimate.table) for migration, estimate in estimates],
+            [
+                ("0005_testcustomcolumnname", "dadv_testcustomcolumnname"),
+                ("0006_testmultipledefaults", "dadv_testmultipledefaults"),
+                ("0007_testhappypath_nickname", "dadv_testhappypath"),
+                ("0008_testbackfill", "dadv_testbackfill"),
+                ("0009_testcallabledefaults", "dadv_testcallabledefaults"),
+            ],
+        )
+        # Adding the column rewrites the table before PostgreSQL 11
+        self.assertEqual(estimates[2][1].rows, 5)
+
+        loader.applied_migrations = {key: None for key in keys}
+        backwards = [(migration, True) for migration, __ in reversed(forwards)]
+        with mock.patch.object(loader, "project_state", side_effect=AssertionError):
+            estimates = estimate_plan(
+                connection, loader, backwards, get_dialect(connection)
+            )
+        self.assertEqual(
+            [migration.name for migration, __ in estimates],
+            [
+                "0009_testcallabledefaults",
+                "0008_testbackfill",
+                "0006_testmultipledefaults",
+                "0005_testcustomcolumnname",
+            ],
+        )
+
+
+def make_code():
+    return "abc"
+
+
+@modify_settings(INSTALLED_APPS={"append": "dadv.apps.DadvConfig"})
+class FunctionRegistryTests(SimpleTestCase):
+    def test_vendors_fall_back_to_their_base(self):
+        self.assertEqual(
+            CockroachDBDialect().render_default(uuid.uuid4), "gen_random_uuid()"
+        )
+        self.assertEqual(MSSQLDialect().render_default(timezone.now), "GETDATE()")
+
+    def test_mysql_expression_defaults(self):
+        model = apps.get_model("dadv", "TestCallableDefaults")
+        operation = AddDefaultValue("TestCallableDefaults", "token", uuid.uuid4)
+        self.assertFalse(
+            operation.can_apply_default(model, "token", MySQLDialect((8, 0, 12)))
+        )
+        self.assertTrue(
+            operation.can_apply_default(model, "token", MySQLDialect((8, 0, 13)))
+        )
+        self.assertTrue(
+            operation.can_apply_default(
+                model, "token", MySQLDialect((10, 2, 1), is_mariadb=True)
+            )
+        )
+        with self.assertRaises(NotSupportedError):
+            MySQLDialect((5, 7, 40)).render_default(uuid.uuid4)
+
+    def test_unregistered_callable(self):
+        with self.assertRaises(ValueError):
+            AddDefaultValue("TestHappyPath", "name", make_code)
+
+    def test_register_function(self):
+        register_function(make_code, postgresql="make_code()", volatile=True)
+        self.addCleanup(unregister_function, make_code)
+        operation = AddFieldWithDefault(
+            "TestHappyPath", "code", models.CharField(max_length=3), make_code
+        )
+        self.assertEqual(
+            operation.describe(),
+            "Add field code to TestHappyPath with the default value " "tests.make_code",
+        )
+        self.assertEqual(PostgreSQLDialect().render_default(make_code), "make_code()")
+        self.assertIsNone(MySQLDialect().function_sql(make_code))
+        self.assertTrue(operation.rewrites_table(PostgreSQLDialect((11, 0))))
+
+    def test_stable_functions_do_not_rewrite(self):
+        operation = AddFieldWithDefault(
+            "TestHappyPath", "seen", models.DateTimeField(), timezone.now
+        )
+        self.assertFalse(operation.rewrites_table(PostgreSQLDialect((11, 0))))
+
+
+@modify_settings(INSTALLED_APPS={"append": "dadv.apps.DadvConfig"})
+class BulkLoadTests(SimpleTestCase):
+    def test_database_default_fields(self):
+        model = apps.get_model("dadv", "TestHappyPath")
+        self.assertEqual(
+            [field.name for field in database_default_fields(model, MySQLDialect())],
+            ["name", "dob", "rebirth", "nickname"],
+        )
+
+    def test_copy_text(self):
+        self.assertEqual(
+            [copy_text(value) for value in (None, True, b"\x01", "a\tb\\c", 3)],
+            ["\\N", "t", "\\\\x01", "a\\tb\\\\c", "3"],
+        )
+
+    def test_copy_text_of_other_types(self):
+        self.assertEqual(
+            [
+                copy_text(value)
+                for value in (
+                    Decimal("1.50"),
+                    uuid.UUID(int=1),
+                    timedelta(days=1, seconds=5, microseconds=7),
+                )
+            ],
+            [
+                "1.50",
+                "00000000-0000-0000-0000-000000000001",
+                "1 days 5.000007 seconds",
+            ],
+        )
+
+    @isolate_apps("dadv")
+    def test_copy_refuses_arrays(self):
+        try:
+            from django.contrib.postgres.fields import ArrayField
+        except ImportError:
+            self.skipTest("django.contrib.postgres needs psycopg2")
+
+        class TestArrayDefault(models.Model):
+            tags = ArrayField(models.CharField(max_length=10))
+
+            class Meta:
+                app_label = "dadv"
+
+        field = TestArrayDefault._meta.get_field("tags")
+        value = field.get_db_prep_save(["a", "b"], connection=connection)
+        stream = CopyStream([[value]], [field])
+        with self.assertRaisesMessage(
+            ValueError,
+            "COPY can't encode list values (dadv.TestArrayDefault.tags), load "
+            "these rows with BulkLoader.insert() instead.",
+        ):
+            stream.read()
+
+    @unittest.skipUnless(hasattr(models, "JSONField"), "Django 3.1+ has JSONField")
+    @isolate_apps("dadv")
+    def test_copy_json(self):
+        class TestJSONDefault(models.Model):
+            tags = models.JSONField()
+
+            class Meta:
+                app_label = "dadv"
+
+        field = TestJSONDefault._meta.get_field("tags")
+        value = field.get_db_prep_save({"note": "a\tb"}, connection=connection)
+        self.assertEqual(CopyStream([[value]], [field]).read(), '{"note": "a\\\\tb"}\n')
+
+    def test_copy_stream_is_read_in_chunks(self):
+        stream = CopyStream([["a", None], ["b", 1]] * 3)
+        chunks = iter(lambda: stream.read(5), "")
+        self.assertEqual("".join(chunks), "a\t\\N\nb\t1\n" * 3)
+        self.assertEqual(stream.count, 6)
+
+    def test_given_values_are_sent(self):
+        """Make sure values given for database-defaulted columns aren't lost"""
+        model = apps.get_model("dadv", "TestMultipleDefaults")
+        loader = BulkLoader(model, fields=None)
+        self.assertEqual(
+            [field.name for field in loader.row_fields({"title": "Given"})],
+            ["title"],
+        )
+        self.assertEqual(
+            [field.name for field in loader.row_fields(model(title="Given"))],
+            ["title", "is_draft", "priority"],
+        )
+
+    def test_values_of_left_out_fields_raise(self):
+        model = apps.get_model("dadv", "TestMultipleDefaults")
+        loader = BulkLoader(model, fields=["title"])
+        with self.assertRaisesMessage(ValueError, "without the field(s) priority"):
+            loader.row_fields({"title": "Given", "priority": 1})
+
+
+class StateDefaultsTests(SimpleTestCase):
+    def setUp(self):
+        self.state = ProjectState()
+        migrations.CreateModel(
+            "Book",
+            [
+                ("id", models.AutoField(primary_key=True)),
+                ("title", models.CharField(default="x", max_length=10)),
+            ],
+        ).state_forwards("library", self.state)
+
+    def forwards(self, operation):
+        to_state = self.state.clone()
+        operation.state_forwards("library", to_state)
+        return to_state
+
+    def test_recorded_in_later_state_only(self):
+        to_state = self.forwards(AddDefaultValue("Book", "title", "x"))
+        self.assertEqual(get_state_default(to_state, "library", "book", "title"), "x")
+        self.assertIs(
+            get_state_default(self.state, "library", "Book", "title"), NO_DEFAULT
+        )
+        self.assertEqual(
+            to_state.apps.get_model("library", "Book")._meta.get_field("title").default,
+            "x",
+        )
+
+    def test_copies_go_with_the_state(self):
+        operation = AddDefaultValue("Book", "title", "x")
+        to_state = self.forwards(operation)
+        copied = weakref.ref(dict(to_state.models["library", "book"].fields)["title"])
+        self.assertEqual(get_state_default(to_state, "library", "book", "title"), "x")
+        del to_state
+        gc.collect()
+        self.assertIsNone(copied())
+        self.assertEqual(
+            get_state_default(self.forwards(operation), "library", "book", "title"),
+            "x",
+        )
+
+    def test_add_field_with_default(self):
+        to_state = self.forwards(
+            AddFieldWithDefault(
+                "Book",
+                "pages",
+                models.IntegerField(default=0),
+                0,
+                preserve_default=False,
+            )
+        )
+        self.assertEqual(get_state_defaults(to_state, "library", "Book"), {"pages": 0})
+
+    def test_remove_field_forgets_default(self):
+        to_state = self.forwards(AddDefaultValues("Book", [("title", "x")]))
+        migrations.RemoveField("Book", "title").state_forwards("library", to_state)
+        self.assertEqual(get_state_defaults(to_state, "library", "Book"), {})
+
+    @modify_settings(INSTALLED_APPS={"append": "dadv.apps.DadvConfig"})
+    def test_migration_state(self):
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        state = loader.project_state(("dadv", "0006_testmultipledefaults"))
+        self.assertEqual(
+            get_state_defaults(state, "dadv", "TestMultipleDefaults"),
+            {"title": "Untitled", "is_draft": True, "priority": 3},
+        )
+        state = loader.project_state(("dadv", "0005_testcustomcolumnname"))
+        self.assertEqual(get_state_defaults(state, "dadv", "TestMultipleDefaults"), {})
+
+
+class FanOutTests(SimpleTestCase):
+    def test_runs_concurrently(self):
+        barrier = threading.Barrier(3, timeout=5)
+        results = fan_out(lambda item: (barrier.wait(), item)[1], "abc", workers=3)
+        self.assertEqual(results, [(item, item, None) for item in "abc"])
+
+    def test_collects_errors(self):
+        error = ValueError("shard down")
+
+        def function(item):
+            if item == "b":
+                raise error
+            return item
+
+        results = fan_out(function, "abc", workers=2)
+        self.assertEqual(
+            results, [("a", "a", None), ("b", None, error), ("c", "c", None)]
+        )
+
+
+@modify_settings(INSTALLED_APPS={"append": "django_add_default_value"})
+@mock.patch.object(
+    migrate_databases,
+    "connections",
+    {alias: mock.Mock() for alias in ("default", "shard_1", "shard_2")},
+)
+class MigrateDatabasesTests(SimpleTestCase, CommandOutputMixin):
+    def migrate(self, alias, options):
+        if alias == "shard_2":
+            raise OperationalError("shard down")
+        return 2, 0.1, ""
+
+    def test_reports_every_database(self):
+        with mock.patch.object(
+            migrate_databases.Command, "migrate", autospec=True
+        ) as migrate:
+            migrate.side_effect = lambda command, alias, options: self.migrate(
+                alias, options
+            )
+            with self.assertRaisesMessage(CommandError, "failed on: shard_2"):
+                self.get_command_output("migrate_databases", stderr=io.StringIO())
+        self.assertEqual(
+            sorted(call[0][1] for call in migrate.call_args_list),
+            ["default", "shard_1", "shard_2"],
+        )
+
+    def test_selected_databases(self):
+        with mock.patch.object(
+            migrate_databases.Command, "migrate", return_value=(1, 0.1, "")
+        ) as migrate:
+            output = self.get_command_output(
+                "migrate_databases", database=["shard_1"], workers=2
+            )
+        self.assertEqual(migrate.call_count, 1)
+        self.assertIn("shard_1: OK, 1 migration(s) applied", output)
+
+    def test_unknown_database(self):
+        with self.assertRaisesMessage(CommandError, "Unknown database(s): nope"):
+            self.get_command_output("migrate_databases", database=["nope"])
+
+
+class MigrateDatabasesProcessTests(SimpleTestCase):
+    settings = """
+from test_project.settings import *
+
+INSTALLED_APPS = INSTALLED_APPS + [
+    "dadv.apps.DadvConfig",
+    "django_add_default_value",
+]
+DATABASES = {{
+    alias: {{
+        "ENGINE": "django_add_default_value.backends.sqlite3",
+        "NAME": os.path.join({directory!r}, alias + ".sqlite3"),
+    }}
+    for alias in ("default", "shard_1")
+}}
+SECRET_KEY = "django_tests_secret_key"
+"""
+
+    def test_migrates_two_databases_at_once(self):
+        project = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "shard_settings.py"), "w") as module:
+                module.write(self.settings.format(directory=directory))
+            path = [directory, project] + sys.path
+            process = subprocess.run(
+                [sys.executable, "-m", "django", "migrate_databases", "dadv"]
+                + ["--workers", "2", "--settings", "shard_settings"],
+                cwd=project,
+                env=dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, path))),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                universal_newlines=True,
+            )
+            self.assertEqual(process.returncode, 0, process.stdout)
+            applied = []
+            for alias in ("default", "shard_1"):
+                database = sqlite3.connect(os.path.join(directory, alias + ".sqlite3"))
+                with closing(database):
+                    ((count,),) = database.execute(
+                        "SELECT COUNT(*) FROM django_migrations WHERE app = 'dadv'"
+                    ).fetchall()
+                applied.append(count)
+        self.assertGreater(applied[0], 0)
+        self.assertEqual(applied[0], applied[1])
+        for alias in ("default", "shard_1"):
+            self.assertIn(
+                "{alias}: OK, {count} migration(s) applied".format(
+                    alias=alias, count=applied[0]
+                ),
+                process.stdout,
+            )
+        self.assertIn("Migrated 2 database(s)", process.stdout)
+
+
+schema_connections = {
+    "default": mock.MagicMock(vendor="postgresql", alias="schemas", pg_version=150000)
+}
+
+
+@mock.patch("django_add_default_value.schemas.transaction.atomic")
+@mock.patch("django_add_default_value.schemas.connections", schema_connections)
+class SchemaRolloutTests(SimpleTestCase):
+    def setUp(self):
+        self.state = ProjectState()
+        migrations.CreateModel(
+            "Book",
+            [
+                ("id", models.AutoField(primary_key=True)),
+                ("title", models.CharField(default="x", max_length=10)),
+            ],
+        ).state_forwards("library", self.state)
+        self.migration = migrations.Migration("0002_book_title", "library")
+        self.migration.operations = [
+            AddDefaultValue("Book", "title", "x", lock_timeout=500)
+        ]
+
+    def rollout(self, **kwargs):
+        return SchemaRollout(self.migration, self.state, **kwargs)
+
+    def test_schema_qualified_batch(self, atomic):
+        self.assertEqual(
+            self.rollout(record=True).batch_sql(["tenant_1"]).splitlines(),
+            [
+                "SET LOCAL lock_timeout = '500ms';",
+                'ALTER TABLE "tenant_1"."library_book" ALTER COLUMN "title" '
+                "SET DEFAULT 'x';",
+                "SET LOCAL lock_timeout TO DEFAULT;",
+                'INSERT INTO "tenant_1"."django_migrations" (app, name, applied) '
+                "SELECT 'library', '0002_book_title', now() WHERE NOT EXISTS "
+                '(SELECT 1 FROM "tenant_1"."django_migrations" '
+                "WHERE app = 'library' AND name = '0002_book_title');",
+            ],
+        )
+
+    def test_one_execute_per_batch(self, atomic):
+        connection = schema_connections["default"]
+        connection.reset_mock()
+        self.assertEqual(self.rollout().apply_batch(["tenant_1", "tenant_2"]), 2)
+        cursor = connection.cursor.return_value.__enter__.return_value
+        cursor.execute.assert_called_once()
+        self.assertIn('"tenant_2"."library_book"', cursor.execute.call_args[0][0])
+        atomic.assert_called_once_with(using="default")
+        connection.close.assert_called_once_with()
+
+    def test_only_default_changes(self, atomic):
+        self.migration.operations.append(migrations.RemoveField("Book", "title"))
+        with self.assertRaisesMessage(ValueError, "does more than set defaults"):
+            self.rollout()
+
+    def test_invalid_schema(self, atomic):
+        with self.assertRaisesMessage(ValueError, "Invalid schema name"):
+            self.rollout().run(['tenant"; DROP TABLE x; --'])
+
+    def test_resume_from_checkpoint(self, atomic):
+        schemas = ["tenant_{}".format(number) for number in range(5)]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "schemas.json")
+            with mock.patch.object(
+                SchemaRollout, "apply_batch", side_effect=[2, OperationalError(), 1]
+            ):
+                results = self.rollout(batch_size=2).run(
+                    schemas, workers=1, checkpoint=SchemaCheckpoint(path)
+                )
+            self.assertEqual(
+                [(batch, result) for batch, result, __ in results],
+                [(schemas[:2], 2), (schemas[2:4], None), (schemas[4:], 1)],
+            )
+
+            with mock.patch.object(
+                SchemaRollout, "apply_batch", return_value=2
+            ) as apply_batch:
+                self.rollout(batch_size=2).run(
+                    schemas, checkpoint=SchemaCheckpoint(path)
+                )
+            apply_batch.assert_called_once_with(schemas[2:4])
+
+
+@modify_settings(
+    INSTALLED_APPS={"append": ["dadv.apps.DadvConfig", "django_add_default_value"]}
+)
+class OfflineRenderTests(SimpleTestCase, CommandOutputMixin):
+    def test_offline_dialect(self):
+        dialect = offline_dialect("mysql", "10.11.2", is_mariadb=True)
+        self.assertEqual(dialect.server_version, (10, 11, 2))
+        self.assertTrue(dialect.is_mariadb)
+        self.assertIsNone(offline_dialect("postgresql").server_version)
+        for args in [("sqlite",), ("postgresql", "15.x"), ("postgresql", None, True)]:
+            with self.assertRaises(ValueError):
+                offline_dialect(*args)
+
+    def test_single_pass(self):
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        with mock.patch.object(
+            loader, "project_state", side_effect=AssertionError
+        ), mock.patch.object(
+            loader.graph, "forwards_plan", wraps=loader.graph.forwards_plan
+        ) as forwards_plan:
+            lines = list(render_sql(loader, PostgreSQLDialect((15,)), ["dadv"]))
+        forwards_plan.assert_called_once_with(("dadv", "0009_testcallabledefaults"))
+        self.assertEqual(
+            lines[:2],
+            [
+                "-- dadv.0001_initial",
+                "-- Add to field TestBoolDefault.is_functional the default value "
+                "False",
+            ],
+        )
+        self.assertIn(
+            'ALTER TABLE "dadv_testmultipledefaults" ALTER COLUMN "title" SET '
+            "DEFAULT 'Untitled', ALTER COLUMN \"is_draft\" SET DEFAULT 'True', "
+            "ALTER COLUMN \"priority\" SET DEFAULT '3';",
+            lines,
+        )
+
+    def test_command(self):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command(
+            "render_defaults_sql",
+            "dadv",
+            "--vendor",
+            "mysql",
+            "--version",
+            "5.7.44",
+            stdout=stdout,
+            stderr=stderr,
+        )
+        output = stdout.getvalue().splitlines()
+        self.assertIn(
+            "-- Skipped TestTextDefault.description, it can't have a default here.",
+            output,
+        )
+        self.assertIn(
+            "ALTER TABLE `dadv_testhappypath` ALTER COLUMN `name` SET DEFAULT "
+            "'Happy path';",
+            output,
+        )
+        # The column added by 0007 is left to sqlmigrate, the rest still follows
+        index = output.index("-- dadv.0007_testhappypath_nickname")
+        self.assertEqual(
+            output[index + 2],
+            "-- NOT RENDERED: Add field nickname to testhappypath with the default "
+            "value Happy needs the column definition of the database backend, run "
+            "sqlmigrate for this migration.",
+        )
+        self.assertIn("-- dadv.0009_testcallabledefaults", output[index:])
+        self.assertIn("1 step(s) need the database backend", stderr.getvalue())
+
+    def not_null_lines(self, dialect):
+        migration = migrations.Migration("0010_not_null", "dadv")
+        migration.operations = [
+            AddDefaultAndSetNotNull("TestBackfill", "note", "n/a", lock_timeout=500)
+        ]
+        state = ProjectState.from_apps(apps)
+        changes = list(default_changes(migration, state))
+        return list(migration_lines(dialect, migration, changes))
+
+    def test_not_null_step(self):
+        """Make sure the column is made NOT NULL where no type is needed"""
+        lines = self.not_null_lines(PostgreSQLDialect((16,)))
+        self.assertEqual(
+            [line for line in lines if "NOT NULL" in line and "--" not in line],
+            [
+                'ALTER TABLE "dadv_testbackfill" ADD CONSTRAINT '
+                '"DADV_TestBackfill_note_NOT_NULL" CHECK ("note" IS NOT NULL) '
+                "NOT VALID;",
+                'ALTER TABLE "dadv_testbackfill" ALTER COLUMN "note" SET NOT NULL;',
+            ],
+        )
+        self.assertEqual(lines.count("SET LOCAL lock_timeout = '500ms';"), 5)
+
+    def test_not_null_step_needing_the_column_type(self):
+        lines = self.not_null_lines(offline_dialect("mysql", "8.0.34"))
+        self.assertIn(
+            "ALTER TABLE `dadv_testbackfill` ALTER COLUMN `note` SET DEFAULT 'n/a';",
+            lines,
+        )
+        self.assertTrue(lines[-1].startswith(NOT_RENDERED))
+        self.assertIn("to make the column NOT NULL", lines[-1])
+
+    def test_unsupported_change(self):
+        stdout = io.StringIO()
+        with self.assertRaisesMessage(CommandError, "dadv.0001_initial"):
+            with override_settings(DADV_MYSQL_ALGORITHM="INSTANT"):
+                call_command(
+                    "render_defaults_sql",
+                    "--vendor",
+                    "mysql",
+                    "--version",
+                    "5.5",
+                    stdout=stdout,
+                )
+        # The script is streamed, lines before the failing change are written
+        self.assertIn("-- dadv.0001_initial", stdout.getvalue())
+
+
+@modify_settings(INSTALLED_APPS={"append": "dadv.apps.DadvConfig"})
+class BackfillTests(SimpleTestCase):
+    def test_collect_defaults(self):
+        defaults = collect_defaults(["dadv"])
+        self.assertIn(("dadv", "testbackfill", "touched", NOW), defaults)
+        self.assertIn(("dadv", "testhappypath", "married", TODAY), defaults)
+        self.assertEqual(collect_defaults(["auth"]), [])
+
+    def test_only_nullable_fields_are_backfilled(self):
+        backfills = Backfill.from_defaults(collect_defaults(["dadv"]))
+        self.assertEqual(
+            sorted(str(backfill) for backfill in backfills),
+            ["dadv.TestBackfill.note", "dadv.TestBackfill.touched"],
+        )
+
+    def test_checkpoint(self):
+        backfill = Backfill(apps.get_model("dadv", "TestBackfill"), "note", "n/a")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "checkpoint.json")
+            Checkpoint(path).save(backfill, after=42)
+            self.assertEqual(Checkpoint(path).position(backfill), 42)
+            Checkpoint(path).save(backfill, done=True)
+            self.assertTrue(Checkpoint(path).is_done(backfill))
+        self.assertIsNone(Checkpoint(None).position(backfill))
+
+    def test_callables_are_evaluated_per_row(self):
+        field = apps.get_model("dadv", "TestCallableDefaults")._meta.get_field("token")
+        value = update_value(uuid.uuid4, field, PostgreSQLDialect())
+        self.assertEqual(value.sql, "gen_random_uuid()")
+        self.assertIs(value.output_field, field)
+
+
+@modify_settings(
+    INSTALLED_APPS={"append": ["dadv.apps.DadvConfig", "django_add_default_value"]}
+)
+class SyncDbDefaultsTests(SimpleTestCase, CommandOutputMixin):
+    rows = [
+        ("dadv_testmultipledefaults", "title", "'Untitled'::character varying"),
+        ("dadv_testmultipledefaults", "is_draft", None),
+        ("dadv_testmultipledefaults", "priority", None),
+        ("dadv_testbooldefault", "is_functional", "false"),
+        ("dadv_testtextdefault", "description", None),
+    ]
+
+    def test_missing_defaults(self):
+        defaults = literal_defaults([apps.get_app_config("dadv")])
+        missing = missing_defaults(
+            defaults, CatalogSnapshot(PostgreSQLDialect(), self.rows)
+        )
+        self.assertEqual(
+            [(model.__name__, field.name) for model, field, __ in missing],
+            [
+                ("TestTextDefault", "description"),
+                ("TestMultipleDefaults", "is_draft"),
+                ("TestMultipleDefaults", "priority"),
+            ],
+        )
+        missing = missing_defaults(defaults, CatalogSnapshot(MySQLDialect(), self.rows))
+        self.assertNotIn("description", [field.name for __, field, ___ in missing])
+
+    @isolate_apps("dadv", kwarg_name="registry")
+    def test_enum_default_is_left_out(self, registry):
+        class Status(str, enum.Enum):
+            DRAFT = "draft"
+            PUBLISHED = "published"
+
+        class TestEnumDefault(models.Model):
+            status = models.CharField(
+                max_length=10,
+                choices=[(status.value, status.name) for status in Status],
+                default=Status.DRAFT,
+            )
+            title = models.CharField(max_length=10, default="Untitled")
+
+            class Meta:
+                app_label = "dadv"
+
+        with self.assertWarnsMessage(
+            UserWarning, "left out: dadv.TestEnumDefault.status (Status)."
+        ):
+            defaults = literal_defaults([registry.get_app_config("dadv")])
+        self.assertEqual(
+            [(field.name, value) for __, field, value in defaults],
+            [("title", "Untitled")],
+        )
+
+    @unittest.skipUnless(hasattr(models, "JSONField"), "Django 3.1+ has JSONField")
+    @isolate_apps("dadv", kwarg_name="registry")
+    def test_json_default_is_left_out(self, registry):
+        class TestJSONDefault(models.Model):
+            tags = models.JSONField(default=["new"])
+            settings = models.JSONField(default=dict)
+
+            class Meta:
+                app_label = "dadv"
+
+        with self.assertWarnsMessage(
+            UserWarning, "left out: dadv.TestJSONDefault.tags (list)."
+        ):
+            defaults = literal_defaults([registry.get_app_config("dadv")])
+        self.assertEqual(defaults, [])
+
+    def test_one_migration_per_app_grouped_by_table(self):
+        snapshot = CatalogSnapshot(PostgreSQLDialect(), self.rows)
+        with mock.patch.object(sync_db_defaults, "check_databases"), mock.patch.object(
+            sync_db_defaults, "load_snapshot", return_value=snapshot
+        ):
+            output = self.get_command_output(
+                "sync_db_defaults", "dadv", dry_run=True, verbosity=3
+            )
+        self.assertEqual(output.count("Migration for 'dadv':"), 1)
+        self.assertIn("0010_sync_db_defaults.py", output)
+        self.assertIn("('dadv', '0009_testcallabledefaults')", output)
+        self.assertIn(
+            "Add to fields is_draft, priority of TestMultipleDefaults", output
+        )
+        self.assertIn("Add to field TestTextDefault.description", output)
+        self.assertNotIn("TestBoolDefault", output)
+
+
+@modify_settings(INSTALLED_APPS={"append": "dadv.apps.DadvConfig"})
+class CatalogSnapshotTests(SimpleTestCase):
+    def test_postgresql_casts(self):
+        snapshot = CatalogSnapshot(
+            PostgreSQLDialect(),
+            [
+                ("dadv_testhappypath", "name", "'Happy path'::character varying"),
+                ("dadv_testhappypath", "dob", "'1970-01-01'::date"),
+                ("dadv_testhappypath", "rebirth", "now()"),
+                ("dadv_testbooldefault", "is_functional", "false"),
+            ],
+        )
+        self.assertTrue(
+            snapshot.has_default("dadv_testhappypath", "name", "'Happy path'")
+        )
+        self.assertTrue(
+            snapshot.has_default("dadv_testhappypath", "dob", "'1970-01-01'")
+        )
+        self.assertTrue(snapshot.has_default("dadv_testhappypath", "rebirth", "now()"))
+        self.assertTrue(
+            snapshot.has_default("dadv_testbooldefault", "is_functional", "'False'")
+        )
+        self.assertFalse(snapshot.has_default("dadv_testhappypath", "name", "'Sad'"))
+
+    def test_forget_changes(self):
+        snapshot = CatalogSnapshot(
+            PostgreSQLDialect(),
+            [("dadv_a", "name", "'a'"), ("dadv_a_b", "name", "'b'")],
+        )
+        snapshot.forget_changes('UPDATE "dadv_a" SET "name" = NULL')
+        snapshot.forget_changes('ALTER TABLE "dadv_a" ALTER COLUMN "name" DROP DEFAULT')
+        self.assertIs(snapshot.get_default("dadv_a", "name"), NOT_PRESENT)
+        self.assertEqual(snapshot.get_default("dadv_a_b", "name"), "'b'")
+        snapshot.forget_changes("DO $$ BEGIN END $$")
+        self.assertEqual(snapshot.defaults, {})
+
+    def test_mysql_unquoted_literals(self):
+        snapshot = CatalogSnapshot(
+            MySQLDialect(),
+            [
+                ("dadv_testhappypath", "name", "Happy path"),
+                ("dadv_testhappypath", "rebirth", "current_timestamp()"),
+            ],
+        )
+        self.assertTrue(
+            snapshot.has_default("dadv_testhappypath", "name", "'Happy path'")
+        )
+        self.assertTrue(
+            snapshot.has_default("dadv_testhappypath", "rebirth", "CURRENT_TIMESTAMP")
+        )
+
+    def test_mssql_parentheses(self):
+        snapshot = CatalogSnapshot(
+            MSSQLDialect(), [("dadv_testbooldefault", "is_functional", "((0))")]
+        )
+        self.assertTrue(
+            snapshot.has_default("dadv_testbooldefault", "is_functional", "'0'")
+        )
+
+    def test_unknown_and_missing_defaults(self):
+        snapshot = CatalogSnapshot(
+            PostgreSQLDialect(), [("dadv_testhappypath", "name", None)]
+        )
+        self.assertTrue(snapshot.has_default("dadv_testhappypath", "name", None))
+        self.assertFalse(snapshot.has_default("dadv_testhappypath", "name", "'x'"))
+        self.assertFalse(snapshot.has_default("dadv_testhappypath", "nickname", None))
+
+    @override_settings(DADV_SKIP_UNCHANGED_DEFAULTS=True)
+    def test_unchanged_defaults_are_skipped(self):
+        snapshot = CatalogSnapshot(
+            PostgreSQLDialect(),
+            [("dadv_testmultipledefaults", "title", "'Untitled'::character varying")],
+        )
+        model = apps.get_model("dadv", "TestMultipleDefaults")
+        operation = AddDefaultValues(
+            "TestMultipleDefaults", [("title", "Untitled"), ("priority", 3)]
+        )
+        defaults = operation.applicable_defaults(model, PostgreSQLDialect())
+        with mock.patch(
+            "django_add_default_value.add_default_value.get_snapshot",
+            return_value=snapshot,
+        ):
+            changed = operation.changed_defaults(
+                SchemaEditorStub(PostgreSQLConnectionStub()), model, defaults
+            )
+        self.assertEqual([field.name for field, __ in changed], ["priority"])
+
 
 @unittest.skipUnless(
     settings_module == "test_project.settings_pgsql",
@@ -130,6 +1671,21 @@ class MigrationsTesterMySQL(TestCase, MigrationsTesterBase):
     )
 
     custom_column_match = "ALTER TABLE `dadv_testcustomcolumnname` ALTER COLUMN `custom_field` SET DEFAULT '0';"
+    multiple_defaults_match = (
+        "ALTER TABLE `dadv_testmultipledefaults` "
+        "ALTER COLUMN `title` SET DEFAULT 'Untitled', "
+        "ALTER COLUMN `is_draft` SET DEFAULT '1', "
+        "ALTER COLUMN `priority` SET DEFAULT '3';"
+    )
+    add_field_match = (
+        "ALTER TABLE `dadv_testhappypath` ADD COLUMN `nickname` varchar(15) "
+        "NOT NULL DEFAULT 'Happy'"
+    )
+    callable_match = (
+        "ALTER TABLE `dadv_testcallabledefaults` "
+        "ALTER COLUMN `token` SET DEFAULT (REPLACE(UUID(), '-', '')), "
+        "ALTER COLUMN `created` SET DEFAULT CURRENT_TIMESTAMP"
+    )
 
     @unittest.expectedFailure
     def test_text_default(self):
@@ -140,6 +1696,90 @@ class MigrationsTesterMySQL(TestCase, MigrationsTesterBase):
         super(MigrationsTesterMySQL, self).test_current_date()
 
 
+@unittest.skipUnless(
+    settings_module == "test_project.settings_sqlite",
+    "SQLite settings file not selected",
+)
+@modify_settings(INSTALLED_APPS={"append": "dadv.apps.DadvConfig"})
+class MigrationsTesterSQLite(TransactionTestCase, MigrationsTesterBase):
+    bool_match = "\"is_functional\" bool NOT NULL DEFAULT '0'"
+    text_match = "\"description\" text NOT NULL DEFAULT 'No description provided'"
+    charfield_match = "\"name\" varchar(15) NOT NULL DEFAULT 'Happy path'"
+    date_match = "\"dob\" date NOT NULL DEFAULT '1970-01-01'"
+    current_timestamp_match = '"rebirth" datetime NOT NULL DEFAULT CURRENT_TIMESTAMP'
+    current_date_match = '"married" date NOT NULL DEFAULT CURRENT_DATE'
+
+    custom_column_match = "\"custom_field\" bool NOT NULL DEFAULT '0'"
+    multiple_defaults_match = (
+        'CREATE TABLE "new__dadv_testmultipledefaults" ('
+        '"id" integer NOT NULL PRIMARY KEY AUTOINCREMENT, '
+        "\"title\" varchar(15) NOT NULL DEFAULT 'Untitled', "
+        "\"is_draft\" bool NOT NULL DEFAULT '1', "
+        "\"priority\" integer NOT NULL DEFAULT '3');"
+    )
+    add_field_match = "\"nickname\" varchar(15) NOT NULL DEFAULT 'Happy'"
+    callable_match = '"token" char(32) NOT NULL DEFAULT (lower(hex(randomblob(4)) || '
+
+    def tearDown(self):
+        call_command("migrate", "dadv", "zero", verbosity=0)
+
+    def test_one_rebuild_per_table(self):
+        """Make sure a column and its default are added with one rebuild"""
+        actual = self.get_command_output("sqlmigrate", "dadv", "0007")
+        self.assertEqual(actual.count('CREATE TABLE "new__dadv_testhappypath"'), 1)
+
+    def test_defaults_survive_rebuilds(self):
+        """Make sure later rebuilds of a table keep the defaults set earlier"""
+        call_command("migrate", "dadv", verbosity=0)
+        with connection.cursor() as cursor:
+            cursor.execute('INSERT INTO "dadv_testhappypath" ("id") VALUES (1)')
+        row = apps.get_model("dadv", "TestHappyPath").objects.get()
+        self.assertEqual((row.name, row.nickname), ("Happy path", "Happy"))
+
+    def test_bulk_load_given_values(self):
+        """Make sure values given for database-defaulted columns are inserted"""
+        call_command("migrate", "dadv", verbosity=0)
+        model = apps.get_model("dadv", "TestHappyPath")
+        queryset = BulkLoadQuerySet(model)
+        count = queryset.bulk_load(
+            [
+                {"name": "Alice"},
+                {"name": "Bob"},
+                {"nickname": "Dan"},
+                model(name="Carol"),
+            ]
+        )
+        self.assertEqual(count, 4)
+        self.assertEqual(
+            list(queryset.order_by("id").values_list("name", "nickname")),
+            [
+                ("Alice", "Happy"),
+                ("Bob", "Happy"),
+                ("Happy path", "Dan"),
+                ("Carol", "Happy"),
+            ],
+        )
+
+    def test_bulk_load(self):
+        """Make sure the database fills in the columns left out"""
+        call_command("migrate", "dadv", verbosity=0)
+        model = apps.get_model("dadv", "TestMultipleDefaults")
+        queryset = BulkLoadQuerySet(model)
+        with CaptureQueriesContext(connection) as queries:
+            count = queryset.bulk_load(
+                ({"title": str(index)} for index in range(600)), fields=["title"]
+            )
+        self.assertEqual(count, 600)
+        self.assertEqual(len(queries), 2)
+        self.assertIn(
+            'INSERT INTO "dadv_testmultipledefaults" ("title")', queries[0]["sql"]
+        )
+        self.assertEqual(
+            queryset.values_list("title", "is_draft", "priority").last(),
+            ("599", True, 3),
+        )
+
+
 @unittest.skipUnless(
     settings_module == "test_project.settings_mssql",
     "Microsoft SQL Server settings file not selected",
@@ -174,3 +1814,878 @@ class MigrationsTesterMicrosoftSQL(TestCase, MigrationsTesterBase):
         "ALTER TABLE [dadv_testhappypath] ADD CONSTRAINT [DADV_testhappypath_rebirth_DEFAULT] "
         "DEFAULT GETDATE() FOR [rebirth];"
     )
+    custom_column_match = (
+        "ALTER TABLE [dadv_testcustomcolumnname] "
+        "ADD CONSTRAINT [DADV_TestCustomColumnName_is_functional_DEFAULT] "
+        "DEFAULT '0' FOR [custom_field];"
+    )
+    multiple_defaults_match = (
+        "ALTER TABLE [dadv_testmultipledefaults] "
+        "ADD CONSTRAINT [DADV_TestMultipleDefaults_title_DEFAULT] "
+        "DEFAULT 'Untitled' FOR [title], "
+        "CONSTRAINT [DADV_TestMultipleDefaults_is_draft_DEFAULT] "
+        "DEFAULT '1' FOR [is_draft], "
+        "CONSTRAINT [DADV_TestMultipleDefaults_priority_DEFAULT] "
+        "DEFAULT '3' FOR [priority];"
+    )
+    add_field_match = (
+        "ALTER TABLE [dadv_testhappypath] ADD [nickname] nvarchar(15) NOT NULL "
+        "CONSTRAINT [DADV_testhappypath_nickname_DEFAULT] DEFAULT 'Happy';"
+    )
+    callable_match = (
+        "ALTER TABLE [dadv_testcallabledefaults] "
+        "ADD CONSTRAINT [DADV_TestCallableDefaults_token_DEFAULT] "
+        "DEFAULT REPLACE(CONVERT(char(36), NEWID()), '-', '') FOR [token], "
+        "CONSTRAINT [DADV_TestCallableDefaults_created_DEFAULT] "
+        "DEFAULT GETDATE() FOR [created];"
+    )
+
+
+class SimulatedConnection:
+    """
+    A connection to a server of ``vendor`` that never connects. The dialect
+    probes ``version`` and ``is_mariadb`` from it like from a real connection.
+    Operations ask the routers about its alias, so it is a configured one.
+    Introspection finds ``tables``.
+    """
+
+    alias = "default"
+    data_types = {"CharField": "varchar(%(max_length)s)"}
+    in_atomic_block = False
+
+    def __init__(
+        self,
+        vendor,
+        version=None,
+        is_mariadb=False,
+        rows=(),
+        tables=("django_migrations",),
+    ):
+        self.vendor = vendor
+        # What every query to the catalog returns
+        self.rows = list(rows)
+        self.introspection = mock.Mock(table_names=lambda cursor=None: list(tables))
+        self.queries = []
+        if vendor == "postgresql" and version:
+            self.pg_version = version[0] * 10000 + version[1] * 100 + version[2]
+        if vendor == "mysql":
+            self.mysql_version = version
+            self.mysql_is_mariadb = is_mariadb
+        if vendor == "microsoft":
+            self.data_types = {"CharField": "nvarchar(%(max_length)s)"}
+        self.ops = mock.Mock(quote_name=lambda name: get_dialect(self).quote_name(name))
+
+    def cursor(self):
+        cursor = mock.MagicMock()
+        cursor.__enter__.return_value = cursor
+        cursor.execute.side_effect = lambda sql, params=(): self.queries.append(sql)
+        cursor.fetchall.return_value = self.rows
+        cursor.fetchone.side_effect = lambda: self.rows[0] if self.rows else None
+        return cursor
+
+
+class MissingMigrationsConnection(SimulatedConnection):
+    """
+    A connection to a database that was never migrated.
+    """
+
+    def cursor(self):
+        cursor = super().cursor()
+
+        def execute(sql, params=()):
+            self.queries.append(sql)
+            raise ProgrammingError('relation "django_migrations" does not exist')
+
+        cursor.execute.side_effect = execute
+        return cursor
+
+
+class SimulatedSchemaEditor(SchemaEditorStub):
+    """
+    Captures the executed SQL the way ``sqlmigrate`` prints it.
+    """
+
+    def __init__(self, connection, collect_sql=False):
+        super().__init__(connection, collect_sql=collect_sql)
+        self.deferred_sql = []
+        if connection.vendor == "microsoft":
+            self.sql_create_column = (
+                "ALTER TABLE %(table)s ADD %(column)s %(definition)s"
+            )
+        else:
+            self.sql_create_column = (
+                "ALTER TABLE %(table)s ADD COLUMN %(column)s %(definition)s"
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def execute(self, sql, params=()):
+        ending = "" if sql.rstrip().endswith(";") else ";"
+        self.executed.append(sql % tuple(params or ()) + ending)
+
+    def remove_field(self, model, field):
+        dialect = get_dialect(self.connection)
+        self.execute(
+            "ALTER TABLE {table} DROP COLUMN {column}".format(
+                table=dialect.quote_name(model._meta.db_table),
+                column=dialect.quote_name(field.column),
+            )
+        )
+
+    def column_sql(self, model, field):
+        return (
+            "{type} {null}".format(
+                type=field.db_type(self.connection),
+                null="NULL" if field.null else "NOT NULL",
+            ),
+            [],
+        )
+
+
+def simulate_migrations(connection, app_label="dadv", backwards=False):
+    """
+    Run the default changes of the migrations of ``app_label`` on a simulated
+    connection, carrying one state through all of them.
+
+    :return: The SQL executed for every migration, by name
+    """
+    loader = MigrationLoader(None, ignore_no_migrations=True)
+    schema_editor = SimulatedSchemaEditor(connection)
+    state = ProjectState(real_apps=list(loader.unmigrated_apps))
+    executed = {}
+    for migration in migration_plan(loader, [app_label]):
+        for operation in migration.operations:
+            from_state = state.clone()
+            operation.state_forwards(migration.app_label, state)
+            if not isinstance(operation, AddDefaultValue):
+                continue
+            if backwards:
+                operation.database_backwards(
+                    migration.app_label, schema_editor, state, from_state
+                )
+            else:
+                operation.database_forwards(
+                    migration.app_label, schema_editor, from_state, state
+                )
+        executed[migration.name[:4]] = "\n".join(schema_editor.executed)
+        schema_editor.executed = []
+    return executed
+
+
+# The SQL every tester expects, with the migration and test it belongs to
+TESTER_MATCHES = [
+    ("bool_match", "0001", "test_bool_default"),
+    ("text_match", "0002", "test_text_default"),
+    ("charfield_match", "0003", "test_charfield_default"),
+    ("date_match", "0004", "test_default_date"),
+    ("current_timestamp_match", "0004", "test_current_timestamp"),
+    ("current_date_match", "0004", "test_current_date"),
+    ("custom_column_match", "0005", "test_custom_column_name"),
+    ("multiple_defaults_match", "0006", "test_multiple_defaults"),
+    ("add_field_match", "0007", "test_add_field_with_default"),
+    ("callable_match", "0009", "test_callable_defaults"),
+]
+
+
+@modify_settings(INSTALLED_APPS={"append": "dadv.apps.DadvConfig"})
+class SimulatedServerTests(SimpleTestCase):
+    """
+    Run the expectations of the testers of every vendor against simulated
+    servers, so all of them are checked without any server.
+    """
+
+    servers = [
+        (MigrationsTesterPgSQL, "postgresql", (16, 2, 0)),
+        (MigrationsTesterCRDB, "cockroachdb", None),
+        (MigrationsTesterMySQL, "mysql", (8, 0, 34)),
+        (MigrationsTesterMicrosoftSQL, "microsoft", None),
+    ]
+
+    def setUp(self):
+        # Dialects are resolved once per alias and vendor
+        reset_dialects()
+
+    def tearDown(self):
+        reset_dialects()
+
+    def assertTesterMatches(self, tester, executed):
+        for match, migration, test in TESTER_MATCHES:
+            with self.subTest(tester=tester.__name__, match=match):
+                if getattr(getattr(tester, test), "__unittest_expecting_failure__", 0):
+                    self.assertNotIn(getattr(tester, match), executed[migration])
+                else:
+                    self.assertIn(getattr(tester, match), executed[migration])
+
+    def test_testers(self):
+        for tester, vendor, version in self.servers:
+            self.assertTesterMatches(
+                tester, simulate_migrations(SimulatedConnection(vendor, version))
+            )
+
+    def test_mariadb(self):
+        executed = simulate_migrations(
+            SimulatedConnection("mysql", (10, 11, 2), is_mariadb=True)
+        )
+        self.assertIn(
+            "ALTER TABLE `dadv_testtextdefault` ALTER COLUMN `description` "
+            "SET DEFAULT 'No description provided';",
+            executed["0002"],
+        )
+        self.assertIn("ALGORITHM=INSTANT", executed["0007"])
+        self.assertIn("(REPLACE(UUID(), '-', ''))", executed["0009"])
+
+    def test_old_mysql(self):
+        executed = simulate_migrations(SimulatedConnection("mysql", (5, 7, 44)))
+        self.assertEqual(executed["0002"], "")
+        self.assertNotIn("ALGORITHM=INSTANT", executed["0007"])
+        self.assertEqual(
+            executed["0009"],
+            "ALTER TABLE `dadv_testcallabledefaults` "
+            "ALTER COLUMN `created` SET DEFAULT CURRENT_TIMESTAMP;",
+        )
+
+    def test_old_postgresql_rewrites_table(self):
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            simulate_migrations(SimulatedConnection("postgresql", (10, 23, 0)))
+        self.assertIn("rewrite the whole table", str(caught[-1].message))
+
+    def test_mssql_constraints_are_dropped(self):
+        executed = simulate_migrations(SimulatedConnection("microsoft"), backwards=True)
+        self.assertEqual(
+            executed["0006"],
+            "ALTER TABLE [dadv_testmultipledefaults] DROP CONSTRAINT "
+            "[DADV_TestMultipleDefaults_title_DEFAULT], "
+            "[DADV_TestMultipleDefaults_is_draft_DEFAULT], "
+            "[DADV_TestMultipleDefaults_priority_DEFAULT];",
+        )
+        self.assertEqual(
+            executed["0007"].splitlines(),
+            [
+                "ALTER TABLE [dadv_testhappypath] DROP CONSTRAINT "
+                "[DADV_testhappypath_nickname_DEFAULT];",
+                "ALTER TABLE [dadv_testhappypath] DROP COLUMN [nickname];",
+            ],
+        )
+
+
+@modify_settings(INSTALLED_APPS={"append": "dadv.apps.DadvConfig"})
+class PartitionTests(SimpleTestCase):
+    children = [("public", "happy_2023"), ("public", "happy_2024"), ("old", "happy")]
+
+    def setUp(self):
+        reset_dialects()
+
+    def tearDown(self):
+        reset_dialects()
+
+    def forwards(self, connection, **kwargs):
+        schema_editor = SimulatedSchemaEditor(connection)
+        AddDefaultValue("TestHappyPath", "name", "x", **kwargs).database_forwards(
+            "dadv", schema_editor, StateStub, StateStub
+        )
+        return schema_editor.executed
+
+    def test_parent_alone_then_children_in_batches(self):
+        executed = self.forwards(
+            SimulatedConnection("postgresql", rows=self.children),
+            partition_batch_size=2,
+        )
+        self.assertEqual(
+            executed,
+            [
+                'ALTER TABLE ONLY "dadv_testhappypath" ALTER COLUMN "name" '
+                "SET DEFAULT 'x';",
+                'ALTER TABLE ONLY "public"."happy_2023" ALTER COLUMN "name" '
+                "SET DEFAULT 'x';\n"
+                'ALTER TABLE ONLY "public"."happy_2024" ALTER COLUMN "name" '
+                "SET DEFAULT 'x';",
+                'ALTER TABLE ONLY "old"."happy" ALTER COLUMN "name" SET DEFAULT \'x\';',
+            ],
+        )
+
+    @mock.patch("django_add_default_value.add_default_value.transaction.atomic")
+    def test_every_batch_has_a_lock_timeout(self, atomic):
+        connection = SimulatedConnection("postgresql", rows=self.children)
+        connection.in_atomic_block = True
+        with self.assertWarnsRegex(UserWarning, "locks all 3 child tables"):
+            executed = self.forwards(
+                connection, partition_batch_size=2, lock_timeout=500
+            )
+        self.assertEqual(atomic.call_count, 3)
+        self.assertEqual(executed.count("SET LOCAL lock_timeout = '500ms';"), 3)
+
+    @override_settings(DADV_PARTITION_BATCH_SIZE=10)
+    def test_table_without_children(self):
+        connection = SimulatedConnection("postgresql")
+        self.assertEqual(
+            self.forwards(connection),
+            [
+                'ALTER TABLE "dadv_testhappypath" ALTER COLUMN "name" '
+                "SET DEFAULT 'x';"
+            ],
+        )
+        self.assertEqual(len(connection.queries), 1)
+
+    def test_off_by_default(self):
+        connection = SimulatedConnection("postgresql", rows=self.children)
+        self.assertEqual(len(self.forwards(connection)), 1)
+        self.assertEqual(connection.queries, [])
+
+    def test_invalid_batch_size(self):
+        with self.assertRaises(ValueError):
+            AddDefaultValue("TestHappyPath", "name", "x", partition_batch_size=0)
+
+
+class PendingSchemaEditor(PendingDefaultsMixin, SimulatedSchemaEditor):
+    def apply_defaults(self, table, model, changes):
+        self.execute(
+            "ALTER TABLE {table} {changes}".format(
+                table=table, changes=", ".join(changes.values())
+            )
+        )
+
+
+class PendingDefaultsTests(SimpleTestCase):
+    def test_applied_before_statements_on_the_table(self):
+        with PendingSchemaEditor(SimulatedConnection("postgresql")) as editor:
+            editor.queue_defaults("app_item", {"a": "A"})
+            editor.queue_defaults("app_item", {"b": "B"})
+            editor.execute('CREATE INDEX "i" ON "app_item_tags" ("a")')
+            editor.execute('ALTER TABLE "public"."APP_ITEM" ADD "c" INT')
+        self.assertEqual(
+            editor.executed,
+            [
+                'CREATE INDEX "i" ON "app_item_tags" ("a");',
+                "ALTER TABLE app_item A, B;",
+                'ALTER TABLE "public"."APP_ITEM" ADD "c" INT;',
+            ],
+        )
+
+    def test_unknown_statements_apply_all(self):
+        with PendingSchemaEditor(SimulatedConnection("postgresql")) as editor:
+            editor.queue_defaults("app_item", {"a": "A"})
+            editor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        self.assertEqual(
+            editor.executed,
+            ["ALTER TABLE app_item A;", "SET CONSTRAINTS ALL IMMEDIATE;"],
+        )
+
+    def test_statement_table(self):
+        self.assertEqual(
+            [
+                statement_table(sql)
+                for sql in (
+                    'ALTER TABLE IF EXISTS "App_Item" ADD "b" INT',
+                    "CREATE UNIQUE INDEX `i` ON `db`.`app_item` (`a`)",
+                    "INSERT INTO [app_item] ([a]) VALUES (1)",
+                    'UPDATE "app_item" SET "a" = 1; DELETE FROM "app_other"',
+                    "SET CONSTRAINTS ALL IMMEDIATE",
+                )
+            ],
+            ["app_item", "app_item", "app_item", None, None],
+        )
+
+    def test_applied_before_run_python(self):
+        seen = []
+        operation = RunPython(
+            lambda apps, schema_editor: seen.append(list(schema_editor.executed)),
+            lambda apps, schema_editor: seen.append(list(schema_editor.executed)),
+        )
+        state = ProjectState()
+        with PendingSchemaEditor(SimulatedConnection("postgresql")) as editor:
+            editor.queue_defaults("app_item", {"a": "A"})
+            operation.database_forwards("app", editor, state, state)
+            editor.queue_defaults("app_item", {"b": "B"})
+            operation.database_backwards("app", editor, state, state)
+        self.assertEqual(
+            seen,
+            [
+                ["ALTER TABLE app_item A;"],
+                ["ALTER TABLE app_item A;", "ALTER TABLE app_item B;"],
+            ],
+        )
+
+    def test_apply_defaults_is_required(self):
+        class Editor(PendingDefaultsMixin, SimulatedSchemaEditor):
+            pass
+
+        with self.assertRaises(TypeError):
+            Editor(SimulatedConnection("postgresql"))
+
+    @mock.patch.object(SimulatedSchemaEditor, "__exit__")
+    def test_failed_defaults_end_the_migration(self, exit_):
+        editor = PendingSchemaEditor(SimulatedConnection("postgresql"))
+        with mock.patch.object(
+            editor, "apply_defaults", side_effect=OperationalError("failed")
+        ):
+            with self.assertRaisesMessage(OperationalError, "failed"):
+                with editor:
+                    editor.queue_defaults("app_item", {"a": "A"})
+        exit_.assert_called_once()
+        self.assertIs(exit_.call_args[0][0], OperationalError)
+
+
+class GroupingSchemaEditor(GroupedDefaultsMixin, SimulatedSchemaEditor):
+    pass
+
+
+class LockedGroupingSchemaEditor(GroupingSchemaEditor):
+    """
+    Times out waiting for the lock of the first ``failures`` grouped
+    statements.
+    """
+
+    def __init__(self, connection, failures):
+        super().__init__(connection)
+        self.failures = failures
+
+    def execute(self, sql, params=()):
+        if sql.startswith("ALTER") and not self.flushes_pending_defaults():
+            SchemaEditorStub.execute(self, sql, params)
+            self.executed.pop()
+        super().execute(sql, params)
+
+
+class JobsConnection(SimulatedConnection):
+    """
+    A CockroachDB connection answering the polls of the jobs with ``polls``,
+    one list of jobs per poll.
+    """
+
+    def __init__(self, polls):
+        super().__init__("cockroachdb")
+        self.polls = list(polls)
+
+    def cursor(self):
+        cursor = super().cursor()
+        cursor.fetchall.side_effect = lambda: self.polls.pop(0)
+        return cursor
+
+
+@modify_settings(INSTALLED_APPS={"append": "dadv.apps.DadvConfig"})
+class GroupedDefaultsTests(SimpleTestCase):
+    def setUp(self):
+        reset_dialects()
+
+    def tearDown(self):
+        reset_dialects()
+
+    def forwards(self, schema_editor, name, value):
+        AddDefaultValue("TestHappyPath", name, value).database_forwards(
+            "dadv", schema_editor, StateStub, StateStub
+        )
+
+    def test_one_statement_per_table(self):
+        with GroupingSchemaEditor(
+            SimulatedConnection("cockroachdb", rows=[(NOW,)])
+        ) as editor:
+            self.forwards(editor, "name", "x")
+            self.forwards(editor, "nickname", "y")
+            self.forwards(editor, "name", "z")
+            self.assertEqual(editor.executed, [])
+        self.assertEqual(
+            editor.executed,
+            [
+                'ALTER TABLE "dadv_testhappypath" ALTER COLUMN "name" '
+                "SET DEFAULT 'z', ALTER COLUMN \"nickname\" SET DEFAULT 'y';"
+            ],
+        )
+
+    def test_applied_before_statements_on_the_table(self):
+        with GroupingSchemaEditor(
+            SimulatedConnection("cockroachdb", rows=[(NOW,)])
+        ) as editor:
+            self.forwards(editor, "name", "x")
+            editor.execute('CREATE INDEX "i" ON "dadv_other" ("a")')
+            editor.execute('CREATE INDEX "j" ON "dadv_testhappypath" ("name")')
+        self.assertEqual(
+            editor.executed,
+            [
+                'CREATE INDEX "i" ON "dadv_other" ("a");',
+                'ALTER TABLE "dadv_testhappypath" ALTER COLUMN "name" '
+                "SET DEFAULT 'x';",
+                'CREATE INDEX "j" ON "dadv_testhappypath" ("name");',
+            ],
+        )
+
+    @mock.patch("django_add_default_value.cockroachdb.wait_for_jobs")
+    def test_waits_for_the_jobs(self, wait):
+        connection = SimulatedConnection("cockroachdb", rows=[(NOW,)])
+        with override_settings(DADV_CRDB_JOB_TIMEOUT=60):
+            with GroupingSchemaEditor(connection) as editor:
+                self.forwards(editor, "name", "x")
+                wait.assert_not_called()
+        wait.assert_called_once_with(
+            connection, ["dadv_testhappypath"], editor.jobs_since, 60
+        )
+        self.assertEqual(connection.queries, ["SELECT now()"])
+
+    @mock.patch("django_add_default_value.cockroachdb.wait_for_jobs")
+    def test_no_waiting_by_default(self, wait):
+        with GroupingSchemaEditor(
+            SimulatedConnection("cockroachdb", rows=[(NOW,)])
+        ) as editor:
+            self.forwards(editor, "name", "x")
+        wait.assert_not_called()
+
+    def test_statements_on_other_tables_keep_waiting(self):
+        with GroupingSchemaEditor(
+            SimulatedConnection("cockroachdb", rows=[(NOW,)])
+        ) as editor:
+            self.forwards(editor, "name", "x")
+            editor.execute('CREATE INDEX "i" ON "dadv_testhappypath_tags" ("a")')
+            editor.execute('ALTER TABLE "public"."dadv_testhappypath" ADD "b" INT')
+        self.assertEqual(
+            editor.executed,
+            [
+                'CREATE INDEX "i" ON "dadv_testhappypath_tags" ("a");',
+                'ALTER TABLE "dadv_testhappypath" ALTER COLUMN "name" '
+                "SET DEFAULT 'x';",
+                'ALTER TABLE "public"."dadv_testhappypath" ADD "b" INT;',
+            ],
+        )
+
+    @mock.patch("django_add_default_value.add_default_value.time.sleep")
+    @mock.patch("django_add_default_value.add_default_value.transaction.atomic")
+    def test_lock_timeout_and_retries(self, atomic, sleep):
+        sql = (
+            'ALTER TABLE "dadv_testhappypath" ALTER COLUMN "name" '
+            "SET DEFAULT 'x', ALTER COLUMN \"nickname\" SET DEFAULT 'y';"
+        )
+        with LockedGroupingSchemaEditor(
+            SimulatedConnection("cockroachdb", rows=[(NOW,)]), failures=1
+        ) as editor:
+            self.forwards(editor, "name", "x")
+            AddDefaultValue(
+                "TestHappyPath", "nickname", "y", lock_timeout=500, lock_retries=1
+            ).database_forwards("dadv", editor, StateStub, StateStub)
+            editor.queue_defaults("dadv_other", {"a": "A"})
+            with self.assertLogs("django_add_default_value", "WARNING") as logs:
+                editor.apply_pending_defaults(["dadv_testhappypath"])
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(
+            editor.executed,
+            [
+                "SET LOCAL lock_timeout = '500ms';",
+                "SET LOCAL lock_timeout = '500ms';",
+                sql,
+                "SET LOCAL lock_timeout TO DEFAULT;",
+                'ALTER TABLE "dadv_other" A;',
+            ],
+        )
+        self.assertEqual(atomic.call_count, 2)
+        sleep.assert_called_once()
+
+    @mock.patch("django_add_default_value.cockroachdb.time.sleep")
+    def test_polls_until_done(self, sleep):
+        connection = JobsConnection([[(1, "running", "")], []])
+        wait_for_jobs(connection, ["dadv_testhappypath"], "now", timeout=60)
+        self.assertEqual(len(connection.queries), 2)
+        sleep.assert_called_once_with(1.0)
+
+    def test_failed_job(self):
+        connection = JobsConnection([[(1, "failed", "boom")]])
+        with self.assertRaisesRegex(SchemaChangeJobError, "job 1 .* failed: boom"):
+            wait_for_jobs(connection, ["dadv_testhappypath"], "now", timeout=60)
+
+    @mock.patch("django_add_default_value.cockroachdb.time")
+    def test_timeout_after_polling(self, time_):
+        time_.time.side_effect = [0.0, 30.0, 61.0]
+        connection = JobsConnection([[(1, "running", "")], [(1, "running", "")]])
+        with self.assertRaisesRegex(SchemaChangeJobError, "still run after 60s"):
+            wait_for_jobs(
+                connection, ["dadv_testhappypath"], "now", timeout=60, interval=5
+            )
+        self.assertEqual(len(connection.queries), 2)
+        time_.sleep.assert_called_once_with(5)
+
+    @mock.patch("django_add_default_value.cockroachdb.time.sleep")
+    def test_timeout(self, sleep):
+        connection = JobsConnection([[(1, "running", "")]])
+        with self.assertRaisesRegex(SchemaChangeJobError, "still run after 0s"):
+            wait_for_jobs(connection, ["dadv_testhappypath"], "now", timeout=0)
+        sleep.assert_not_called()
+
+
+@modify_settings(INSTALLED_APPS={"append": "dadv.apps.DadvConfig"})
+class SetNotNullTests(SimpleTestCase):
+    def setUp(self):
+        reset_dialects()
+        self.operation = AddDefaultAndSetNotNull("TestBackfill", "note", "n/a")
+        self.from_state = ProjectState.from_apps(apps)
+        self.to_state = self.from_state.clone()
+        self.operation.state_forwards("dadv", self.to_state)
+
+    def tearDown(self):
+        reset_dialects()
+
+    def forwards(self, connection):
+        schema_editor = SimulatedSchemaEditor(connection)
+        self.operation.database_forwards(
+            "dadv", schema_editor, self.from_state, self.to_state
+        )
+        return schema_editor.executed
+
+    def backwards(self, connection):
+        schema_editor = SimulatedSchemaEditor(connection)
+        self.operation.database_backwards(
+            "dadv", schema_editor, self.to_state, self.from_state
+        )
+        return schema_editor.executed
+
+    def test_state(self):
+        field = self.to_state.apps.get_model("dadv", "TestBackfill")._meta.get_field(
+            "note"
+        )
+        self.assertFalse(field.null)
+        self.assertEqual(
+            get_state_default(self.to_state, "dadv", "TestBackfill", "note"), "n/a"
+        )
+        self.assertTrue(
+            self.from_state.apps.get_model("dadv", "TestBackfill")
+            ._meta.get_field("note")
+            .null
+        )
+
+    def test_postgresql_validates_a_check(self):
+        self.assertEqual(
+            self.forwards(SimulatedConnection("postgresql", (16, 2, 0))),
+            [
+                'ALTER TABLE "dadv_testbackfill" ALTER COLUMN "note" '
+                "SET DEFAULT 'n/a';",
+                'ALTER TABLE "dadv_testbackfill" ADD CONSTRAINT '
+                '"DADV_TestBackfill_note_NOT_NULL" CHECK ("note" IS NOT NULL) '
+                "NOT VALID;",
+                'ALTER TABLE "dadv_testbackfill" VALIDATE CONSTRAINT '
+                '"DADV_TestBackfill_note_NOT_NULL";',
+                'ALTER TABLE "dadv_testbackfill" ALTER COLUMN "note" SET NOT NULL;',
+                'ALTER TABLE "dadv_testbackfill" DROP CONSTRAINT '
+                '"DADV_TestBackfill_note_NOT_NULL";',
+            ],
+        )
+
+    def test_old_postgresql_scans_anyway(self):
+        executed = self.forwards(SimulatedConnection("postgresql", (11, 9, 0)))
+        self.assertEqual(
+            executed[1:],
+            ['ALTER TABLE "dadv_testbackfill" ALTER COLUMN "note" SET NOT NULL;'],
+        )
+
+    def test_cockroachdb_runs_one_job(self):
+        executed = self.forwards(SimulatedConnection("cockroachdb"))
+        self.assertEqual(
+            executed[1:],
+            ['ALTER TABLE "dadv_testbackfill" ALTER COLUMN "note" SET NOT NULL;'],
+        )
+
+    def test_mysql_rebuilds_in_place(self):
+        executed = self.forwards(SimulatedConnection("mysql", (8, 0, 34)))
+        self.assertEqual(
+            executed[1:],
+            [
+                "ALTER TABLE `dadv_testbackfill` MODIFY `note` varchar(15) NOT NULL "
+                "DEFAULT 'n/a', ALGORITHM=INPLACE, LOCK=NONE;"
+            ],
+        )
+
+    @override_settings(DADV_MSSQL_ONLINE=True)
+    def test_mssql_online(self):
+        executed = self.forwards(SimulatedConnection("microsoft"))
+        self.assertEqual(
+            executed[1:],
+            [
+                "ALTER TABLE [dadv_testbackfill] ALTER COLUMN [note] nvarchar(15) "
+                "NOT NULL WITH (ONLINE = ON);"
+            ],
+        )
+
+    def test_backwards(self):
+        self.assertEqual(
+            self.backwards(SimulatedConnection("postgresql", (16, 2, 0))),
+            [
+                'ALTER TABLE "dadv_testbackfill" ALTER COLUMN "note" DROP NOT NULL;',
+                'ALTER TABLE "dadv_testbackfill" ALTER COLUMN "note" DROP DEFAULT;',
+            ],
+        )
+
+    def test_column_already_not_null(self):
+        operation = AddDefaultAndSetNotNull("TestHappyPath", "name", "x")
+        to_state = self.from_state.clone()
+        operation.state_forwards("dadv", to_state)
+        schema_editor = SimulatedSchemaEditor(SimulatedConnection("postgresql"))
+        operation.database_forwards("dadv", schema_editor, self.from_state, to_state)
+        self.assertEqual(len(schema_editor.executed), 1)
+
+    def test_warns_in_a_transaction(self):
+        connection = SimulatedConnection("postgresql")
+        connection.in_atomic_block = True
+        with self.assertWarnsRegex(UserWarning, "Set atomic = False"):
+            self.forwards(connection)
+
+    def test_estimate(self):
+        model = self.to_state.apps.get_model("dadv", "TestBackfill")
+        estimate = self.operation.estimate(PostgreSQLDialect((16, 2, 0)), model)
+        self.assertEqual(estimate.lock, "SHARE UPDATE EXCLUSIVE")
+
+    def test_not_merged_into_other_defaults(self):
+        operations = [
+            AddDefaultValue("TestBackfill", "note", "x"),
+            self.operation,
+            AddDefaultValue("TestBackfill", "touched", NOW),
+        ]
+        optimized = MigrationOptimizer().optimize(operations, "dadv")
+        self.assertIn(self.operation, optimized)
+
+
+@modify_settings(INSTALLED_APPS={"append": "dadv.apps.DadvConfig"})
+class DefaultDriftTests(SimpleTestCase):
+    def setUp(self):
+        reset_dialects()
+        self.state = ProjectState.from_apps(apps)
+        AddDefaultValue("TestBackfill", "note", "n/a").state_forwards(
+            "dadv", self.state
+        )
+
+    def tearDown(self):
+        reset_dialects()
+
+    def drifted(self, rows):
+        return drifted_defaults(
+            declared_defaults(self.state, "default"),
+            CatalogSnapshot(PostgreSQLDialect(), rows),
+        )
+
+    def test_declared_defaults(self):
+        ((model, field, value),) = declared_defaults(self.state, "default")
+        self.assertEqual(
+            (model._meta.db_table, field.column, value),
+            ("dadv_testbackfill", "note", "n/a"),
+        )
+
+    def test_matching_default(self):
+        self.assertEqual(
+            self.drifted([("dadv_testbackfill", "note", "'n/a'::character varying")]),
+            [],
+        )
+
+    def test_drifted_default(self):
+        drifted = self.drifted([("dadv_testbackfill", "note", None)])
+        (warning,) = drift_warnings(drifted, "default")
+        self.assertEqual(warning.id, DRIFT)
+        self.assertEqual(
+            warning.msg,
+            "dadv_testbackfill.note has the default NULL in the database 'default', "
+            "but the migrations declare 'n/a'.",
+        )
+
+    def test_missing_column(self):
+        self.assertEqual(self.drifted([]), [])
+
+    def test_fingerprint(self):
+        connection = SimulatedConnection("postgresql", rows=[("abc", 3, 7)])
+        self.assertEqual(fingerprint(connection, get_dialect(connection)), "abc|3|7")
+        (query,) = connection.queries
+        self.assertIn("pg_attrdef", query)
+        self.assertIn('MAX(id) FROM "django_migrations"', query)
+
+    def test_fingerprint_before_migrating(self):
+        """The missing table fails the single query"""
+        connection = MissingMigrationsConnection("postgresql", tables=[])
+        self.assertIsNone(fingerprint(connection, get_dialect(connection)))
+        self.assertEqual(len(connection.queries), 1)
+
+    @mock.patch("django_add_default_value.checks.transaction.atomic")
+    def test_fingerprint_in_a_transaction(self, atomic):
+        """A savepoint keeps the failed query from aborting the transaction"""
+        connection = MissingMigrationsConnection("postgresql", tables=[])
+        connection.in_atomic_block = True
+        self.assertIsNone(fingerprint(connection, get_dialect(connection)))
+        atomic.assert_called_once_with(using="default")
+
+    def test_cache_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "drift.json")
+            FingerprintCache(path).save("default", "abc|3|7")
+            self.assertTrue(FingerprintCache(path).matches("default", "abc|3|7"))
+            self.assertFalse(FingerprintCache(path).matches("default", "abc|4|8"))
+            self.assertFalse(FingerprintCache(path).matches("other", "abc|3|7"))
+
+    @mock.patch("django_add_default_value.checks.MigrationLoader")
+    @mock.patch("django_add_default_value.checks.fingerprint", return_value="abc")
+    def test_unchanged_fingerprint(self, fingerprint, loader):
+        cache = FingerprintCache(None)
+        cache.save("default", "abc")
+        self.assertEqual(check_database("default", cache), [])
+        loader.assert_not_called()
+
+    @mock.patch("django_add_default_value.checks.CatalogSnapshot.load")
+    @mock.patch("django_add_default_value.checks.applied_state")
+    @mock.patch("django_add_default_value.checks.MigrationLoader")
+    @mock.patch("django_add_default_value.checks.fingerprint", return_value="abc")
+    def test_changed_fingerprint(self, fingerprint, loader, applied_state, load):
+        applied_state.return_value = self.state
+        cache = FingerprintCache(None)
+        load.return_value = CatalogSnapshot(PostgreSQLDialect(), [])
+        self.assertEqual(check_database("default", cache), [])
+        self.assertTrue(cache.matches("default", "abc"))
+
+        load.return_value = CatalogSnapshot(
+            PostgreSQLDialect(), [("dadv_testbackfill", "note", "'x'")]
+        )
+        cache = FingerprintCache(None)
+        self.assertEqual(len(check_database("default", cache)), 1)
+        self.assertFalse(cache.matches("default", "abc"))
+
+    def test_only_with_databases(self):
+        self.assertEqual(check_default_drift(), [])
+
+
+@unittest.skipUnless(connection.vendor == "sqlite", "Needs the SQLite test database")
+@modify_settings(INSTALLED_APPS={"append": "dadv.apps.DadvConfig"})
+@override_settings(DADV_SKIP_UNCHANGED_DEFAULTS=True)
+class SnapshotInvalidationTests(TransactionTestCase):
+    def setUp(self):
+        clear_snapshots()
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        self.state = loader.project_state(
+            ("dadv", loader.graph.leaf_nodes("dadv")[0][1])
+        )
+        self.model = self.state.apps.get_model("dadv", "TestHappyPath")
+        with connection.schema_editor() as editor:
+            editor.create_model(self.model)
+
+    def tearDown(self):
+        clear_snapshots()
+        with connection.schema_editor() as editor:
+            editor.delete_model(self.model)
+
+    def apply(self, editor, operation):
+        new_state = self.state.clone()
+        operation.state_forwards("dadv", new_state)
+        operation.database_forwards("dadv", editor, self.state, new_state)
+        self.state = new_state
+
+    def test_altered_field_gets_its_default_again(self):
+        """Make sure a default dropped by other DDL isn't skipped as unchanged"""
+        operation = AddDefaultValue("TestHappyPath", "name", "Happy path")
+        with connection.schema_editor() as editor:
+            self.apply(editor, operation)
+            # Django rebuilds the table on SQLite, and drops the default
+            self.apply(
+                editor,
+                migrations.AlterField(
+                    "TestHappyPath",
+                    "name",
+                    models.CharField(default="Happy path", max_length=20),
+                ),
+            )
+            self.apply(editor, operation)
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA table_info("dadv_testhappypath")')
+            defaults = {row[1]: row[4] for row in cursor.fetchall()}
+        self.assertEqual(defaults["name"], "'Happy path'")